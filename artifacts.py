@@ -0,0 +1,97 @@
+import os
+import threading
+import time
+import uuid
+
+ARTIFACT_DIR = os.getenv("ARTIFACT_DIR", "artifacts")
+ARTIFACT_MAX_AGE_SECONDS = float(os.getenv("ARTIFACT_MAX_AGE_SECONDS", str(24 * 3600)))
+ARTIFACT_MAX_BYTES = int(os.getenv("ARTIFACT_MAX_BYTES", str(500 * 1024 * 1024)))
+# Garbage-collect after this many new artifacts
+ARTIFACT_GC_INTERVAL = int(os.getenv("ARTIFACT_GC_INTERVAL", "50"))
+
+
+class ArtifactManager:
+    """
+    Hands out a unique file path for every chart or report so concurrent requests, in threads or
+    in separate processes, never write to the same file. Files are written to a temporary name
+    and renamed into place, so readers never see partial output. Artifacts older than max_age
+    seconds are removed, and the oldest ones too while the directory holds more than max_bytes.
+    """
+    def __init__(self, directory: str = ARTIFACT_DIR, max_age: float = ARTIFACT_MAX_AGE_SECONDS,
+                 max_bytes: int = ARTIFACT_MAX_BYTES, gc_interval: int = ARTIFACT_GC_INTERVAL):
+        self.directory = directory
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        self.gc_interval = gc_interval
+        self._lock = threading.Lock()
+        self._created = 0
+
+    def new_path(self, prefix: str, suffix: str) -> str:
+        os.makedirs(self.directory, exist_ok=True)
+        with self._lock:
+            self._created += 1
+            collect = self.gc_interval and self._created % self.gc_interval == 0
+        if collect:
+            self.collect_garbage()
+        name = f"{prefix}-{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:12]}{suffix}"
+        return os.path.join(self.directory, name)
+
+    def write(self, prefix: str, suffix: str, data: bytes) -> str:
+        """
+        Stores data as a new artifact and returns its path.
+        """
+        path = self.new_path(prefix, suffix)
+        write_atomically(path, data)
+        return path
+
+    def collect_garbage(self, now: float = None) -> int:
+        """
+        Deletes expired artifacts, then the oldest ones until the size quota is met.
+        Returns the number of files removed.
+        """
+        now = time.time() if now is None else now
+        entries = []
+        for entry in os.scandir(self.directory):
+            try:
+                if entry.is_file():
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+            except OSError:
+                continue
+
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for modified, size, path in entries:
+            if now - modified <= self.max_age and total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                removed += 1
+            except OSError:
+                pass
+            total -= size
+        return removed
+
+
+def write_atomically(path: str, data: bytes):
+    """
+    Writes data to a temporary file next to path and renames it into place.
+    """
+    temporary_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temporary_path, "wb") as file:
+        file.write(data)
+    os.replace(temporary_path, path)
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_artifact_manager() -> ArtifactManager:
+    global _manager
+    if _manager is None:
+        with _manager_lock:
+            if _manager is None:
+                _manager = ArtifactManager()
+    return _manager
@@ -0,0 +1,915 @@
+import argparse
+import asyncio
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+import artifacts
+import charts
+import report_pdf
+import tools
+from data import ReviewDatabase, get_database
+from local_classifier import LocalSentimentClassifier
+import classify
+from fake_llm import (
+    FakeGroqClient, FakeStreamingChatModel, fake_groq, fake_groq_backend, fake_response_model, sentiment_responder,
+)
+
+BENCHMARK_OUTPUT = os.getenv("BENCHMARK_OUTPUT", "benchmark_results.json")
+# Relative slowdown against a baseline results file that counts as a regression
+BENCHMARK_TOLERANCE = float(os.getenv("BENCHMARK_TOLERANCE", "0.2"))
+# Cold-start budget of `import main` in a fresh interpreter: wall time and resident memory
+STARTUP_IMPORT_BUDGET_MS = float(os.getenv("STARTUP_IMPORT_BUDGET_MS", "1500"))
+STARTUP_RSS_BUDGET_MB = float(os.getenv("STARTUP_RSS_BUDGET_MB", "160"))
+# Modules that only the routes needing them may import
+DEFERRED_MODULES = ["langchain_groq", "langchain.agents", "groq", "reportlab", "matplotlib"]
+# Measurements of the scenarios run so far, written to BENCHMARK_OUTPUT at the end
+RESULTS = []
+# Budgets the scenarios run so far exceeded
+BUDGET_FAILURES = []
+
+SYNTHETIC_WORDS = [
+    "food", "service", "waiter", "pasta", "pizza", "view", "price", "cold", "rude",
+    "delicious", "friendly", "slow", "excellent", "terrible", "cozy", "noisy", "fresh",
+]
+
+
+def record_result(scenario: str, **metrics):
+    """
+    Keeps a scenario's measurements for the results file. Metric names end in their unit:
+    _ms, _us and _mb are better lower, _per_s better higher; other metrics are counts.
+    """
+    RESULTS.append({"scenario": scenario, "metrics": {name: round(float(value), 4) for name, value in metrics.items()}})
+
+
+def make_synthetic_reviews(rows: int, seed: int = 42, outlets: int = 0) -> pd.DataFrame:
+    """
+    Builds a cleaned review DataFrame of the given size with random months and sentiments and,
+    with outlets, spread over that many restaurants in ten countries.
+    """
+    rng = np.random.default_rng(seed)
+    months = pd.date_range('2010-01-01', '2024-12-01', freq='MS').to_numpy()
+    words = np.array(SYNTHETIC_WORDS)
+    reviews = [" ".join(words[rng.integers(0, len(words), 8)]) for _ in range(min(rows, 10000))]
+    dataset = pd.DataFrame({
+        'Sentiment': rng.choice(['Positive', 'Negative', 'Neutral'], size=rows, p=[0.7, 0.2, 0.1]),
+        'Review Date': months[rng.integers(0, len(months), rows)],
+        'Review': np.resize(np.array(reviews, dtype=object), rows),
+    })
+    if outlets:
+        outlet = rng.integers(0, outlets, rows)
+        dataset.insert(0, 'Restaurant Name', pd.Categorical.from_codes(outlet, [f"Restaurant {i}" for i in range(outlets)]))
+        dataset.insert(0, 'Country', pd.Categorical.from_codes(outlet % 10, [f"Country {i}" for i in range(10)]))
+    return dataset
+
+
+def legacy_get_reviews(dataset: pd.DataFrame, start_date, end_date):
+    return dataset[(dataset['Review Date'] >= start_date) & (dataset['Review Date'] <= end_date)]
+
+
+def legacy_get_sentiment_counts_by_date(dataset: pd.DataFrame, start_date, end_date):
+    reviews_in_range = legacy_get_reviews(dataset, start_date, end_date)
+    return reviews_in_range.groupby(reviews_in_range['Review Date'].dt.date)['Sentiment'].value_counts().unstack(fill_value=0)
+
+
+def legacy_get_reviews_by_sentiment(dataset: pd.DataFrame, sentiment: str, start_date, end_date):
+    reviews_in_range = legacy_get_reviews(dataset, start_date, end_date)
+    return reviews_in_range[reviews_in_range['Sentiment'].str.lower() == sentiment.lower()]
+
+
+def time_calls(func, ranges, repeat: int = 3) -> float:
+    """
+    Returns the best average latency in milliseconds of calling func over every date range.
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for start_date, end_date in ranges:
+            func(start_date, end_date)
+        best = min(best, (time.perf_counter() - start) / len(ranges))
+    return best * 1000
+
+
+def make_query_ranges(queries: int, seed: int = 7):
+    rng = np.random.default_rng(seed)
+    ranges = []
+    for _ in range(queries):
+        start = pd.Timestamp(2010 + int(rng.integers(0, 14)), int(rng.integers(1, 13)), 1)
+        ranges.append((start, start + pd.DateOffset(months=int(rng.integers(1, 13)))))
+    return ranges
+
+
+def run_range_query_benchmark(rows: int = 1_000_000, queries: int = 20):
+    print(f"Building synthetic dataset with {rows} rows...")
+    dataset = make_synthetic_reviews(rows)
+    database = ReviewDatabase.from_dataframe(dataset)
+    ranges = make_query_ranges(queries)
+
+    for name, legacy, indexed in [
+        ("get_reviews",
+         lambda s, e: legacy_get_reviews(dataset, s, e),
+         database.get_reviews),
+        ("get_reviews_by_sentiment",
+         lambda s, e: legacy_get_reviews_by_sentiment(dataset, 'negative', s, e),
+         lambda s, e: database.get_reviews_by_sentiment('negative', s, e)),
+    ]:
+        legacy_ms = time_calls(legacy, ranges)
+        indexed_ms = time_calls(indexed, ranges)
+        print(f"{name}: mask scan {legacy_ms:.2f} ms, sorted index {indexed_ms:.3f} ms "
+              f"({legacy_ms / indexed_ms:.0f}x faster)")
+        record_result(f"range_query.{name}", rows=rows, mask_scan_ms=legacy_ms, indexed_ms=indexed_ms)
+
+
+def run_sentiment_cube_benchmark(rows: int = 1_000_000, queries: int = 20):
+    print(f"Building synthetic dataset with {rows} rows...")
+    dataset = make_synthetic_reviews(rows)
+    database = ReviewDatabase.from_dataframe(dataset)
+    ranges = make_query_ranges(queries)
+
+    legacy_ms = time_calls(lambda s, e: legacy_get_sentiment_counts_by_date(dataset, s, e), ranges)
+    cube_ms = time_calls(database.get_sentiment_counts_by_date, ranges)
+    print(f"sentiment counts by date: groupby {legacy_ms:.2f} ms, cube {cube_ms:.3f} ms "
+          f"({legacy_ms / cube_ms:.0f}x faster)")
+    record_result("sentiment_cube", rows=rows, groupby_ms=legacy_ms, cube_ms=cube_ms)
+
+
+def make_raw_reviews(rows: int, seed: int = 7) -> pd.DataFrame:
+    """
+    Builds rows as they appear in the reviews CSV, dated within the last year of the synthetic data.
+    """
+    rng = np.random.default_rng(seed)
+    months = pd.date_range('2024-01-01', '2024-12-01', freq='MS').strftime('%b %Y •').str.replace('Sep', 'Sept')
+    words = np.array(SYNTHETIC_WORDS)
+    return pd.DataFrame({
+        'Country': 'France',
+        'Restaurant Name': 'Restaurant 0',
+        'Sentiment': rng.choice(['Positive', 'Negative', 'Neutral'], size=rows, p=[0.7, 0.2, 0.1]),
+        'Review Title': 'Title',
+        'Review Date': np.asarray(months)[rng.integers(0, len(months), rows)],
+        'Review': [" ".join(words[rng.integers(0, len(words), 12)]) for _ in range(rows)],
+    })
+
+
+def run_append_benchmark(rows: int = 1_000_000, batch: int = 1000, rounds: int = 5):
+    print(f"Appending {rounds} batches of {batch} reviews to a {rows}-row database...")
+    dataset = make_synthetic_reviews(rows)
+    database = ReviewDatabase.from_dataframe(dataset)
+    batches = [make_raw_reviews(batch, seed) for seed in range(rounds)]
+
+    start = time.perf_counter()
+    for raw in batches:
+        database.append_reviews(raw)
+    append_ms = (time.perf_counter() - start) * 1000 / rounds
+
+    start = time.perf_counter()
+    ReviewDatabase.from_dataframe(database.get_data())
+    rebuild_ms = (time.perf_counter() - start) * 1000
+    print(f"append_reviews: {append_ms:.1f} ms per batch, rebuilding the indexes instead: {rebuild_ms:.1f} ms "
+          f"(before reading the CSV again)")
+    record_result("append", rows=rows, batch=batch, append_ms=append_ms, rebuild_ms=rebuild_ms)
+
+
+def run_theme_concurrency_benchmark(rows: int = 2000, latency: float = 0.05, max_workers: int = 8):
+    dataset = make_synthetic_reviews(rows)
+    reviews = {
+        sentiment: dataset.loc[dataset['Sentiment'] == sentiment, 'Review'].tolist()
+        for sentiment in ['Positive', 'Negative']
+    }
+    timings = {}
+    for name, workers in [("sequential", 1), (f"{max_workers} workers", max_workers)]:
+        with fake_groq(FakeGroqClient(latency=latency)) as client:
+            start = time.perf_counter()
+            tools.get_top_themes_by_sentiment(reviews, max_workers=workers)
+            timings[name] = time.perf_counter() - start
+        print(f"Theme summarization ({name}): {timings[name]:.2f} s for {client.calls} LLM calls")
+    sequential, concurrent = timings.values()
+    print(f"Speedup: {sequential / concurrent:.1f}x")
+    record_result("theme_concurrency", reviews=rows, sequential_ms=sequential * 1000, concurrent_ms=concurrent * 1000)
+
+
+def run_theme_batching_benchmark(sample_tokens: int = 20000):
+    """
+    Theme summary calls needed for the whole review dataset by month and sentiment, with the old
+    1000-word batches, with token-packed batches, and with partitions sampled to sample_tokens,
+    as the dataset is repeated to simulate larger volumes.
+    """
+    from token_budget import select_reviews
+
+    def legacy_batch_count(reviews_list):
+        batches, words = 0, None
+        for review in reviews_list:
+            review_words = len(review.split())
+            if words is None or words + review_words > 1000:
+                batches, words = batches + 1, review_words
+            else:
+                words += review_words
+        return batches
+
+    dataset = get_database().get_data()
+    partitions = [group['Review'].tolist() for _, group in dataset.groupby([dataset['Review Date'].dt.to_period('M'), 'Sentiment'], observed=True)]
+    for copies in [1, 4, 16]:
+        # Vary each copy slightly so near-duplicate removal does not collapse them
+        scaled = [[f"{review} ({copy})" for copy in range(copies) for review in reviews] for reviews in partitions]
+        legacy = sum(legacy_batch_count(reviews) for reviews in scaled)
+        packed = sum(len(tools.batch_reviews(reviews)) for reviews in scaled)
+        sampled = sum(len(tools.batch_reviews(select_reviews(reviews, sample_tokens))) for reviews in scaled)
+        print(f"{copies}x reviews: {legacy} calls with word batches, {packed} packed to "
+              f"{tools.get_theme_batch_limit()} tokens, {sampled} sampled to {sample_tokens} tokens per partition")
+        record_result(f"theme_batching.{copies}x", word_batch_calls=legacy, packed_calls=packed, sampled_calls=sampled)
+
+
+def run_tracing_overhead_benchmark(rows: int = 100_000, calls: int = 20000):
+    """
+    Cost of the tracing decorator on a hot query: the undecorated method, tracing disabled, tracing enabled.
+    """
+    import tracing
+
+    database = ReviewDatabase.from_dataframe(make_synthetic_reviews(rows))
+    start_date, end_date = pd.Timestamp('2015-01-01'), pd.Timestamp('2015-03-31')
+    undecorated = ReviewDatabase.get_reviews.__wrapped__
+
+    def measure(func):
+        start = time.perf_counter()
+        for _ in range(calls):
+            func(database, start_date, end_date)
+        return (time.perf_counter() - start) * 1e6 / calls
+
+    original_file, original_print = tracing.TRACE_FILE, tracing.TRACE_PRINT
+    tracing.TRACE_FILE, tracing.TRACE_PRINT = "", False
+    try:
+        raw_us = measure(undecorated)
+        disabled_us = measure(ReviewDatabase.get_reviews)
+        tracing.enable_tracing()
+        enabled_us = measure(ReviewDatabase.get_reviews)
+    finally:
+        tracing.enable_tracing(False)
+        tracing.TRACE_FILE, tracing.TRACE_PRINT = original_file, original_print
+    print(f"get_reviews: {raw_us:.2f} us undecorated, {disabled_us:.2f} us with tracing off "
+          f"(+{disabled_us - raw_us:.2f} us), {enabled_us:.2f} us with tracing on")
+    record_result("tracing_overhead", undecorated_us=raw_us, disabled_us=disabled_us, enabled_us=enabled_us)
+
+
+def run_bulk_classification_benchmark(rows: int = 500, latency: float = 0.05, max_workers: int = 4):
+    reviews = make_synthetic_reviews(rows)['Review'].tolist()
+    with fake_groq(FakeGroqClient(latency=latency, responder=sentiment_responder)) as client:
+        start = time.perf_counter()
+        for review in reviews:
+            tools.analyze_sentiment(review)
+        single = time.perf_counter() - start
+        print(f"One review per call: {rows / single:.1f} reviews/s ({client.calls} LLM calls)")
+    with fake_groq(FakeGroqClient(latency=latency, responder=sentiment_responder)) as client:
+        start = time.perf_counter()
+        classify.classify_review_texts(reviews, max_workers=max_workers)
+        bulk = time.perf_counter() - start
+        print(f"Bulk pipeline: {rows / bulk:.1f} reviews/s ({client.calls} LLM calls)")
+    record_result("bulk_classification", single_reviews_per_s=rows / single, bulk_reviews_per_s=rows / bulk,
+                  bulk_llm_calls=client.calls)
+
+
+def run_local_classifier_evaluation(thresholds=(0.8, 0.9, 0.95, 0.99), test_fraction: float = 0.2, seed: int = 0):
+    dataset = get_database().get_data()
+    order = np.random.default_rng(seed).permutation(len(dataset))
+    split = int(len(dataset) * (1 - test_fraction))
+    train, test = dataset.iloc[order[:split]], dataset.iloc[order[split:]]
+
+    start = time.perf_counter()
+    classifier = LocalSentimentClassifier().fit(train['Review'].tolist(), train['Sentiment'].tolist())
+    print(f"Trained on {len(train)} reviews in {(time.perf_counter() - start) * 1000:.0f} ms")
+
+    start = time.perf_counter()
+    labels, confidences = classifier.predict_many(test['Review'].tolist())
+    elapsed = time.perf_counter() - start
+    labels = np.array(labels, dtype=object)
+    truth = test['Sentiment'].to_numpy()
+    print(f"Held-out agreement with dataset labels: {(labels == truth).mean():.1%} on {len(test)} reviews, "
+          f"{len(test) / elapsed:.0f} reviews/s ({elapsed / len(test) * 1e6:.0f} us/review)")
+    record_result("local_classifier", agreement=(labels == truth).mean(), reviews_per_s=len(test) / elapsed)
+
+    for threshold in thresholds:
+        local = confidences >= threshold
+        agreement = f"{(labels[local] == truth[local]).mean():.1%}" if local.any() else "n/a"
+        print(f"threshold {threshold:.2f}: escalation rate {1 - local.mean():.1%}, "
+              f"agreement on locally answered reviews {agreement}")
+
+
+def legacy_plot_charts(sentiment_counts: pd.DataFrame) -> dict:
+    """
+    The four charts as tools.py drew them through pyplot before the Agg renderer.
+    """
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    totals = charts.get_total_counts(sentiment_counts)
+    pngs = {}
+    for chart_type in charts.CHART_TYPES:
+        if chart_type == "stacked_bar":
+            sentiment_counts.plot(kind='bar', stacked=True, figsize=(12, 6))
+        elif chart_type == "line":
+            sentiment_counts.plot(kind='line', figsize=(12, 6), marker='o')
+            plt.grid(True)
+        elif chart_type == "pie":
+            plt.figure(figsize=(8, 8))
+            plt.pie(totals, labels=totals.index, autopct='%1.1f%%', startangle=90, colors=['green', 'red', 'gray'])
+            plt.axis('equal')
+        else:
+            plt.figure(figsize=(10, 6))
+            totals.plot(kind='bar', color=['green', 'red', 'gray'])
+        plt.tight_layout()
+        buffer = io.BytesIO()
+        plt.savefig(buffer, format='png')
+        plt.close()
+        pngs[chart_type] = buffer.getvalue()
+    return pngs
+
+
+def time_import(module: str, preloaded: str = "pandas") -> float:
+    """
+    Seconds a fresh interpreter that has already imported preloaded spends importing module.
+    """
+    code = f"import time, {preloaded}; start = time.perf_counter(); import {module}; print(time.perf_counter() - start)"
+    return float(subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout)
+
+
+def run_chart_rendering_benchmark(rows: int = 100_000, queries: int = 10):
+    database = ReviewDatabase.from_dataframe(make_synthetic_reviews(rows))
+    database.signature = "benchmark"
+    ranges = make_query_ranges(queries)
+    charts_per_range = len(charts.CHART_TYPES)
+
+    legacy = time_calls(lambda start, end: legacy_plot_charts(database.get_sentiment_counts_by_date(start, end)), ranges, repeat=1)
+    rendered = time_calls(lambda start, end: charts.render_charts(database.get_sentiment_counts_by_date(start, end), charts.CHART_TYPES), ranges, repeat=1)
+
+    original_cache = charts._cache
+    with tempfile.TemporaryDirectory() as directory:
+        charts._cache = charts.ChartCache(directory)
+        try:
+            for start, end in ranges:
+                charts.get_sentiment_charts(database, charts.CHART_TYPES, start, end)
+            cached = time_calls(lambda start, end: charts.get_sentiment_charts(database, charts.CHART_TYPES, start, end), ranges)
+        finally:
+            charts._cache = original_cache
+
+    for name, milliseconds in [("pyplot", legacy), ("Agg renderer", rendered), ("Agg renderer, cached", cached)]:
+        print(f"{name}: {charts_per_range * 1000 / milliseconds:.1f} charts/s")
+    for chart_type in charts.CHART_TYPES:
+        milliseconds = time_calls(lambda start, end: charts.render_charts(database.get_sentiment_counts_by_date(start, end), [chart_type]), ranges, repeat=1)
+        print(f"{chart_type} chart: {milliseconds:.1f} ms")
+        record_result(f"chart.{chart_type}", render_ms=milliseconds)
+    pyplot_import_ms = time_import('matplotlib.pyplot') * 1000
+    charts_import_ms = time_import('charts') * 1000
+    print(f"Import time after pandas: matplotlib.pyplot {pyplot_import_ms:.0f} ms, charts {charts_import_ms:.0f} ms")
+    record_result("chart_rendering", pyplot_charts_per_s=charts_per_range * 1000 / legacy,
+                  agg_charts_per_s=charts_per_range * 1000 / rendered, cached_charts_per_s=charts_per_range * 1000 / cached,
+                  charts_import_ms=charts_import_ms)
+
+
+def make_report(lines: int) -> str:
+    return "\n".join(["Executive Summary:"] + [f"{i}. Finding number {i}: " + "detail " * 25 for i in range(1, lines)])
+
+
+def measure_peak_memory(func) -> float:
+    """
+    Peak Python heap growth in MB while func runs.
+    """
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1] / 2**20
+    finally:
+        tracemalloc.stop()
+
+
+def legacy_render_report_pdf(report_text: str) -> bytes:
+    """
+    Builds the whole story list up front, as save_report_as_pdf did before streaming.
+    """
+    from reportlab.lib.enums import TA_CENTER
+    from reportlab.lib.pagesizes import letter
+    from reportlab.lib.styles import getSampleStyleSheet
+    from reportlab.platypus import SimpleDocTemplate
+
+    buffer = io.BytesIO()
+    styles = getSampleStyleSheet()
+    styles['Heading1'].alignment = TA_CENTER
+    styles['Heading1'].spaceAfter = 12
+    styles['Normal'].spaceAfter = 6
+    story = list(report_pdf.iter_report_flowables(report_text.split('\n'), styles))
+    SimpleDocTemplate(buffer, pagesize=letter).build(story)
+    return buffer.getvalue()
+
+
+def run_pdf_export_benchmark(report_lines: int = 60, long_report_lines: int = 5000):
+    report = make_report(report_lines)
+    original_manager = artifacts._manager
+    with tempfile.TemporaryDirectory() as directory:
+        artifacts._manager = artifacts.ArtifactManager(directory, gc_interval=0)
+        exporter = report_pdf.PdfExporter()
+        try:
+            start = time.perf_counter()
+            report_pdf.save_report_as_pdf(report)
+            synchronous = time.perf_counter() - start
+
+            start = time.perf_counter()
+            job = exporter.submit(report)
+            submitted = time.perf_counter() - start
+            exporter.submit(report)
+            job.result()
+        finally:
+            exporter.shutdown()
+            artifacts._manager = original_manager
+
+    print(f"Report critical path: synchronous PDF {synchronous * 1000:.1f} ms, background submit {submitted * 1000:.2f} ms")
+    long_report = make_report(long_report_lines)
+    eager = measure_peak_memory(lambda: legacy_render_report_pdf(long_report))
+    streamed = measure_peak_memory(lambda: report_pdf.render_report_pdf(long_report))
+    print(f"{long_report_lines}-line report peak memory: whole story {eager:.1f} MB, streamed story {streamed:.1f} MB")
+    record_result("pdf_export", synchronous_ms=synchronous * 1000, submit_ms=submitted * 1000,
+                  whole_story_peak_mb=eager, streamed_story_peak_mb=streamed)
+
+
+def write_synthetic_csv(path: str, size_mb: int, chunk_rows: int = 50_000, duplicate_fraction: float = 0.02,
+                        seed: int = 42, max_rows: int = None) -> int:
+    """
+    Writes a raw reviews CSV of about size_mb megabytes, or of max_rows rows, with some rows
+    repeated, and returns its row count.
+    """
+    rng = np.random.default_rng(seed)
+    months = np.array([f"{month} {year} •" for year in range(2010, 2025)
+                       for month in ["Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sept", "Oct", "Nov", "Dec"]])
+    words = np.array(SYNTHETIC_WORDS)
+    rows = 0
+    header = True
+    previous = None
+    while (rows < max_rows) if max_rows else (not os.path.exists(path) or os.path.getsize(path) < size_mb * 2**20):
+        chunk = pd.DataFrame({
+            'Country': rng.choice(["France", "Italy", "Spain"], size=chunk_rows),
+            'Restaurant Name': rng.choice([f"Restaurant {i}" for i in range(50)], size=chunk_rows),
+            'Sentiment': rng.choice(['Positive', 'Negative'], size=chunk_rows, p=[0.8, 0.2]),
+            'Review Title': rng.choice(["Great", "Awful", "Fine"], size=chunk_rows),
+            'Review Date': months[rng.integers(0, len(months), chunk_rows)],
+            'Review': [" ".join(words[rng.integers(0, len(words), 80)]) for _ in range(chunk_rows)],
+        })
+        if previous is not None:
+            repeated = previous.sample(frac=duplicate_fraction, random_state=seed)
+            chunk = pd.concat([chunk.iloc[len(repeated):], repeated])
+        if max_rows:
+            chunk = chunk.iloc[:max_rows - rows]
+        chunk.to_csv(path, mode='a', header=header, index=False)
+        header = False
+        previous = chunk
+        rows += len(chunk)
+    return rows
+
+
+PEAK_MEMORY_SCRIPT = """
+import resource, sys
+import data
+mode, csv_path, store_path = sys.argv[1:4]
+if mode == "full":
+    dataset = data.load_reviews_csv(csv_path)
+else:
+    data.ingest_reviews_csv(csv_path, store_path)
+    dataset = data.load_review_store(store_path)
+database = data.ReviewDatabase.from_dataframe(dataset)
+print(len(database.get_data()), resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024)
+"""
+
+
+def run_chunked_ingestion_benchmark(size_mb: int = 2048):
+    """
+    Peak resident memory of loading a generated size_mb CSV whole versus ingesting it in chunks,
+    each in a fresh interpreter. Memory-mapped review text that has been read counts towards the
+    resident size but is page cache the OS can reclaim.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        csv_path = os.path.join(directory, "reviews.csv")
+        start = time.perf_counter()
+        rows = write_synthetic_csv(csv_path, size_mb)
+        print(f"Generated {rows} rows ({os.path.getsize(csv_path) / 2**20:.0f} MB) in {time.perf_counter() - start:.0f}s")
+
+        for mode in ["full", "chunked"]:
+            start = time.perf_counter()
+            result = subprocess.run(
+                [sys.executable, "-c", PEAK_MEMORY_SCRIPT, mode, csv_path, os.path.join(directory, "reviews.store")],
+                capture_output=True, text=True,
+            )
+            if result.returncode != 0:
+                print(f"{mode} load failed (exit code {result.returncode}), likely out of memory")
+                continue
+            loaded, peak_mb = result.stdout.split()[-2:]
+            seconds = time.perf_counter() - start
+            print(f"{mode} load: {loaded} reviews, peak RSS {float(peak_mb):.0f} MB, {seconds:.1f}s")
+            record_result(f"chunked_ingestion.{mode}", size_mb=size_mb, peak_rss_mb=float(peak_mb), load_ms=seconds * 1000)
+
+
+LOAD_TEST_PROMPTS = [
+    "Generate a strategic recommendations report for the period from 2019-01-01 to 2019-06-30.",
+    "Create a report for the last half of 2018.",
+    "Generate a report for Q3 2019.",
+    "What is the sentiment distribution for the third quarter of 2018?",
+    "Show me the sentiment trend for the year 2019.",
+]
+
+
+async def drive_service(service, prompts: list[str], connections: int) -> list[float]:
+    """
+    Sends the prompts over several JSON-lines connections to a local server and returns
+    the client-side latency of each reply.
+    """
+    from serve import ServiceOverloaded
+
+    server = await asyncio.start_server(service.handle_connection, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    latencies = []
+    errors = []
+
+    async def client(client_prompts):
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        sent = {}
+        for i, prompt in enumerate(client_prompts):
+            sent[i] = time.perf_counter()
+            writer.write((json.dumps({"id": i, "input": prompt}) + "\n").encode("utf-8"))
+        await writer.drain()
+        for _ in client_prompts:
+            reply = json.loads(await reader.readline())
+            latencies.append(time.perf_counter() - sent[reply["id"]])
+            if "error" in reply:
+                errors.append(reply["error"])
+        writer.close()
+
+    async with server:
+        await asyncio.gather(*[client(prompts[i::connections]) for i in range(connections)])
+    if errors:
+        print(f"{len(errors)} requests failed, e.g. {errors[0]}")
+    return latencies
+
+
+def run_serving_load_test(requests: int = 200, connections: int = 20, latency: float = 0.05):
+    from serve import WorkflowService
+
+    prompts = [LOAD_TEST_PROMPTS[i % len(LOAD_TEST_PROMPTS)] for i in range(requests)]
+    with fake_groq(FakeGroqClient(latency=latency)):
+        service = WorkflowService()
+        start = time.perf_counter()
+        latencies = asyncio.run(drive_service(service, prompts, connections))
+        elapsed = time.perf_counter() - start
+
+    latencies = np.array(latencies)
+    print(f"Served {len(latencies)} requests over {connections} connections in {elapsed:.2f}s "
+          f"({len(latencies) / elapsed:.1f} requests/s), p50 {np.percentile(latencies, 50) * 1000:.0f} ms, "
+          f"p99 {np.percentile(latencies, 99) * 1000:.0f} ms, stats {service.stats}")
+    record_result("serving_load", requests_per_s=len(latencies) / elapsed, p50_ms=np.percentile(latencies, 50) * 1000,
+                  p99_ms=np.percentile(latencies, 99) * 1000, failed=service.stats['failed'])
+
+
+async def measure_streaming(prompt: str) -> tuple[float, float]:
+    """
+    Returns the seconds until the first piece of the answer and until the whole answer.
+    """
+    from main import astream_response
+
+    start = time.perf_counter()
+    first = None
+    async for _ in astream_response(prompt):
+        if first is None:
+            first = time.perf_counter() - start
+    return first, time.perf_counter() - start
+
+
+def run_streaming_ttft_benchmark(requests: int = 5, latency: float = 0.05, first_token_latency: float = 0.2,
+                                 token_latency: float = 0.02):
+    from main import app
+
+    prompt = "Respond to this review: The noodles were cold and the waiter was rude."
+    model = FakeStreamingChatModel(first_token_latency=first_token_latency, token_latency=token_latency)
+    with fake_groq(FakeGroqClient(latency=latency, responder=sentiment_responder)), fake_response_model(model):
+        blocking = []
+        for _ in range(requests):
+            start = time.perf_counter()
+            asyncio.run(app.ainvoke({"input": prompt}))
+            blocking.append(time.perf_counter() - start)
+        streaming = [asyncio.run(measure_streaming(prompt)) for _ in range(requests)]
+
+    print(f"Feedback reply without streaming: first byte after {np.median(blocking) * 1000:.0f} ms")
+    print(f"Feedback reply with streaming: first token after {np.median([first for first, _ in streaming]) * 1000:.0f} ms, "
+          f"complete after {np.median([total for _, total in streaming]) * 1000:.0f} ms")
+    record_result("streaming_ttft", blocking_first_byte_ms=np.median(blocking) * 1000,
+                  first_token_ms=np.median([first for first, _ in streaming]) * 1000,
+                  complete_ms=np.median([total for _, total in streaming]) * 1000)
+
+
+@contextmanager
+def synthetic_review_csv(rows: int):
+    """
+    Points get_database at a generated reviews CSV of rows rows in a temporary directory.
+    """
+    import data
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "reviews.csv")
+        write_synthetic_csv(path, 0, chunk_rows=min(rows, 50_000), max_rows=rows)
+        original_path, original_database = os.environ.get("REVIEWS_CSV_PATH"), data._database
+        os.environ["REVIEWS_CSV_PATH"] = path
+        data._database = None
+        try:
+            yield path
+        finally:
+            data._database = original_database
+            if original_path is None:
+                os.environ.pop("REVIEWS_CSV_PATH", None)
+            else:
+                os.environ["REVIEWS_CSV_PATH"] = original_path
+
+
+@contextmanager
+def temporary_outputs():
+    """
+    Sends charts, PDFs and the chart cache to a temporary directory and waits for PDF exports on exit.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        originals = (artifacts._manager, report_pdf._exporter, charts._cache)
+        artifacts._manager = artifacts.ArtifactManager(os.path.join(directory, "artifacts"), gc_interval=0)
+        report_pdf._exporter = report_pdf.PdfExporter()
+        charts._cache = charts.ChartCache(os.path.join(directory, "chart_cache"))
+        try:
+            yield directory
+        finally:
+            report_pdf._exporter.shutdown()
+            artifacts._manager, report_pdf._exporter, charts._cache = originals
+
+
+def run_database_load_benchmark(rows: int = 200_000):
+    """
+    Time to load a generated reviews CSV and build its indexes, from the CSV and from the snapshot
+    the first load leaves behind.
+    """
+    with synthetic_review_csv(rows) as path:
+        start = time.perf_counter()
+        ReviewDatabase(path)
+        csv_ms = (time.perf_counter() - start) * 1000
+        start = time.perf_counter()
+        database = ReviewDatabase(path)
+        snapshot_ms = (time.perf_counter() - start) * 1000
+    print(f"Loading {len(database.get_data())} reviews: {csv_ms:.0f} ms from CSV, {snapshot_ms:.0f} ms from the snapshot")
+    record_result("database_load", rows=rows, csv_ms=csv_ms, snapshot_ms=snapshot_ms)
+
+
+def run_report_benchmark(rows: int = 200_000, latency: float = 0.05, tokens_per_second: float = 500,
+                         error_rate: float = 0.05):
+    """
+    Full report generation for a year of synthetic reviews against the fake Groq backend, without
+    and with failing calls.
+    """
+    database = ReviewDatabase.from_dataframe(make_synthetic_reviews(rows))
+    start_date, end_date = pd.Timestamp('2019-01-01'), pd.Timestamp('2019-12-31')
+    for rate in [0, error_rate]:
+        with temporary_outputs(), fake_groq_backend(latency, tokens_per_second, rate) as (client, _):
+            start = time.perf_counter()
+            tools.generate_recommendations_report(database, start_date, end_date)
+            report_ms = (time.perf_counter() - start) * 1000
+        print(f"Report for 2019 at {rate:.0%} errors: {report_ms:.0f} ms, {client.calls} LLM calls, {client.errors} failed")
+        record_result(f"report.errors_{rate:g}", rows=rows, report_ms=report_ms, llm_calls=client.calls,
+                      failed_calls=client.errors)
+
+
+WORKFLOW_PROMPTS = {
+    "strategic_recommendations": "Generate a report for Q3 2019.",
+    "sentiment_plotting": "Show me the sentiment trend for the year 2019.",
+    "feedback_response": "Respond to this review: The noodles were cold and the waiter was rude.",
+}
+
+
+def run_workflow_benchmark(rows: int = 200_000, requests: int = 3, latency: float = 0.05,
+                           tokens_per_second: float = 500):
+    """
+    End-to-end latency of each route of the agent graph on a generated reviews CSV, with requests
+    dispatched straight to the tools and through the agents. The first request of each route runs
+    with cold caches.
+    """
+    import main
+
+    original_dispatch = main.DIRECT_DISPATCH
+    with synthetic_review_csv(rows), temporary_outputs(), fake_groq_backend(latency, tokens_per_second) as (client, model):
+        get_database()
+        try:
+            for dispatch in ["direct", "agent"]:
+                main.DIRECT_DISPATCH = dispatch == "direct"
+                for route, prompt in WORKFLOW_PROMPTS.items():
+                    calls = client.calls + model.calls
+                    latencies = []
+                    for _ in range(requests):
+                        start = time.perf_counter()
+                        main.app.invoke({"input": prompt})
+                        latencies.append((time.perf_counter() - start) * 1000)
+                    llm_calls = (client.calls + model.calls - calls) / requests
+                    print(f"{route} ({dispatch}): first {latencies[0]:.0f} ms, then {np.median(latencies[1:] or latencies):.0f} ms, "
+                          f"{llm_calls:.1f} LLM calls per request")
+                    record_result(f"workflow.{route}.{dispatch}", cold_ms=latencies[0],
+                                  warm_ms=np.median(latencies[1:] or latencies), llm_calls=llm_calls)
+        finally:
+            main.DIRECT_DISPATCH = original_dispatch
+
+
+def run_partition_benchmark(rows: int = 1_000_000, outlets: int = 200, queries: int = 20, reports: int = 8,
+                            latency: float = 0.05):
+    """
+    Per-restaurant queries on a database of many outlets: masking the whole dataset by restaurant
+    against the restaurant's partition, then reports for several outlets one by one and in parallel.
+    """
+    print(f"Building synthetic dataset with {rows} rows over {outlets} restaurants...")
+    dataset = make_synthetic_reviews(rows, outlets=outlets)
+    database = ReviewDatabase.from_dataframe(dataset)
+    dataset = database.get_data()
+    ranges = make_query_ranges(queries)
+    restaurant = "Restaurant 7"
+
+    start = time.perf_counter()
+    database.get_partition(restaurant=restaurant)
+    first_ms = (time.perf_counter() - start) * 1000
+    start = time.perf_counter()
+    partition = database.get_partition(restaurant="Restaurant 8")
+    next_ms = (time.perf_counter() - start) * 1000
+    partition = database.get_partition(restaurant=restaurant)
+    print(f"Partition index: {first_ms:.1f} ms for the first restaurant, {next_ms:.2f} ms for each further one")
+
+    def legacy_counts(start_date, end_date):
+        rows_in_range = legacy_get_reviews(dataset[dataset['Restaurant Name'] == restaurant], start_date, end_date)
+        return rows_in_range.groupby(rows_in_range['Review Date'].dt.date)['Sentiment'].value_counts().unstack(fill_value=0)
+
+    for name, legacy, partitioned in [
+        ("get_reviews",
+         lambda s, e: legacy_get_reviews(dataset[dataset['Restaurant Name'] == restaurant], s, e),
+         partition.get_reviews),
+        ("get_sentiment_counts_by_date", legacy_counts, partition.get_sentiment_counts_by_date),
+    ]:
+        legacy_ms = time_calls(legacy, ranges)
+        partition_ms = time_calls(partitioned, ranges)
+        print(f"{name} for one restaurant: mask scan {legacy_ms:.2f} ms, partition {partition_ms:.3f} ms "
+              f"({legacy_ms / partition_ms:.0f}x faster)")
+        record_result(f"partition.{name}", rows=rows, outlets=outlets, mask_scan_ms=legacy_ms, partition_ms=partition_ms)
+
+    start_date, end_date = pd.Timestamp('2019-01-01'), pd.Timestamp('2019-12-31')
+    chosen = database.get_outlets()[:reports]
+    timings = {}
+    for workers in [1, reports]:
+        with temporary_outputs(), fake_groq_backend(latency) as (client, _):
+            start = time.perf_counter()
+            tools.generate_outlet_reports(database, start_date, end_date, chosen, max_workers=workers)
+            timings[workers] = (time.perf_counter() - start) * 1000
+        print(f"{len(chosen)} outlet reports with {workers} at a time: {timings[workers]:.0f} ms, {client.calls} LLM calls")
+    record_result("partition.outlet_reports", outlets=len(chosen), sequential_ms=timings[1], parallel_ms=timings[reports],
+                  first_index_ms=first_ms, next_index_ms=next_ms)
+
+
+STARTUP_SCRIPT = """
+import json, resource, sys, time
+start = time.perf_counter()
+import main
+import_ms = (time.perf_counter() - start) * 1000
+import_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+loaded = [name for name in sys.argv[1:] if name in sys.modules]
+start = time.perf_counter()
+main.get_response_model()
+response_model_ms = (time.perf_counter() - start) * 1000
+start = time.perf_counter()
+for route in main.AGENTS:
+    main.get_agent_executor(route)
+agents_ms = (time.perf_counter() - start) * 1000
+print(json.dumps({"import_ms": import_ms, "import_rss_mb": import_rss_mb, "response_model_ms": response_model_ms,
+                  "agents_ms": agents_ms, "rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+                  "loaded": loaded}))
+"""
+
+
+def run_startup_benchmark(runs: int = 3, import_budget_ms: float = STARTUP_IMPORT_BUDGET_MS,
+                          rss_budget_mb: float = STARTUP_RSS_BUDGET_MB):
+    """
+    Cold start of the agent workflow in fresh interpreters: time and peak RSS of importing main,
+    then the cost of the reply model and the agents, which are created on first use. The best
+    of runs import times is checked against the budgets.
+    """
+    env = dict(os.environ, GROQ_API_KEY=os.getenv("GROQ_API_KEY") or "benchmark")
+    measurements = []
+    for _ in range(runs):
+        result = subprocess.run([sys.executable, "-c", STARTUP_SCRIPT] + DEFERRED_MODULES,
+                                capture_output=True, text=True, env=env, check=True)
+        measurements.append(json.loads(result.stdout.strip().splitlines()[-1]))
+    best = min(measurements, key=lambda measurement: measurement["import_ms"])
+
+    print(f"import main: {best['import_ms']:.0f} ms (budget {import_budget_ms:.0f} ms), "
+          f"peak RSS {best['import_rss_mb']:.0f} MB (budget {rss_budget_mb:.0f} MB)")
+    print(f"On first use: reply model {best['response_model_ms']:.0f} ms, all three agents {best['agents_ms']:.0f} ms, "
+          f"peak RSS then {best['rss_mb']:.0f} MB")
+    failures = []
+    if best["import_ms"] > import_budget_ms:
+        failures.append(f"import main took {best['import_ms']:.0f} ms, over the {import_budget_ms:.0f} ms budget")
+    if best["import_rss_mb"] > rss_budget_mb:
+        failures.append(f"import main used {best['import_rss_mb']:.0f} MB, over the {rss_budget_mb:.0f} MB budget")
+    if best["loaded"]:
+        failures.append(f"import main loaded {', '.join(best['loaded'])}")
+    for failure in failures:
+        print(f"Over budget: {failure}")
+    BUDGET_FAILURES.extend(failures)
+    record_result("startup", import_ms=best["import_ms"], import_rss_mb=best["import_rss_mb"],
+                  response_model_ms=best["response_model_ms"], agents_ms=best["agents_ms"], first_use_rss_mb=best["rss_mb"])
+
+
+def get_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def write_results(path: str, scale: float):
+    """
+    Writes the recorded results with the commit and machine they were measured on as JSON.
+    """
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump({
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "commit": get_commit(),
+            "python": platform.python_version(),
+            "machine": platform.platform(),
+            "cpus": os.cpu_count(),
+            "scale": scale,
+            "results": RESULTS,
+        }, file, indent=2)
+    print(f"Wrote {len(RESULTS)} results to {path}")
+
+
+def compare_results(baseline_path: str, tolerance: float = BENCHMARK_TOLERANCE) -> list[str]:
+    """
+    Lists the timings and throughputs that got worse by more than tolerance against a results file.
+    """
+    with open(baseline_path, encoding="utf-8") as file:
+        baseline = {result["scenario"]: result["metrics"] for result in json.load(file)["results"]}
+    regressions = []
+    for result in RESULTS:
+        for name, value in result["metrics"].items():
+            before = baseline.get(result["scenario"], {}).get(name)
+            if not before or not value:
+                continue
+            if name.endswith("_per_s"):
+                change = before / value - 1
+            elif name.endswith(("_ms", "_us", "_mb")):
+                change = value / before - 1
+            else:
+                continue
+            if change > tolerance:
+                regressions.append(f"{result['scenario']} {name}: {before:g} -> {value:g} ({change:.0%} worse)")
+    return regressions
+
+
+SCENARIOS = {
+    "startup": lambda scale: run_startup_benchmark(),
+    "range_query": lambda scale: run_range_query_benchmark(rows=int(1_000_000 * scale)),
+    "sentiment_cube": lambda scale: run_sentiment_cube_benchmark(rows=int(1_000_000 * scale)),
+    "append": lambda scale: run_append_benchmark(rows=int(1_000_000 * scale)),
+    "database_load": lambda scale: run_database_load_benchmark(rows=int(200_000 * scale)),
+    "tracing_overhead": lambda scale: run_tracing_overhead_benchmark(rows=int(100_000 * scale)),
+    "theme_concurrency": lambda scale: run_theme_concurrency_benchmark(rows=int(2000 * scale)),
+    "theme_batching": lambda scale: run_theme_batching_benchmark(),
+    "bulk_classification": lambda scale: run_bulk_classification_benchmark(rows=int(500 * scale)),
+    "local_classifier": lambda scale: run_local_classifier_evaluation(),
+    "charts": lambda scale: run_chart_rendering_benchmark(rows=int(100_000 * scale)),
+    "report": lambda scale: run_report_benchmark(rows=int(200_000 * scale)),
+    "partitions": lambda scale: run_partition_benchmark(rows=int(1_000_000 * scale)),
+    "pdf_export": lambda scale: run_pdf_export_benchmark(),
+    "chunked_ingestion": lambda scale: run_chunked_ingestion_benchmark(size_mb=int(2048 * scale)),
+    "workflow": lambda scale: run_workflow_benchmark(rows=int(200_000 * scale)),
+    "serving_load": lambda scale: run_serving_load_test(),
+    "streaming_ttft": lambda scale: run_streaming_ttft_benchmark(),
+}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Runs the benchmarks offline against a fake Groq backend.")
+    parser.add_argument("scenarios", nargs="*", help=f"scenarios to run (default: all): {', '.join(SCENARIOS)}")
+    parser.add_argument("--scale", type=float, default=1.0, help="multiplies the size of the synthetic datasets")
+    parser.add_argument("--output", default=BENCHMARK_OUTPUT, help="JSON file for the results")
+    parser.add_argument("--baseline", help="earlier results file to check for regressions")
+    args = parser.parse_args()
+    unknown = [name for name in args.scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(unknown)}")
+
+    for name in args.scenarios or SCENARIOS:
+        print(f"== {name}")
+        SCENARIOS[name](args.scale)
+    write_results(args.output, args.scale)
+    regressions = compare_results(args.baseline) if args.baseline else []
+    for regression in regressions:
+        print(f"Regression: {regression}")
+    sys.exit(1 if regressions or BUDGET_FAILURES else 0)
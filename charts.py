@@ -0,0 +1,223 @@
+import hashlib
+import io
+import os
+import threading
+
+import pandas as pd
+
+from artifacts import ArtifactManager, get_artifact_manager, write_atomically
+from tracing import traced
+
+CHART_CACHE_DIR = os.getenv("CHART_CACHE_DIR", ".chart_cache")
+CHART_CACHE_ENABLED = os.getenv("CHART_CACHE_ENABLED", "1") != "0"
+# Charts not used for this long are evicted, and the least recently used ones while the cache is too large
+CHART_CACHE_MAX_AGE_SECONDS = float(os.getenv("CHART_CACHE_MAX_AGE_SECONDS", str(7 * 24 * 3600)))
+CHART_CACHE_MAX_BYTES = int(os.getenv("CHART_CACHE_MAX_BYTES", str(100 * 1024 * 1024)))
+# Evict after this many newly cached charts
+CHART_CACHE_GC_INTERVAL = int(os.getenv("CHART_CACHE_GC_INTERVAL", "50"))
+CHART_TYPES = ("pie", "line", "stacked_bar", "simple_bar")
+CHART_PREFIXES = {
+    "stacked_bar": "sentiment_stacked_bar",
+    "line": "sentiment_line_chart",
+    "pie": "sentiment_pie_chart",
+    "simple_bar": "sentiment_simple_bar",
+}
+SENTIMENT_COLORS = ['green', 'red', 'gray']
+
+SUBPLOT_PARAMS = ("left", "right", "bottom", "top", "wspace", "hspace")
+
+# One figure per (thread, size), cleared and redrawn for every chart
+_figures = threading.local()
+
+
+def _get_figure(figsize: tuple):
+    """
+    Returns a blank Agg figure of the given size owned by the calling thread.
+    matplotlib is imported here, on the first chart, and pyplot is never used.
+    """
+    import matplotlib
+
+    figures = getattr(_figures, "by_size", None)
+    if figures is None:
+        figures = _figures.by_size = {}
+    figure = figures.get(figsize)
+    if figure is None:
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.figure import Figure
+
+        figure = Figure(figsize=figsize)
+        FigureCanvasAgg(figure)
+        figures[figsize] = figure
+    figure.clear()
+    # tight_layout moves the subplot margins; start every chart from the defaults again
+    figure.subplots_adjust(**{name: matplotlib.rcParams[f"figure.subplot.{name}"] for name in SUBPLOT_PARAMS})
+    return figure
+
+
+def get_total_counts(sentiment_counts: pd.DataFrame) -> pd.Series:
+    """
+    Sums a date x sentiment count table into nonzero totals per sentiment, largest first.
+    """
+    totals = sentiment_counts.sum().rename('count')
+    return totals[totals > 0].sort_values(ascending=False, kind='stable')
+
+
+def _draw_stacked_bar(figure, sentiment_counts, totals):
+    ax = figure.add_subplot()
+    positions = range(len(sentiment_counts))
+    bottom = None
+    for sentiment in sentiment_counts.columns:
+        values = sentiment_counts[sentiment].to_numpy()
+        ax.bar(positions, values, 0.5, bottom=bottom, label=sentiment)
+        bottom = values if bottom is None else bottom + values
+    ax.set_xticks(positions, [str(day) for day in sentiment_counts.index], rotation=45)
+    ax.set_title('Sentiment Trends Over Time (Stacked Bar Chart)')
+    ax.set_xlabel('Date')
+    ax.set_ylabel('Number of Reviews')
+    if len(sentiment_counts.columns):
+        ax.legend(title='Sentiment')
+    figure.tight_layout()
+
+
+def _draw_line(figure, sentiment_counts, totals):
+    ax = figure.add_subplot()
+    for sentiment in sentiment_counts.columns:
+        ax.plot(sentiment_counts.index, sentiment_counts[sentiment].to_numpy(), marker='o', label=sentiment)
+    ax.set_title('Sentiment Trends Over Time (Line Chart)')
+    ax.set_xlabel('Date')
+    ax.set_ylabel('Number of Reviews')
+    if len(sentiment_counts.columns):
+        ax.legend(title='Sentiment')
+    ax.tick_params(axis='x', labelrotation=45)
+    ax.grid(True)
+    figure.tight_layout()
+
+
+def _draw_pie(figure, sentiment_counts, totals):
+    ax = figure.add_subplot()
+    ax.pie(totals, labels=totals.index, autopct='%1.1f%%', startangle=90, colors=SENTIMENT_COLORS)
+    ax.set_title('Overall Sentiment Distribution')
+    ax.axis('equal')
+
+
+def _draw_simple_bar(figure, sentiment_counts, totals):
+    ax = figure.add_subplot()
+    ax.bar(range(len(totals)), totals.to_numpy(), 0.5, color=SENTIMENT_COLORS[:len(totals)])
+    ax.set_xticks(range(len(totals)), totals.index)
+    ax.set_title('Total Sentiment Count')
+    ax.set_xlabel('Sentiment')
+    ax.set_ylabel('Number of Reviews')
+    figure.tight_layout()
+
+
+CHART_RENDERERS = {
+    "stacked_bar": ((12, 6), _draw_stacked_bar),
+    "line": ((12, 6), _draw_line),
+    "pie": ((8, 8), _draw_pie),
+    "simple_bar": ((10, 6), _draw_simple_bar),
+}
+
+
+@traced()
+def render_charts(sentiment_counts: pd.DataFrame, chart_types) -> dict:
+    """
+    Renders several chart types from one date x sentiment count table and returns their PNG bytes.
+    """
+    totals = get_total_counts(sentiment_counts)
+    charts = {}
+    for chart_type in chart_types:
+        figsize, draw = CHART_RENDERERS[chart_type]
+        figure = _get_figure(figsize)
+        draw(figure, sentiment_counts, totals)
+        buffer = io.BytesIO()
+        figure.savefig(buffer, format='png')
+        figure.clear()
+        charts[chart_type] = buffer.getvalue()
+    return charts
+
+
+def render_chart(sentiment_counts: pd.DataFrame, chart_type: str) -> bytes:
+    return render_charts(sentiment_counts, [chart_type])[chart_type]
+
+
+class ChartCache:
+    """
+    Directory of rendered PNGs keyed by chart type, date range and data version. Every append
+    gives the ranges it touches a new data version, leaving their old charts unused, so the
+    directory is garbage-collected like the artifacts directory. A hit marks its chart as used.
+    """
+    def __init__(self, directory: str = CHART_CACHE_DIR, max_age: float = CHART_CACHE_MAX_AGE_SECONDS,
+                 max_bytes: int = CHART_CACHE_MAX_BYTES, gc_interval: int = CHART_CACHE_GC_INTERVAL):
+        self.directory = directory
+        self.gc_interval = gc_interval
+        self._files = ArtifactManager(directory, max_age, max_bytes, gc_interval)
+        self._lock = threading.Lock()
+        self._written = 0
+
+    def _path(self, chart_type: str, start_date, end_date, data_version: str) -> str:
+        key = f"{chart_type}|{pd.Timestamp(start_date).date()}|{pd.Timestamp(end_date).date()}|{data_version}"
+        return os.path.join(self.directory, hashlib.sha1(key.encode("utf-8")).hexdigest()[:20] + ".png")
+
+    def get(self, chart_type: str, start_date, end_date, data_version: str):
+        path = self._path(chart_type, start_date, end_date, data_version)
+        try:
+            with open(path, "rb") as file:
+                png = file.read()
+            os.utime(path)
+            return png
+        except OSError:
+            return None
+
+    def set(self, chart_type: str, start_date, end_date, data_version: str, png: bytes):
+        path = self._path(chart_type, start_date, end_date, data_version)
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            write_atomically(path, png)
+        except OSError as e:
+            print(f"Error caching chart: {e}")
+            return
+        with self._lock:
+            self._written += 1
+            collect = self.gc_interval and self._written % self.gc_interval == 0
+        if collect:
+            self._files.collect_garbage()
+
+
+_cache = ChartCache()
+
+
+@traced()
+def get_sentiment_charts(database: object, chart_types, start_date, end_date, cached_only: bool = False) -> dict:
+    """
+    Returns PNG bytes of each requested chart for the date range. Charts rendered before for the
+    same data version of the range come from the cache; the rest share one aggregation of the
+    database, or are left out with cached_only.
+    """
+    get_data_version = getattr(database, "get_data_version", None)
+    data_version = get_data_version(start_date, end_date) if get_data_version else getattr(database, "data_version", None)
+    use_cache = CHART_CACHE_ENABLED and data_version is not None
+    charts = {}
+    for chart_type in chart_types:
+        png = _cache.get(chart_type, start_date, end_date, data_version) if use_cache else None
+        if png is not None:
+            charts[chart_type] = png
+
+    missing = [chart_type for chart_type in chart_types if chart_type not in charts]
+    if missing and not cached_only:
+        rendered = render_charts(database.get_sentiment_counts_by_date(start_date, end_date), missing)
+        for chart_type, png in rendered.items():
+            if use_cache:
+                _cache.set(chart_type, start_date, end_date, data_version, png)
+        charts.update(rendered)
+    return charts
+
+
+def save_png(png: bytes, file_name: str = None, prefix: str = "sentiment_chart") -> str:
+    """
+    Writes a chart to file_name, or to a new artifact path named after prefix when none is given.
+    """
+    if file_name is None:
+        file_name = get_artifact_manager().write(prefix, ".png", png)
+    else:
+        write_atomically(file_name, png)
+    return f"Plot saved to {file_name}"
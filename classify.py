@@ -0,0 +1,89 @@
+import os
+import time
+
+import pandas as pd
+
+from local_classifier import classify_many_locally
+from tools import classify_reviews_with_llm, map_concurrently
+
+BULK_BATCH_SIZE = int(os.getenv("BULK_BATCH_SIZE", "25"))
+BULK_MAX_RETRIES = int(os.getenv("BULK_MAX_RETRIES", "2"))
+BULK_STREAM_CHUNK_SIZE = int(os.getenv("BULK_STREAM_CHUNK_SIZE", "1000"))
+
+
+def classify_review_texts(reviews_list: list[str], batch_size: int = None, max_workers: int = None,
+                          max_retries: int = None) -> list[str]:
+    """
+    Classifies many reviews. Reviews the local classifier is confident about are labelled
+    locally; the rest are packed batch_size at a time into LLM calls, with up to max_workers
+    calls in flight. Reviews whose label is missing or invalid are retried on their own in
+    smaller batches; any still unlabelled after max_retries become 'Neutral'.
+    """
+    batch_size = batch_size or BULK_BATCH_SIZE
+    max_retries = BULK_MAX_RETRIES if max_retries is None else max_retries
+    labels = classify_many_locally(reviews_list)
+    pending = [i for i, label in enumerate(labels) if label is None]
+
+    for attempt in range(max_retries + 1):
+        if not pending:
+            break
+        size = max(1, batch_size >> attempt)
+        batches = [pending[i:i + size] for i in range(0, len(pending), size)]
+        results = map_concurrently(
+            lambda positions: classify_reviews_with_llm([reviews_list[i] for i in positions]),
+            [(positions,) for positions in batches],
+            max_workers,
+        )
+        for positions, batch_labels in zip(batches, results):
+            for i, label in zip(positions, batch_labels):
+                labels[i] = label
+        pending = [i for i in pending if labels[i] is None]
+
+    if pending:
+        print(f"Could not classify {len(pending)} reviews, marking them as Neutral.")
+    return [label or "Neutral" for label in labels]
+
+
+def classify_review_stream(reviews, chunk_size: int = None, **kwargs):
+    """
+    Classifies an iterable of review texts chunk by chunk, yielding (review, label) pairs
+    without holding the whole stream in memory.
+    """
+    chunk_size = chunk_size or BULK_STREAM_CHUNK_SIZE
+    chunk = []
+    for review in reviews:
+        chunk.append(review)
+        if len(chunk) >= chunk_size:
+            yield from zip(chunk, classify_review_texts(chunk, **kwargs))
+            chunk = []
+    if chunk:
+        yield from zip(chunk, classify_review_texts(chunk, **kwargs))
+
+
+def classify_reviews(reviews: pd.DataFrame, database: object = None, **kwargs) -> pd.Series:
+    """
+    Classifies the reviews in a DataFrame that have no Sentiment yet (all of them when the
+    column is absent) and returns the labels indexed like the DataFrame. When a database
+    is given, the labels of the reviews it holds, i.e. rows with the same index and text as
+    in database.get_data(), are written back into it. Other reviews are only returned; append
+    them to the database first to keep their labels there.
+    """
+    if 'Sentiment' in reviews.columns:
+        reviews = reviews[reviews['Sentiment'].isna()]
+    texts = reviews['Review'].astype(str).tolist()
+
+    start = time.perf_counter()
+    labels = pd.Series(classify_review_texts(texts, **kwargs), index=reviews.index, name='Sentiment', dtype=object)
+    elapsed = time.perf_counter() - start
+    if texts:
+        print(f"Classified {len(texts)} reviews in {elapsed:.2f}s ({len(texts) / elapsed:.1f} reviews/s)")
+
+    if database is not None and not labels.empty:
+        # A DataFrame the database was not built from can reuse its index labels for other reviews
+        stored = database.get_data()['Review'].reindex(labels.index)
+        held = stored.notna() & (stored.astype(object) == reviews['Review'].astype(object))
+        if not held.all():
+            print(f"{int((~held).sum())} classified reviews are not in the database; their labels were not written back.")
+        if held.any():
+            database.update_sentiments(labels[held])
+    return labels
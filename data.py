@@ -1,30 +1,729 @@
+import copy
+import gc
+import glob
+import hashlib
+import io
+import os
+import shutil
+import threading
+
+import numpy as np
 import pandas as pd
+import pyarrow as pa
 
-class ReviewDatabase:
-    def __init__(self, file_path='European Restaurant reviews.csv'):
-        dataset = pd.read_csv(file_path)
-        dataset = dataset.dropna()
-        dataset = dataset.drop_duplicates()
-        dataset.drop(columns=["Country", "Restaurant Name", "Review Title"], inplace=True)
-        dataset['Review Date'] = dataset['Review Date'].str.replace(' •', '')
-        dataset['Review Date'] = dataset['Review Date'].str.replace('Sept', 'Sep')
-        dataset['Review Date'] = pd.to_datetime(dataset['Review Date'], format='%b %Y')
-        self.database = dataset
+from tracing import traced
 
-    def get_data(self):
-        return self.database
+DEFAULT_FILE_PATH = 'European Restaurant reviews.csv'
+SNAPSHOT_DIR = os.getenv("REVIEW_SNAPSHOT_DIR", ".review_cache")
+# Bump whenever the cleaning in load_reviews_csv changes so old snapshots are ignored.
+SNAPSHOT_VERSION = 2
+# CSVs at least this large are ingested chunk by chunk into an on-disk store instead of read whole
+REVIEW_CHUNKED_MIN_BYTES = int(os.getenv("REVIEW_CHUNKED_MIN_BYTES", str(256 * 1024 * 1024)))
+REVIEW_CHUNK_SIZE = int(os.getenv("REVIEW_CHUNK_SIZE", "50000"))
+DROPPED_COLUMNS = ["Review Title"]
+# Columns each outlet's reviews are partitioned by, kept as categoricals
+PARTITION_COLUMNS = ["Country", "Restaurant Name"]
+CATEGORY_COLUMNS = PARTITION_COLUMNS + ["Sentiment"]
+TEXT_SCHEMA = pa.schema([("Review", pa.large_string())])
+# A reviews CSV, or a directory of them, to poll for appended rows (see review_watcher.py)
+REVIEWS_WATCH_PATH = os.getenv("REVIEWS_WATCH_PATH")
+
+
+def clean_review_dates(dates: pd.Series) -> pd.Series:
+    dates = dates.str.replace(' •', '')
+    dates = dates.str.replace('Sept', 'Sep')
+    return pd.to_datetime(dates, format='%b %Y')
+
+
+def get_row_hashes(dataset: pd.DataFrame) -> np.ndarray:
+    """
+    64-bit hash of every raw row, used to find duplicate rows without comparing their text.
+    """
+    return pd.util.hash_pandas_object(dataset, index=False).to_numpy()
+
+
+@traced()
+def load_reviews_csv(file_path: str) -> pd.DataFrame:
+    """
+    Reads the raw reviews CSV and applies the standard cleaning steps.
+    """
+    dataset = pd.read_csv(file_path)
+    dataset = dataset.dropna()
+    dataset = dataset.drop_duplicates()
+    dataset.drop(columns=DROPPED_COLUMNS, inplace=True)
+    dataset = dataset.astype({column: 'category' for column in PARTITION_COLUMNS if column in dataset})
+    dataset['Review Date'] = clean_review_dates(dataset['Review Date'])
+    return dataset
+
+
+def get_source_signature(file_path: str) -> str:
+    """
+    Identifies the current contents of a source file by its path, size and mtime.
+    """
+    stat = os.stat(file_path)
+    key = f"{os.path.abspath(file_path)}|{stat.st_size}|{stat.st_mtime_ns}|{SNAPSHOT_VERSION}"
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()[:16]
+
+
+def get_snapshot_path(file_path: str, signature: str) -> str:
+    source_dir = os.path.dirname(os.path.abspath(file_path))
+    stem = os.path.splitext(os.path.basename(file_path))[0]
+    return os.path.join(source_dir, SNAPSHOT_DIR, f"{stem}.{signature}.parquet")
+
+
+@traced()
+def load_snapshot(file_path: str, signature: str):
+    """
+    Loads the cleaned columnar snapshot for this version of the source file, if one exists.
+    """
+    snapshot_path = get_snapshot_path(file_path, signature)
+    if not os.path.exists(snapshot_path):
+        return None
+    try:
+        return pd.read_parquet(snapshot_path, memory_map=True)
+    except Exception as e:
+        print(f"Error reading review snapshot {snapshot_path}: {e}")
+        return None
+
+
+@traced()
+def save_snapshot(dataset: pd.DataFrame, file_path: str, signature: str):
+    """
+    Writes the cleaned dataset next to the source file and removes snapshots of older versions.
+    """
+    snapshot_path = get_snapshot_path(file_path, signature)
+    try:
+        os.makedirs(os.path.dirname(snapshot_path), exist_ok=True)
+        temp_path = f"{snapshot_path}.{os.getpid()}.tmp"
+        dataset.to_parquet(temp_path)
+        os.replace(temp_path, snapshot_path)
+
+        stem = os.path.splitext(os.path.basename(file_path))[0]
+        for old_path in glob.glob(os.path.join(os.path.dirname(snapshot_path), f"{glob.escape(stem)}.*.parquet")):
+            if old_path != snapshot_path:
+                os.remove(old_path)
+    except Exception as e:
+        print(f"Error writing review snapshot {snapshot_path}: {e}")
+
+
+def get_store_path(file_path: str, signature: str) -> str:
+    return get_snapshot_path(file_path, signature)[:-len(".parquet")] + ".store"
+
+
+@traced()
+def ingest_reviews_csv(file_path: str, store_path: str, chunksize: int = None) -> int:
+    """
+    Applies the load_reviews_csv cleaning chunk by chunk and writes the result to store_path:
+    compact.parquet holds the small columns (date, sentiment, country and restaurant as categories,
+    source row and row hash) and text.arrow the review texts as an Arrow IPC file that can be memory-mapped.
+    Duplicate rows are found by a 64-bit hash of the whole row rather than by comparing text.
+    Texts are spilled to one temporary file per review date and concatenated in date order,
+    which is the stable date sort without holding or mapping all of them at once. Memory use is
+    bounded by the chunk size plus a few bytes per review. Returns the row count.
+    """
+    chunksize = chunksize or REVIEW_CHUNK_SIZE
+    work_path = f"{store_path}.{os.getpid()}.tmp"
+    os.makedirs(work_path, exist_ok=True)
+
+    seen = np.array([], dtype=np.uint64)
+    labels = {column: {} for column in CATEGORY_COLUMNS}
+    codes = {column: [] for column in CATEGORY_COLUMNS}
+    dates, rows, hashes = [], [], []
+    buckets = {}
+    try:
+        for chunk in pd.read_csv(file_path, chunksize=chunksize):
+            chunk = chunk.dropna()
+            row_hashes = get_row_hashes(chunk)
+            keep = np.zeros(len(chunk), dtype=bool)
+            keep[np.unique(row_hashes, return_index=True)[1]] = True
+            if len(seen):
+                positions = np.minimum(seen.searchsorted(row_hashes), len(seen) - 1)
+                keep &= seen[positions] != row_hashes
+            chunk, row_hashes = chunk[keep], row_hashes[keep]
+            seen = np.sort(np.concatenate([seen, row_hashes]), kind='stable')
+
+            for column in CATEGORY_COLUMNS:
+                if column in chunk:
+                    chunk_codes, chunk_labels = pd.factorize(chunk[column])
+                    column_labels = labels[column]
+                    mapping = np.array([column_labels.setdefault(label, len(column_labels)) for label in chunk_labels], dtype=np.int32)
+                    codes[column].append(mapping[chunk_codes])
+            chunk_dates = clean_review_dates(chunk['Review Date']).to_numpy()
+            dates.append(chunk_dates)
+            rows.append(chunk.index.to_numpy())
+            hashes.append(row_hashes)
+
+            texts = pa.array(chunk['Review'].to_numpy(), pa.large_string())
+            for date in np.unique(chunk_dates):
+                if date not in buckets:
+                    path = os.path.join(work_path, f"text.{len(buckets)}.arrow")
+                    sink = pa.OSFile(path, "wb")
+                    buckets[date] = (path, sink, pa.ipc.new_file(sink, TEXT_SCHEMA))
+                batch = pa.record_batch([texts.filter(pa.array(chunk_dates == date))], schema=TEXT_SCHEMA)
+                buckets[date][2].write_batch(batch)
+            # The .str accessors leave reference cycles that keep the whole chunk alive
+            del chunk, texts
+            gc.collect()
+    finally:
+        for _, sink, writer in buckets.values():
+            writer.close()
+            sink.close()
+
+    with pa.OSFile(os.path.join(work_path, "text.arrow"), "wb") as sink, pa.ipc.new_file(sink, TEXT_SCHEMA) as writer:
+        for date in sorted(buckets):
+            path = buckets[date][0]
+            with pa.memory_map(path) as source:
+                reader = pa.ipc.open_file(source)
+                for i in range(reader.num_record_batches):
+                    writer.write_batch(reader.get_batch(i))
+            os.remove(path)
+
+    dates = np.concatenate(dates) if dates else np.array([], dtype='datetime64[ns]')
+    order = np.argsort(dates, kind='stable')
+    compact = pd.DataFrame({
+        column: pd.Categorical.from_codes(
+            np.concatenate(codes[column])[order] if codes[column] else [], categories=list(labels[column]))
+        for column in CATEGORY_COLUMNS if codes[column] or column == 'Sentiment'
+    })
+    compact['Review Date'] = dates[order]
+    compact['Row'] = np.concatenate(rows)[order] if rows else np.array([], dtype=np.int64)
+    compact['Row Hash'] = np.concatenate(hashes)[order] if hashes else np.array([], dtype=np.uint64)
+    compact.to_parquet(os.path.join(work_path, "compact.parquet"))
+    shutil.rmtree(store_path, ignore_errors=True)
+    os.replace(work_path, store_path)
+    return len(compact)
+
+
+@traced()
+def load_review_store(store_path: str) -> pd.DataFrame:
+    """
+    Opens a store written by ingest_reviews_csv as a cleaned reviews DataFrame. The Review column
+    is backed by the memory-mapped text file, so the texts are paged in only when read.
+    """
+    compact = pd.read_parquet(os.path.join(store_path, "compact.parquet"))
+    text = pa.ipc.open_file(pa.memory_map(os.path.join(store_path, "text.arrow"))).read_all()
+    index = pd.Index(compact['Row'].to_numpy())
+    columns = {
+        column: pd.Series(compact[column].to_numpy(), index=index, dtype=compact[column].dtype)
+        for column in CATEGORY_COLUMNS if column in compact
+    }
+    columns['Review Date'] = pd.Series(compact['Review Date'].to_numpy(), index=index)
+    columns['Review'] = pd.Series(pd.arrays.ArrowExtensionArray(text.column('Review')), index=index)
+    return pd.DataFrame(columns)
+
+
+@traced()
+def open_review_store(file_path: str, signature: str) -> pd.DataFrame:
+    """
+    Loads the store for this version of the source file, ingesting the file first when there is
+    none yet, and removes stores of older versions.
+    """
+    store_path = get_store_path(file_path, signature)
+    if not os.path.exists(os.path.join(store_path, "compact.parquet")):
+        print(f"Ingesting {file_path} in chunks of {REVIEW_CHUNK_SIZE} rows...")
+        ingest_reviews_csv(file_path, store_path)
+        stem = os.path.splitext(os.path.basename(file_path))[0]
+        for old_path in glob.glob(os.path.join(os.path.dirname(store_path), f"{glob.escape(stem)}.*.store")):
+            if old_path != store_path:
+                shutil.rmtree(old_path, ignore_errors=True)
+    return load_review_store(store_path)
+
+
+class SentimentCube:
+    """
+    Month x sentiment review counts with prefix sums, so totals for any date
+    range cost O(months) no matter how many reviews fall inside it.
+    """
+    def __init__(self):
+        self.months = np.array([], dtype='datetime64[M]')
+        self.counts = np.zeros((0, 0), dtype=np.int64)
+        self.prefix = np.zeros((1, 0), dtype=np.int64)
+
+    def add(self, months: np.ndarray, codes: np.ndarray):
+        """
+        Adds reviews given by their month and sentiment code, growing the cube as needed.
+        Reviews without a sentiment yet (code -1) are left out.
+        """
+        months = np.asarray(months, dtype='datetime64[M]')
+        codes = np.asarray(codes)
+        labelled = codes >= 0
+        if not labelled.all():
+            months, codes = months[labelled], codes[labelled]
+        if len(codes) == 0:
+            return
+        all_months = np.union1d(self.months, months)
+        num_labels = max(self.counts.shape[1], int(codes.max()) + 1)
+
+        counts = np.zeros((len(all_months), num_labels), dtype=np.int64)
+        counts[np.searchsorted(all_months, self.months), :self.counts.shape[1]] = self.counts
+        cells = np.searchsorted(all_months, months) * num_labels + codes
+        counts += np.bincount(cells, minlength=counts.size).reshape(counts.shape)
+
+        self.months = all_months
+        self.counts = counts
+        self.prefix = np.vstack([np.zeros((1, num_labels), dtype=np.int64), counts.cumsum(axis=0)])
+
+    def get_month_bounds(self, start_date, end_date):
+        """
+        Returns the slice of months whose first day lies within [start_date, end_date].
+        Reviews are dated by month, so this matches the rows get_reviews would return.
+        """
+        month_starts = self.months.astype('datetime64[ns]')
+        lower = month_starts.searchsorted(pd.Timestamp(start_date).to_datetime64(), side='left')
+        upper = month_starts.searchsorted(pd.Timestamp(end_date).to_datetime64(), side='right')
+        return lower, max(lower, upper)
+
+    def get_counts(self, start_date, end_date):
+        lower, upper = self.get_month_bounds(start_date, end_date)
+        return self.months[lower:upper], self.counts[lower:upper]
+
+    def get_totals(self, start_date, end_date):
+        lower, upper = self.get_month_bounds(start_date, end_date)
+        return self.prefix[upper] - self.prefix[lower]
+
+
+class ReviewState:
+    """
+    One version of the reviews with the indexes built from them: the rows sorted by date, their
+    dates, sentiment codes and cube. A published state is never modified; updates build a
+    new one and swap it in with a single assignment, so a query that takes the state once reads
+    rows, bounds and codes that belong together even while the watcher appends. The partition
+    caches fill in as outlets are asked for and belong to this state only.
+    """
+    def __init__(self, data: pd.DataFrame, dates: np.ndarray, sentiment_codes: np.ndarray,
+                 sentiment_index: dict, sentiment_labels: list, cube: SentimentCube, version: int = 0,
+                 base_version: int = 0, month_versions: dict = None):
+        self.data = data
+        self.dates = dates
+        self.sentiment_codes = sentiment_codes
+        self.sentiment_index = sentiment_index
+        self.sentiment_labels = sentiment_labels
+        self.cube = cube
+        self.version = version
+        self.base_version = base_version
+        # Version of the last append that touched each month, keyed by 'YYYY-MM'
+        self.month_versions = month_versions or {}
+        # Per column: lowercased value -> code, the row positions ordered by code and each code's bounds
+        self.partition_index = {}
+        self.partitions = {}
+        self.outlets = None
+
+
+class ReviewQueries:
+    """
+    Date range queries shared by ReviewDatabase and ReviewPartition. Each query reads self.state
+    once and answers from that ReviewState alone.
+    """
+    def _get_bounds(self, state: ReviewState, start_date, end_date):
+        start = pd.Timestamp(start_date).to_datetime64()
+        end = pd.Timestamp(end_date).to_datetime64()
+        lower = state.dates.searchsorted(start, side='left')
+        upper = state.dates.searchsorted(end, side='right')
+        return lower, max(lower, upper)
+
+    def _rows(self, state: ReviewState, lower: int, upper: int, mask: np.ndarray = None) -> pd.DataFrame:
+        rows = state.data.iloc[lower:upper]
+        return rows if mask is None else rows[mask]
 
+    @traced()
     def get_reviews(self, start_date, end_date):
-        filtered = self.database[
-            (self.database['Review Date'] >= start_date) &
-            (self.database['Review Date'] <= end_date)
-        ]
-        return filtered
+        state = self.state
+        lower, upper = self._get_bounds(state, start_date, end_date)
+        return self._rows(state, lower, upper)
 
+    @traced()
     def get_reviews_by_sentiment(self, sentiment: str, start_date: pd.Timestamp, end_date: pd.Timestamp):
-        reviews_in_range = self.get_reviews(start_date, end_date)
-        return reviews_in_range[reviews_in_range['Sentiment'].str.lower() == sentiment.lower()]
+        state = self.state
+        lower, upper = self._get_bounds(state, start_date, end_date)
+        code = state.sentiment_index.get(sentiment.lower())
+        if code is None:
+            return state.data.iloc[0:0]
+        mask = state.sentiment_codes[lower:upper] == code
+        return self._rows(state, lower, upper, mask)
 
+    @traced()
+    def get_months(self, start_date, end_date) -> list[pd.Timestamp]:
+        """
+        Lists the months that have reviews in the date range, oldest first.
+        """
+        months, counts = self.state.cube.get_counts(start_date, end_date)
+        return [pd.Timestamp(month) for month, count in zip(months, counts.sum(axis=1)) if count > 0]
 
+    @traced()
+    def get_sentiment_counts_by_date(self, start_date, end_date) -> pd.DataFrame:
+        """
+        Counts reviews per month and sentiment in the date range, read from the sentiment cube.
+        """
+        state = self.state
+        months, counts = state.cube.get_counts(start_date, end_date)
+        has_reviews = counts.sum(axis=1) > 0
+        present = counts.sum(axis=0) > 0
+        sentiment_counts = pd.DataFrame(
+            counts[has_reviews][:, present],
+            index=pd.Index(pd.to_datetime(months[has_reviews]).date, name='Review Date'),
+            columns=pd.Index(np.array(state.sentiment_labels, dtype=object)[present], name='Sentiment'),
+        )
+        return sentiment_counts
+
+    @traced()
+    def get_total_sentiment_counts(self, start_date, end_date) -> pd.Series:
+        """
+        Totals each sentiment in the date range from the cube's prefix sums.
+        """
+        state = self.state
+        totals = pd.Series(
+            state.cube.get_totals(start_date, end_date),
+            index=pd.Index(state.sentiment_labels, name='Sentiment'),
+            name='count',
+        )
+        return totals[totals > 0].sort_values(ascending=False, kind='stable')
+
+    @property
+    def data_version(self):
+        """
+        Identifies this exact content: the source file signature plus the number of in-memory
+        updates since loading. None for databases built from a DataFrame.
+        """
+        return f"{self.signature}.{self.state.version}" if self.signature else None
+
+    def get_data_version(self, start_date, end_date):
+        """
+        Like data_version, but only changes when the reviews of months within the date range do,
+        so cached results for other ranges stay valid across appends.
+        """
+        if not self.signature:
+            return None
+        state = self.state
+        lower, upper = state.cube.get_month_bounds(start_date, end_date)
+        changed = [state.month_versions.get(str(month), 0) for month in state.cube.months[lower:upper]]
+        return f"{self.signature}.{state.base_version}.{max(changed, default=0)}"
+
+
+class ReviewDatabase(ReviewQueries):
+    @traced()
+    def __init__(self, file_path=DEFAULT_FILE_PATH, use_snapshot=True):
+        self.file_path = file_path
+        self.signature = get_source_signature(file_path)
+        # What the file looked like when loaded; the watcher moves these on as it appends the file's new rows
+        self.source_signature = self.signature
+        self.source_size = os.path.getsize(file_path)
+        self.state = None
+        self._row_hashes = None
+        self._append_lock = threading.Lock()
+
+        if use_snapshot and os.path.getsize(file_path) >= REVIEW_CHUNKED_MIN_BYTES:
+            self._set_data(open_review_store(file_path, self.signature))
+            return
+
+        dataset = load_snapshot(file_path, self.signature) if use_snapshot else None
+        from_snapshot = dataset is not None
+        if dataset is None:
+            dataset = load_reviews_csv(file_path)
+        self._set_data(dataset)
+        if use_snapshot and not from_snapshot:
+            save_snapshot(self.state.data, file_path, self.signature)
+
+    @classmethod
+    def from_dataframe(cls, dataset: pd.DataFrame):
+        """
+        Builds a database from an already cleaned DataFrame (e.g. synthetic data).
+        """
+        database = cls.__new__(cls)
+        database.file_path = None
+        database.signature = None
+        database.source_signature = None
+        database.source_size = 0
+        database.state = None
+        database._row_hashes = None
+        database._append_lock = threading.Lock()
+        database._set_data(dataset)
+        return database
+
+    @property
+    def version(self) -> int:
+        return self.state.version if self.state is not None else 0
+
+    @traced()
+    def _set_data(self, dataset: pd.DataFrame):
+        """
+        Sorts the reviews by date, precomputes the date, month and sentiment indexes and
+        publishes them as a new state. Outlet partitions are indexed when first asked for.
+        """
+        if not dataset['Review Date'].is_monotonic_increasing:
+            dataset = dataset.sort_values('Review Date', kind='stable')
+        uncategorized = [column for column in PARTITION_COLUMNS
+                         if column in dataset and not isinstance(dataset[column].dtype, pd.CategoricalDtype)]
+        if uncategorized:
+            dataset = dataset.astype({column: 'category' for column in uncategorized})
+        dates = dataset['Review Date'].to_numpy()
+
+        # Reviews not classified yet have no sentiment and get code -1
+        codes, labels = pd.factorize(dataset['Sentiment'].astype(object).str.lower(), sort=True)
+        codes = codes.astype(np.int8)
+        sentiment_index = {label: code for code, label in enumerate(labels)}
+        # Display labels keep the dataset's own casing, e.g. 'Positive'
+        labelled = codes >= 0
+        sentiment_labels = dataset['Sentiment'][labelled].groupby(codes[labelled]).first().tolist()
+
+        cube = SentimentCube()
+        cube.add(dates, codes)
+        version = self.version + 1
+        self.state = ReviewState(dataset, dates, codes, sentiment_index, sentiment_labels, cube, version, version)
+
+    @traced()
+    def _get_row_hashes(self) -> np.ndarray:
+        """
+        Sorted hashes of the raw rows loaded so far, for dropping appended duplicates. Computed on
+        the first append, from the ingested store or by hashing the source file as it was loaded.
+        """
+        if self._row_hashes is None:
+            hashes = np.array([], dtype=np.uint64)
+            if self.file_path is not None:
+                compact_path = os.path.join(get_store_path(self.file_path, self.signature), "compact.parquet")
+                if os.path.exists(compact_path):
+                    hashes = pd.read_parquet(compact_path, columns=['Row Hash'])['Row Hash'].to_numpy()
+                else:
+                    with open(self.file_path, 'rb') as file:
+                        hashes = get_row_hashes(pd.read_csv(io.BytesIO(file.read(self.source_size))).dropna())
+            self._row_hashes = np.unique(hashes)
+        return self._row_hashes
+
+    @traced()
+    def append_reviews(self, rows: pd.DataFrame) -> int:
+        """
+        Adds raw review rows, with the columns of the reviews CSV, after the load_reviews_csv
+        cleaning, except that rows without a Sentiment are kept as unlabelled reviews for
+        classify.classify_reviews to label; rows already in the database are dropped as
+        duplicates. New rows are merged into
+        the date order and given labels after the existing ones. The sentiment codes, month index
+        and cube are updated for the new rows only, and the months they fall in get a new version
+        so get_data_version changes for ranges that include them. Returns the number of rows added.
+        """
+        with self._append_lock:
+            rows = rows.dropna(subset=[column for column in rows.columns if column != 'Sentiment'])
+            hashes = get_row_hashes(rows)
+            seen = self._get_row_hashes()
+            keep = np.zeros(len(rows), dtype=bool)
+            keep[np.unique(hashes, return_index=True)[1]] = True
+            if len(seen):
+                keep &= seen[np.minimum(seen.searchsorted(hashes), len(seen) - 1)] != hashes
+            if not keep.any():
+                return 0
+            self._row_hashes = np.union1d(seen, hashes[keep])
+
+            new_rows = rows[keep].drop(columns=DROPPED_COLUMNS)
+            new_rows['Review Date'] = clean_review_dates(new_rows['Review Date'])
+            new_rows = new_rows.sort_values('Review Date', kind='stable')
+            data = self.state.data
+            start = int(data.index.max()) + 1 if len(data) else 0
+            new_rows.index = pd.RangeIndex(start, start + len(new_rows))
+            return self._merge_rows(new_rows)
+
+    def _merge_rows(self, new_rows: pd.DataFrame) -> int:
+        state = self.state
+        old = state.data
+        for column in old.columns:
+            if isinstance(old[column].dtype, pd.CategoricalDtype) and column in new_rows:
+                new_labels = sorted(set(new_rows[column].dropna()) - set(old[column].cat.categories))
+                if new_labels:
+                    old = old.assign(**{column: old[column].cat.add_categories(new_labels)})
+                new_rows[column] = new_rows[column].astype(old[column].dtype)
+        new_rows['Review'] = new_rows['Review'].astype(old['Review'].dtype)
+
+        # Rows go after existing rows of the same date, as the stable sort of a full reload puts them
+        new_dates = new_rows['Review Date'].to_numpy()
+        positions = state.dates.searchsorted(new_dates, side='right')
+        dataset = pd.concat([old, new_rows])
+        if len(positions) and positions[0] < len(state.dates):
+            dataset = dataset.iloc[np.insert(np.arange(len(old)), positions, np.arange(len(old), len(dataset)))]
+
+        lowered = new_rows['Sentiment'].astype(object).str.lower()
+        if not lowered.dropna().isin(state.sentiment_index.keys()).all():
+            # A sentiment never seen before changes every code; rebuild the indexes instead
+            self._set_data(dataset)
+            return len(new_rows)
+
+        # Unlabelled rows get code -1, like in _set_data
+        codes = lowered.map(state.sentiment_index).fillna(-1).to_numpy(np.int8)
+        new_months = np.unique(new_dates.astype('datetime64[M]'))
+        cube = copy.copy(state.cube)
+        cube.add(new_dates, codes)
+        version = state.version + 1
+        month_versions = dict(state.month_versions)
+        for month in new_months:
+            month_versions[str(month)] = version
+
+        self.state = ReviewState(
+            dataset, np.insert(state.dates, positions, new_dates), np.insert(state.sentiment_codes, positions, codes),
+            state.sentiment_index, state.sentiment_labels, cube, version, state.base_version, month_versions,
+        )
+        return len(new_rows)
+
+    def get_data(self):
+        return self.state.data
+
+    def _get_partition_positions(self, state: ReviewState, column: str, value: str) -> np.ndarray:
+        """
+        Row positions, in date order, of the reviews whose column equals value, ignoring case.
+        The rows are sorted by partition once per column; after that each lookup is a slice.
+        """
+        index = state.partition_index.get(column)
+        if index is None:
+            if column not in state.data:
+                return np.array([], dtype=np.intp)
+            values = state.data[column]
+            codes = values.cat.codes.to_numpy()
+            order = np.argsort(codes, kind='stable')
+            bounds = codes[order].searchsorted(np.arange(len(values.cat.categories) + 1))
+            lookup = {str(category).lower(): code for code, category in enumerate(values.cat.categories)}
+            index = state.partition_index[column] = (lookup, order, bounds)
+        lookup, order, bounds = index
+        code = lookup.get(value.strip().lower())
+        if code is None:
+            return np.array([], dtype=np.intp)
+        return order[bounds[code]:bounds[code + 1]]
+
+    @traced()
+    def get_partition(self, country: str = None, restaurant: str = None):
+        """
+        Returns the reviews of one restaurant and/or country as a ReviewPartition, which answers
+        the same queries as the database while touching only that outlet's rows. Without filters
+        the database itself is returned. Partitions are built on first use and reused until the
+        reviews change.
+        """
+        if not country and not restaurant:
+            return self
+        state = self.state
+        key = (country.strip().lower() if country else None, restaurant.strip().lower() if restaurant else None)
+        partition = state.partitions.get(key)
+        if partition is None:
+            positions = None
+            names = {}
+            for column, value in zip(PARTITION_COLUMNS, [country, restaurant]):
+                if value:
+                    column_positions = self._get_partition_positions(state, column, value)
+                    # Label the partition with the dataset's own spelling of the name
+                    names[column] = str(state.data[column].iloc[column_positions[0]]) if len(column_positions) else value
+                    positions = column_positions if positions is None else np.intersect1d(positions, column_positions, assume_unique=True)
+            partition = ReviewPartition(self, state, positions, names.get("Country"), names.get("Restaurant Name"))
+            state.partitions[key] = partition
+        return partition
+
+    def get_outlets(self) -> list[tuple[str, str]]:
+        """
+        Lists the (country, restaurant) pairs that have reviews.
+        """
+        state = self.state
+        if state.outlets is None:
+            if not all(column in state.data for column in PARTITION_COLUMNS):
+                return []
+            counts = state.data.groupby(PARTITION_COLUMNS, observed=True).size()
+            state.outlets = [outlet for outlet, count in counts.items() if count > 0]
+        return state.outlets
+
+    @traced()
+    def update_sentiments(self, labels: pd.Series):
+        """
+        Writes sentiment labels, indexed like the database rows, back into the database
+        and rebuilds the sentiment codes and cube. Raises KeyError for labels of rows the
+        database does not hold; new reviews are added with append_reviews.
+        """
+        with self._append_lock:
+            dataset = self.state.data.copy()
+            unknown = labels.index.difference(dataset.index)
+            if len(unknown):
+                raise KeyError(f"{len(unknown)} labels are for rows not in the database, e.g. {unknown[0]!r}")
+            if isinstance(dataset['Sentiment'].dtype, pd.CategoricalDtype):
+                new_labels = set(labels.dropna()) - set(dataset['Sentiment'].cat.categories)
+                dataset['Sentiment'] = dataset['Sentiment'].cat.add_categories(sorted(new_labels))
+            else:
+                # A column with no labels at all is read as floats
+                dataset['Sentiment'] = dataset['Sentiment'].astype(object)
+            dataset.loc[labels.index, 'Sentiment'] = labels
+            self._set_data(dataset)
+
+class ReviewPartition(ReviewQueries):
+    """
+    The reviews of one restaurant and/or country: positions of its rows in the database's date
+    order, with its own date index, sentiment codes and cube. Queries read only those rows.
+    It is a snapshot of one database state; get_partition builds a new one after the database changes.
+    """
+    def __init__(self, database: ReviewDatabase, state: ReviewState, positions: np.ndarray,
+                 country: str = None, restaurant: str = None):
+        self.parent = database
+        self.country = country
+        self.restaurant = restaurant
+        self.positions = positions
+        self.file_path = database.file_path
+        self.signature = database.signature
+        dates = state.dates[positions]
+        codes = state.sentiment_codes[positions]
+        cube = SentimentCube()
+        cube.add(dates, codes)
+        self.state = ReviewState(
+            state.data, dates, codes, state.sentiment_index, state.sentiment_labels, cube,
+            state.version, state.base_version, state.month_versions,
+        )
+        key = f"{country or ''}|{restaurant or ''}".lower()
+        self.key = hashlib.sha1(key.encode('utf-8')).hexdigest()[:8]
+
+    @property
+    def label(self) -> str:
+        return ", ".join(value for value in [self.restaurant, self.country] if value)
+
+    @property
+    def version(self) -> int:
+        return self.state.version
+
+    def __len__(self):
+        return len(self.positions)
+
+    def _rows(self, state: ReviewState, lower: int, upper: int, mask: np.ndarray = None) -> pd.DataFrame:
+        positions = self.positions[lower:upper]
+        return state.data.iloc[positions if mask is None else positions[mask]]
+
+    def get_data(self):
+        return self.state.data.iloc[self.positions]
+
+    @property
+    def data_version(self):
+        version = super().data_version
+        return f"{version}.{self.key}" if version else None
+
+    def get_data_version(self, start_date, end_date):
+        version = super().get_data_version(start_date, end_date)
+        return f"{version}.{self.key}" if version else None
+
+
+_database = None
+_database_lock = threading.Lock()
+
+
+def _is_current(database, file_path: str) -> bool:
+    return (
+        database is not None
+        and database.file_path == file_path
+        and database.source_signature == get_source_signature(file_path)
+    )
+
+
+@traced()
 def get_database() -> ReviewDatabase:
-    return ReviewDatabase()
\ No newline at end of file
+    """
+    Returns the process-wide ReviewDatabase, loading it on first use and reloading it only
+    when the source CSV has changed other than by the rows a watcher has appended. With
+    REVIEWS_WATCH_PATH set, new rows in that file or directory are appended as they arrive.
+    """
+    global _database
+    file_path = os.getenv("REVIEWS_CSV_PATH", DEFAULT_FILE_PATH)
+    database = _database
+    if _is_current(database, file_path):
+        return database
+
+    with _database_lock:
+        if not _is_current(_database, file_path):
+            _database = ReviewDatabase(file_path)
+            if REVIEWS_WATCH_PATH:
+                from review_watcher import start_watcher
+                start_watcher(_database, REVIEWS_WATCH_PATH)
+        return _database
@@ -0,0 +1,130 @@
+import re
+
+import pandas as pd
+
+MONTHS = {
+    name: number
+    for number, names in enumerate([
+        ("january", "jan"), ("february", "feb"), ("march", "mar"), ("april", "apr"), ("may",), ("june", "jun"),
+        ("july", "jul"), ("august", "aug"), ("september", "sept", "sep"), ("october", "oct"),
+        ("november", "nov"), ("december", "dec"),
+    ], 1)
+    for name in names
+}
+ORDINALS = {"first": 1, "1st": 1, "second": 2, "2nd": 2, "third": 3, "3rd": 3, "fourth": 4, "4th": 4, "last": 4}
+HALVES = {"first": 1, "1st": 1, "second": 2, "2nd": 2, "last": 2, "latter": 2}
+
+ISO_DATE_PATTERN = re.compile(r"\b(\d{4}-\d{1,2}-\d{1,2})\b")
+QUARTER_PATTERNS = [
+    re.compile(r"\bq([1-4])\s*(?:of\s+)?(\d{4})\b"),
+    re.compile(r"\b(first|1st|second|2nd|third|3rd|fourth|4th|last)\s+quarter\s+(?:of\s+)?(\d{4})\b"),
+    re.compile(r"\bquarter\s+([1-4])\s+(?:of\s+)?(\d{4})\b"),
+]
+HALF_PATTERNS = [
+    re.compile(r"\bh([12])\s*(?:of\s+)?(\d{4})\b"),
+    re.compile(r"\b(first|1st|second|2nd|last|latter)\s+half\s+(?:of\s+)?(\d{4})\b"),
+]
+MONTH_YEAR_PATTERN = re.compile(r"\b(" + "|".join(sorted(MONTHS, key=len, reverse=True)) + r")\.?\s+(\d{4})\b")
+YEAR_PATTERN = re.compile(r"\b((?:19|20)\d{2})\b")
+REVIEW_TEXT_PATTERN = re.compile(r"\breview\s*:\s*(.+)", re.IGNORECASE | re.DOTALL)
+
+CHART_KEYWORDS = [
+    ("line", ("trend", "over time", "monthly", "change")),
+    ("pie", ("distribution", "breakdown", "percentage", "composition")),
+    ("stacked_bar", ("stacked",)),
+]
+
+
+def _to_number(value: str, names: dict) -> int:
+    return int(value) if value.isdigit() else names[value]
+
+
+def _month_range(year: int, first_month: int, last_month: int):
+    start = pd.Timestamp(year, first_month, 1)
+    end = pd.Timestamp(year, last_month, 1) + pd.offsets.MonthEnd(0)
+    return start, end
+
+
+def parse_date_range(text: str):
+    """
+    Extracts a (start, end) pair of Timestamps from a request such as "from 2019-01-01 to 2019-06-30",
+    "Q3 2018", "the third quarter of 2018", "last half of 2018", "March 2019" or "the year 2019".
+    Returns None when no unambiguous range is found.
+    """
+    text = text.lower()
+
+    iso_dates = ISO_DATE_PATTERN.findall(text)
+    if len(iso_dates) == 2:
+        dates = pd.to_datetime(iso_dates, format="%Y-%m-%d", errors="coerce")
+        # Dates that do not exist, e.g. 2019-02-30, are left to the agent
+        if dates.isna().any():
+            return None
+        start, end = sorted(dates)
+        return start, end
+    if iso_dates:
+        return None
+
+    for pattern in QUARTER_PATTERNS:
+        match = pattern.search(text)
+        if match:
+            quarter = _to_number(match.group(1), ORDINALS)
+            return _month_range(int(match.group(2)), 3 * quarter - 2, 3 * quarter)
+
+    for pattern in HALF_PATTERNS:
+        match = pattern.search(text)
+        if match:
+            half = _to_number(match.group(1), HALVES)
+            return _month_range(int(match.group(2)), 6 * half - 5, 6 * half)
+
+    months = [(int(year), MONTHS[name]) for name, year in MONTH_YEAR_PATTERN.findall(text)]
+    if len(months) in (1, 2):
+        (start_year, start_month), (end_year, end_month) = sorted([months[0], months[-1]])
+        return pd.Timestamp(start_year, start_month, 1), pd.Timestamp(end_year, end_month, 1) + pd.offsets.MonthEnd(0)
+    if months:
+        return None
+
+    years = sorted({int(year) for year in YEAR_PATTERN.findall(text)})
+    if len(years) == 1 or (len(years) == 2 and re.search(r"\b(?:to|through|until|and|-)\b", text)):
+        return pd.Timestamp(years[0], 1, 1), pd.Timestamp(years[-1], 12, 31)
+    return None
+
+
+def parse_chart_type(text: str) -> str:
+    """
+    Picks a chart type with the same rules the plotting agent is prompted with.
+    """
+    text = text.lower()
+    for chart_type, keywords in CHART_KEYWORDS:
+        if any(keyword in text for keyword in keywords):
+            return chart_type
+    return "simple_bar"
+
+
+def parse_review_text(text: str):
+    """
+    Extracts the review from a request such as "Respond to this review: The food was cold."
+    Returns None when the review text is not clearly marked.
+    """
+    match = REVIEW_TEXT_PATTERN.search(text)
+    if match is None:
+        return None
+    review_text = match.group(1).strip().strip('"\'').strip()
+    return review_text or None
+
+
+def parse_outlet(text: str, outlets: list[tuple[str, str]]) -> dict:
+    """
+    Finds the restaurant or country a request names among the known (country, restaurant)
+    outlets, e.g. "Create a report for Mosaic for 2019". Returns the matching country and/or
+    restaurant keyword arguments, empty when the request names neither.
+    """
+    text = text.lower()
+
+    def mentions(name: str) -> bool:
+        return re.search(r"(?<!\w)" + re.escape(name.lower()) + r"(?!\w)", text) is not None
+
+    restaurants = [restaurant for _, restaurant in outlets if mentions(restaurant)]
+    if restaurants:
+        return {"restaurant": max(restaurants, key=len)}
+    countries = [country for country, _ in outlets if mentions(country)]
+    return {"country": max(countries, key=len)} if countries else {}
@@ -0,0 +1,344 @@
+import asyncio
+import hashlib
+import json
+import re
+import threading
+import time
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+import httpx
+from groq import RateLimitError
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, HumanMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+from pydantic import PrivateAttr
+
+from date_parser import parse_chart_type, parse_date_range, parse_review_text
+
+
+def default_responder(messages: list[dict]) -> str:
+    """
+    Produces a short deterministic bulleted answer derived from the user message.
+    """
+    user_text = messages[-1]["content"]
+    digest = hashlib.sha1(user_text.encode("utf-8")).hexdigest()[:8]
+    first_words = " ".join(user_text.split()[:6])
+    return f"- Theme {digest}: {first_words}"
+
+
+NEGATIVE_WORDS = ("cold", "rude", "slow", "bad", "terrible", "worst", "dirty", "disappoint", "overpriced")
+NUMBERED_REVIEW_PATTERN = re.compile(r'^(\d+)\.\s(.*)$', re.MULTILINE)
+
+
+def fake_sentiment(review_text: str) -> str:
+    return "Negative" if any(word in review_text.lower() for word in NEGATIVE_WORDS) else "Positive"
+
+
+def sentiment_responder(messages: list[dict]) -> str:
+    """
+    Answers sentiment prompts by keyword: one label for a single review, or one
+    '<number>: <label>' line per review for numbered multi-review prompts.
+    """
+    user_text = messages[-1]["content"]
+    numbered = NUMBERED_REVIEW_PATTERN.findall(user_text)
+    if "numbered" in messages[0]["content"] and numbered:
+        return "\n".join(f"{number}: {fake_sentiment(review)}" for number, review in numbered)
+    return fake_sentiment(user_text)
+
+
+def groq_responder(messages: list[dict]) -> str:
+    """
+    Answers sentiment prompts like sentiment_responder and every other prompt like default_responder.
+    """
+    if messages[0]["content"].startswith("You are a sentiment analysis expert"):
+        return sentiment_responder(messages)
+    return default_responder(messages)
+
+
+def fails_at(call: int, error_rate: float) -> bool:
+    """
+    Whether call number call (from 1) fails when error_rate of all calls fail. Failures are spread
+    evenly rather than drawn at random, so runs with the same settings fail the same calls.
+    """
+    return int(call * error_rate) > int((call - 1) * error_rate)
+
+
+def make_rate_limit_error() -> RateLimitError:
+    response = httpx.Response(
+        429,
+        headers={"retry-after": "0"},
+        request=httpx.Request("POST", "http://fake-groq.local/openai/v1/chat/completions"),
+    )
+    return RateLimitError("Rate limit reached", response=response, body=None)
+
+
+class _FakeCompletions:
+    def __init__(self, owner):
+        self.owner = owner
+
+    def create(self, messages, model=None, **kwargs):
+        return self.owner.create(messages, model=model, **kwargs)
+
+
+class FakeGroqClient:
+    """
+    Local stand-in for groq.Groq. Chat completions answer with responder(messages) after a fixed
+    latency plus, with tokens_per_second, the time to generate the answer's tokens. The first
+    rate_limited_calls calls and error_rate of all calls raise RateLimitError.
+    """
+    def __init__(self, latency: float = 0.05, responder=default_responder, rate_limited_calls: int = 0,
+                 tokens_per_second: float = 0, error_rate: float = 0):
+        self.latency = latency
+        self.responder = responder
+        self.rate_limited_calls = rate_limited_calls
+        self.tokens_per_second = tokens_per_second
+        self.error_rate = error_rate
+        self.calls = 0
+        self.errors = 0
+        self.max_in_flight = 0
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        self.chat = SimpleNamespace(completions=_FakeCompletions(self))
+
+    def create(self, messages, model=None, **kwargs):
+        with self._lock:
+            self.calls += 1
+            if self.calls <= self.rate_limited_calls or fails_at(self.calls, self.error_rate):
+                self.errors += 1
+                raise make_rate_limit_error()
+            self._in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self._in_flight)
+
+        try:
+            content = self.responder(messages)
+            completion_tokens = len(content.split())
+            time.sleep(self.latency + (completion_tokens / self.tokens_per_second if self.tokens_per_second else 0))
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+
+        prompt_tokens = sum(len(message["content"].split()) for message in messages)
+        return SimpleNamespace(
+            model=model,
+            choices=[SimpleNamespace(message=SimpleNamespace(role="assistant", content=content))],
+            usage=SimpleNamespace(
+                prompt_tokens=prompt_tokens,
+                completion_tokens=completion_tokens,
+                total_tokens=prompt_tokens + completion_tokens,
+            ),
+        )
+
+
+FAKE_REPLY = (
+    "Thank you so much for taking the time to share your experience with us. We are delighted to hear "
+    "that you enjoyed your meal and our service, and we look forward to welcoming you back to SteamNoodles soon."
+)
+
+
+class FakeStreamingChatModel(BaseChatModel):
+    """
+    Local stand-in for ChatGroq that streams reply word by word: it waits first_token_latency
+    before the first word and token_latency before each following one. Subclasses change the
+    answer, its chunks or the delays through _answer, _chunks and the _delay methods.
+    """
+    reply: str = FAKE_REPLY
+    first_token_latency: float = 0.2
+    token_latency: float = 0.02
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-streaming-chat"
+
+    def _first_token_delay(self) -> float:
+        return self.first_token_latency
+
+    def _token_delay(self) -> float:
+        return self.token_latency
+
+    def _answer(self, messages, **kwargs) -> AIMessage:
+        return AIMessage(content=self.reply)
+
+    def _chunks(self, message: AIMessage) -> list[AIMessageChunk]:
+        words = message.content.split(" ")
+        chunks = [AIMessageChunk(content=word if i == 0 else " " + word) for i, word in enumerate(words)]
+        chunks[-1].usage_metadata = message.usage_metadata
+        return chunks
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        message = self._answer(messages, **kwargs)
+        time.sleep(self._first_token_delay() + self._token_delay() * (len(self._chunks(message)) - 1))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        for i, chunk in enumerate(self._chunks(self._answer(messages, **kwargs))):
+            time.sleep(self._token_delay() if i else self._first_token_delay())
+            yield ChatGenerationChunk(message=chunk)
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        for i, chunk in enumerate(self._chunks(self._answer(messages, **kwargs))):
+            await asyncio.sleep(self._token_delay() if i else self._first_token_delay())
+            yield ChatGenerationChunk(message=chunk)
+
+
+def fake_tool_arguments(tool: dict, text: str) -> dict:
+    """
+    Required arguments for an OpenAI-format tool schema read from the user's request the way
+    direct dispatch reads them, standing in for the agent LLM's choice of arguments.
+    """
+    date_range = parse_date_range(text)
+    start_date, end_date = [date.strftime('%Y-%m-%d') for date in date_range] if date_range else ["2019-01-01", "2019-12-31"]
+    values = {
+        "start_date": start_date,
+        "end_date": end_date,
+        "chart_type": parse_chart_type(text),
+        "review_text": parse_review_text(text) or text,
+    }
+    parameters = tool["function"]["parameters"]
+    return {name: values.get(name, text) for name in parameters.get("required", parameters["properties"])}
+
+
+class FakeChatGroq(FakeStreamingChatModel):
+    """
+    Local stand-in for ChatGroq in main.py, for both the agents and the reply model. Bound to
+    tools, it calls the first one with arguments read from the request and then answers with the
+    tool's result; otherwise it answers with reply. Answers are timed and streamed like
+    FakeStreamingChatModel's, with latency before the first word and, with tokens_per_second,
+    the time to generate each further word. error_rate of all calls raise RateLimitError.
+    """
+    latency: float = 0.05
+    tokens_per_second: float = 0
+    error_rate: float = 0
+    _calls: int = PrivateAttr(default=0)
+    _errors: int = PrivateAttr(default=0)
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat-groq"
+
+    @property
+    def calls(self) -> int:
+        return self._calls
+
+    @property
+    def errors(self) -> int:
+        return self._errors
+
+    def bind_tools(self, tools, **kwargs):
+        return self.bind(tools=[convert_to_openai_tool(tool) for tool in tools], **kwargs)
+
+    def _first_token_delay(self) -> float:
+        return self.latency
+
+    def _token_delay(self) -> float:
+        return 1 / self.tokens_per_second if self.tokens_per_second else 0
+
+    def _answer(self, messages, tools=None, **kwargs) -> AIMessage:
+        with self._lock:
+            self._calls += 1
+            call = self._calls
+            if fails_at(call, self.error_rate):
+                self._errors += 1
+                raise make_rate_limit_error()
+        input_tokens = sum(len(str(message.content).split()) for message in messages)
+        if isinstance(messages[-1], ToolMessage):
+            message = AIMessage(content=messages[-1].content)
+        elif tools:
+            text = next((message.content for message in reversed(messages) if isinstance(message, HumanMessage)), "")
+            message = AIMessage(content="", tool_calls=[{
+                "name": tools[0]["function"]["name"],
+                "args": fake_tool_arguments(tools[0], text),
+                "id": f"call_{call}",
+            }])
+        else:
+            message = AIMessage(content=self.reply)
+        output_tokens = max(1, len(message.content.split()))
+        message.usage_metadata = {"input_tokens": input_tokens, "output_tokens": output_tokens,
+                                  "total_tokens": input_tokens + output_tokens}
+        return message
+
+    def _chunks(self, message: AIMessage) -> list[AIMessageChunk]:
+        if not message.tool_calls:
+            return super()._chunks(message)
+        call = message.tool_calls[0]
+        return [AIMessageChunk(content="", usage_metadata=message.usage_metadata, tool_call_chunks=[{
+            "name": call["name"], "args": json.dumps(call["args"]), "id": call["id"], "index": 0,
+        }])]
+
+
+@contextmanager
+def fake_agent_model(model):
+    """
+    Temporarily runs main.py's agents on model instead of ChatGroq.
+    """
+    import main
+
+    original = (main._agent_llm, main._agent_executors)
+    main._agent_llm = model
+    main._agent_executors = {}
+    try:
+        yield model
+    finally:
+        main._agent_llm, main._agent_executors = original
+
+
+@contextmanager
+def fake_response_model(model):
+    """
+    Temporarily makes main.py write customer replies with model instead of ChatGroq.
+    """
+    import main
+
+    original = main._response_model
+    main._response_model = model
+    try:
+        yield model
+    finally:
+        main._response_model = original
+
+
+@contextmanager
+def fake_groq(client, cache=None, theme_store=None, local_classifier=None):
+    """
+    Temporarily routes the Groq calls in tools.py to client. The LLM response cache, the
+    monthly theme store and the local sentiment classifier are replaced by cache, theme_store
+    and local_classifier, or disabled when they are None.
+    """
+    import llm_cache
+    import local_classifier as classifiers
+    import theme_store as themes
+    import tools
+
+    original = (
+        tools._client, llm_cache._cache, llm_cache.LLM_CACHE_ENABLED, themes._store, themes.THEME_STORE_ENABLED,
+        classifiers._pinned_classifier, classifiers.LOCAL_CLASSIFIER_ENABLED,
+    )
+    tools._client = client
+    llm_cache._cache = cache
+    llm_cache.LLM_CACHE_ENABLED = cache is not None
+    themes._store = theme_store
+    themes.THEME_STORE_ENABLED = theme_store is not None
+    classifiers.set_local_classifier(local_classifier)
+    classifiers.LOCAL_CLASSIFIER_ENABLED = local_classifier is not None
+    try:
+        yield client
+    finally:
+        (tools._client, llm_cache._cache, llm_cache.LLM_CACHE_ENABLED, themes._store, themes.THEME_STORE_ENABLED,
+         classifiers._pinned_classifier, classifiers.LOCAL_CLASSIFIER_ENABLED) = original
+
+
+@contextmanager
+def fake_groq_backend(latency: float = 0.05, tokens_per_second: float = 0, error_rate: float = 0,
+                      responder=groq_responder):
+    """
+    Routes every Groq call of the workflow to local fakes with the same latency, token throughput
+    and error rate: tools.py's client, the agents and the reply model. Caches, the theme store
+    and the local classifier are disabled as in fake_groq. Yields the client and the chat model.
+    """
+    client = FakeGroqClient(latency=latency, responder=responder, tokens_per_second=tokens_per_second,
+                            error_rate=error_rate)
+    model = FakeChatGroq(latency=latency, tokens_per_second=tokens_per_second, error_rate=error_rate)
+    with fake_groq(client), fake_agent_model(model), fake_response_model(model):
+        yield client, model
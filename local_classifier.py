@@ -0,0 +1,194 @@
+import os
+import re
+import threading
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+from data import get_database
+
+LOCAL_CLASSIFIER_ENABLED = os.getenv("LOCAL_CLASSIFIER_ENABLED", "1") != "0"
+LOCAL_CLASSIFIER_THRESHOLD = float(os.getenv("LOCAL_CLASSIFIER_THRESHOLD", "0.9"))
+# Labelled reviews a model is trained on; larger databases are sampled so their texts are not all loaded
+LOCAL_CLASSIFIER_MAX_TRAINING_ROWS = int(os.getenv("LOCAL_CLASSIFIER_MAX_TRAINING_ROWS", "50000"))
+# Retrain once the number of labelled reviews has changed by this fraction since training
+LOCAL_CLASSIFIER_RETRAIN_FRACTION = float(os.getenv("LOCAL_CLASSIFIER_RETRAIN_FRACTION", "0.1"))
+TOKEN_PATTERN = re.compile(r"[^\W\d_]{2,}")
+
+
+def tokenize(text: str) -> list[str]:
+    """
+    Lower-cased word unigrams and bigrams; works for any alphabet.
+    """
+    words = TOKEN_PATTERN.findall(text.lower())
+    return words + [f"{first} {second}" for first, second in zip(words, words[1:])]
+
+
+class LocalSentimentClassifier:
+    """
+    CPU-only sentiment model: TF-IDF weighted multinomial Naive Bayes, i.e. a linear model over
+    TF-IDF features. Training is a single vectorized pass and predicting one review takes microseconds.
+    Document vectors are L2-normalized so long reviews do not saturate the confidence.
+    """
+    def __init__(self, min_df: int = 2, alpha: float = 0.1):
+        self.min_df = min_df
+        self.alpha = alpha
+        self.vocabulary = {}
+        self.idf = np.zeros(0)
+        self.classes = np.array([], dtype=object)
+        self.class_log_prior = np.zeros(0)
+        self.feature_log_prob = np.zeros((0, 0))
+
+    def _vectorize(self, text: str):
+        counts = Counter(token for token in tokenize(text) if token in self.vocabulary)
+        ids = np.fromiter((self.vocabulary[token] for token in counts), dtype=np.int64, count=len(counts))
+        term_frequency = 1 + np.log(np.fromiter(counts.values(), dtype=np.float64, count=len(counts)))
+        values = term_frequency * self.idf[ids]
+        norm = np.linalg.norm(values)
+        return ids, values / norm if norm else values
+
+    def fit(self, texts: list[str], labels: list[str]):
+        documents = [set(tokenize(text)) for text in texts]
+        document_frequency = Counter(token for document in documents for token in document)
+        kept = sorted(token for token, count in document_frequency.items() if count >= self.min_df)
+        self.vocabulary = {token: i for i, token in enumerate(kept)}
+        frequencies = np.array([document_frequency[token] for token in kept], dtype=np.float64)
+        self.idf = np.log((1 + len(texts)) / (1 + frequencies)) + 1
+
+        self.classes, targets = np.unique(np.asarray(labels, dtype=object), return_inverse=True)
+        weights = np.zeros((len(self.classes), len(self.vocabulary)))
+        for text, target in zip(texts, targets):
+            ids, values = self._vectorize(text)
+            weights[target, ids] += values
+
+        smoothed = weights + self.alpha
+        self.feature_log_prob = np.log(smoothed) - np.log(smoothed.sum(axis=1, keepdims=True))
+        self.class_log_prior = np.log(np.bincount(targets) / len(targets))
+        return self
+
+    def predict(self, text: str) -> tuple[str, float]:
+        """
+        Returns the most likely of the labels seen in training and its posterior probability, or
+        None with confidence 0 when the text has no word seen in training, which would leave only
+        the class prior.
+        """
+        ids, values = self._vectorize(text)
+        if not len(ids):
+            return None, 0.0
+        scores = self.class_log_prior + self.feature_log_prob[:, ids] @ values
+        probabilities = np.exp(scores - scores.max())
+        probabilities /= probabilities.sum()
+        best = int(probabilities.argmax())
+        return self.classes[best], float(probabilities[best])
+
+    def predict_many(self, texts: list[str]) -> tuple[list[str], np.ndarray]:
+        predictions = [self.predict(text) for text in texts]
+        return [label for label, _ in predictions], np.array([confidence for _, confidence in predictions])
+
+
+_classifier = None
+_trained_database = None
+_trained_rows = 0
+_training_thread = None
+_classifier_lock = threading.Lock()
+_pinned_classifier = None
+
+
+def set_local_classifier(classifier):
+    """
+    Uses the given classifier instead of one trained on the shared database (None to undo).
+    """
+    global _pinned_classifier
+    _pinned_classifier = classifier
+
+
+def count_labelled_reviews(database) -> int:
+    return int(database.get_total_sentiment_counts(pd.Timestamp.min, pd.Timestamp.max).sum())
+
+
+def train_local_classifier(database, max_rows: int = None) -> LocalSentimentClassifier:
+    """
+    Trains on the labelled reviews of the database, or a fixed random sample of max_rows of them,
+    so only the sampled texts of a chunked store are read.
+    """
+    max_rows = LOCAL_CLASSIFIER_MAX_TRAINING_ROWS if max_rows is None else max_rows
+    dataset = database.get_data()
+    labelled = np.flatnonzero(dataset['Sentiment'].notna().to_numpy())
+    if len(labelled) > max_rows:
+        labelled = np.sort(np.random.default_rng(0).choice(labelled, max_rows, replace=False))
+    dataset = dataset.iloc[labelled]
+    return LocalSentimentClassifier().fit(dataset['Review'].tolist(), dataset['Sentiment'].astype(str).tolist())
+
+
+def _train():
+    global _classifier, _trained_database, _trained_rows
+    try:
+        database = get_database()
+        rows = count_labelled_reviews(database)
+        classifier = train_local_classifier(database)
+        with _classifier_lock:
+            _classifier, _trained_database, _trained_rows = classifier, database, rows
+    except Exception as e:
+        print(f"Error training local sentiment classifier: {e}")
+
+
+def _start_training():
+    global _training_thread
+    with _classifier_lock:
+        if _training_thread is not None and _training_thread.is_alive():
+            return
+        _training_thread = threading.Thread(target=_train, name="local-classifier-training", daemon=True)
+        _training_thread.start()
+
+
+def get_local_classifier():
+    """
+    Returns the classifier trained on the labelled reviews of the shared ReviewDatabase.
+    Training runs on a background thread, so this returns None until the first model is
+    ready, and the current model keeps answering while a new one is trained after the
+    database is reloaded or its labelled reviews change by LOCAL_CLASSIFIER_RETRAIN_FRACTION.
+    Returns None when disabled.
+    """
+    if not LOCAL_CLASSIFIER_ENABLED:
+        return None
+    if _pinned_classifier is not None:
+        return _pinned_classifier
+    classifier = _classifier
+    if classifier is None:
+        _start_training()
+        return None
+    try:
+        database = get_database()
+        if database is not _trained_database or \
+                abs(count_labelled_reviews(database) - _trained_rows) >= max(1, _trained_rows * LOCAL_CLASSIFIER_RETRAIN_FRACTION):
+            _start_training()
+    except Exception as e:
+        print(f"Error checking local sentiment classifier: {e}")
+    return classifier
+
+
+def classify_locally(review_text: str, threshold: float = None):
+    """
+    Returns the local model's label when it is at least threshold confident, otherwise None
+    so the caller can escalate the review to the LLM.
+    """
+    classifier = get_local_classifier()
+    if classifier is None:
+        return None
+    label, confidence = classifier.predict(review_text)
+    if label is None:
+        return None
+    return label if confidence >= (LOCAL_CLASSIFIER_THRESHOLD if threshold is None else threshold) else None
+
+
+def classify_many_locally(texts: list[str], threshold: float = None) -> list:
+    """
+    Like classify_locally for many reviews: a label per review, or None where it must be escalated.
+    """
+    classifier = get_local_classifier()
+    if classifier is None:
+        return [None] * len(texts)
+    threshold = LOCAL_CLASSIFIER_THRESHOLD if threshold is None else threshold
+    labels, confidences = classifier.predict_many(texts)
+    return [label if label is not None and confidence >= threshold else None for label, confidence in zip(labels, confidences)]
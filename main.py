@@ -1,34 +1,121 @@
 import os
+import asyncio
+import json
+import operator
+import threading
+import time
 from dotenv import load_dotenv
 import pandas as pd
-from typing import TypedDict
+from typing import Annotated, Optional, TypedDict
 
-from langchain_groq import ChatGroq
+from langchain_core.caches import BaseCache
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration
 from langchain_core.prompts import ChatPromptTemplate
-from langchain.agents import create_tool_calling_agent, AgentExecutor
+from langchain_core.runnables import RunnableLambda
 from langchain_core.tools import tool
 from langgraph.graph import StateGraph, END
 
+from charts import CHART_PREFIXES, CHART_TYPES, get_sentiment_charts, save_png
 from data import get_database
+from date_parser import parse_chart_type, parse_date_range, parse_outlet, parse_review_text
 
 from tools import (
     generate_recommendations_report, 
-    plot_pie_chart, 
-    plot_line_chart, 
-    plot_stacked_bar_chart, 
-    plot_simple_bar_chart,
     analyze_sentiment,
-    save_report_as_pdf
 )
-from data import ReviewDatabase
+from llm_cache import get_llm_cache, make_cache_key
+from report_pdf import get_pdf_exporter
+from tracing import current_span, is_enabled, span, traced
 
 load_dotenv()
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
+# Call the tool straight away when the dates can be parsed locally, skipping the agent's LLM hop
+DIRECT_DISPATCH = os.getenv("DIRECT_DISPATCH", "1") != "0"
+# Tag on the reply model's runs so streamed reply tokens can be told apart from agent LLM calls
+FEEDBACK_STREAM_TAG = "feedback_reply"
+
+
+class GroqResponseCache(BaseCache):
+    """
+    Lets LangChain chat models share the on-disk LLM response cache used by tools.py.
+    """
+    def lookup(self, prompt, llm_string):
+        cache = get_llm_cache()
+        value = cache.get(make_cache_key(llm_string, prompt)) if cache is not None else None
+        if value is None:
+            return None
+        current_span().set("llm.cache_hits", 1)
+        return [ChatGeneration(message=AIMessage(content=text)) for text in json.loads(value)]
+
+    def update(self, prompt, llm_string, return_val):
+        cache = get_llm_cache()
+        if cache is not None:
+            cache.set(make_cache_key(llm_string, prompt), json.dumps([generation.text for generation in return_val]))
+
+    def clear(self, **kwargs):
+        cache = get_llm_cache()
+        if cache is not None:
+            cache.clear()
+
+
+response_cache = GroqResponseCache()
+
+
+class TracingCallbackHandler(BaseCallbackHandler):
+    """
+    Records the chat model calls of the agents and the reply model as llm.chat spans with their
+    token usage. The span is current while the call runs, so a reply served from response_cache
+    is counted as a cache hit on it.
+    """
+    run_inline = True
+
+    def __init__(self):
+        self._spans = {}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        if is_enabled():
+            params = kwargs.get("invocation_params") or {}
+            llm_span = span("llm.chat", **{"llm.model": str(params.get("model_name") or params.get("model"))})
+            self._spans[run_id] = llm_span.__enter__()
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        llm_span = self._spans.pop(run_id, None)
+        if llm_span is None:
+            return
+        if "llm.cache_hits" not in llm_span.attributes:
+            llm_span.set("llm.calls", 1)
+            usage = (response.llm_output or {}).get("token_usage") or {}
+            message = getattr(response.generations[0][0], "message", None) if response.generations and response.generations[0] else None
+            metadata = getattr(message, "usage_metadata", None) or {}
+            prompt_tokens = usage.get("prompt_tokens", metadata.get("input_tokens"))
+            completion_tokens = usage.get("completion_tokens", metadata.get("output_tokens"))
+            if prompt_tokens is not None:
+                llm_span.set("llm.prompt_tokens", int(prompt_tokens))
+            if completion_tokens is not None:
+                llm_span.set("llm.completion_tokens", int(completion_tokens))
+        llm_span.__exit__(None, None, None)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        llm_span = self._spans.pop(run_id, None)
+        if llm_span is not None:
+            llm_span.__exit__(type(error), error, None)
+
+
+tracing_callbacks = [TracingCallbackHandler()]
 
 #The Tools
 
+def get_outlet_database(restaurant: str = None, country: str = None):
+    """
+    The review database, narrowed to one restaurant and/or country when either is given.
+    """
+    return get_database().get_partition(country=country, restaurant=restaurant)
+
+
 @tool(return_direct=True)
-def get_recommendations_report(start_date:str,end_date:str)->str:
+def get_recommendations_report(start_date:str,end_date:str, restaurant: Optional[str] = None, country: Optional[str] = None)->str:
     """
     Generates a full strategic report with recommendations for a specific date range.
     The report analyzes sentiment trends and key positive/negative themes from reviews.
@@ -36,18 +123,21 @@ def get_recommendations_report(start_date:str,end_date:str)->str:
     Args:
         start_date (str): The start date for the analysis in 'YYYY-MM-DD' format.
         end_date (str): The end date for the analysis in 'YYYY-MM-DD' format.
+        restaurant (str, optional): Only analyze the reviews of the restaurant with this name.
+        country (str, optional): Only analyze the reviews of restaurants in this country.
         
     Returns:
-        str: A professional-style report with strategic recommendations.
+        str: A professional-style report with strategic recommendations, ending with the path of its PDF.
     """
-    database = get_database()
+    database = get_outlet_database(restaurant, country)
     start_date = pd.to_datetime(start_date)
     end_date = pd.to_datetime(end_date)
     report = generate_recommendations_report(database, start_date, end_date)
     return report
 
 @tool
-def get_sentiment_visualization(chart_type: str, start_date: str, end_date: str) -> str:
+def get_sentiment_visualization(chart_type: str, start_date: str, end_date: str, restaurant: Optional[str] = None,
+                                country: Optional[str] = None) -> str:
     """
     Generates a visual chart showing sentiment trends over a date range.
     
@@ -56,25 +146,39 @@ def get_sentiment_visualization(chart_type: str, start_date: str, end_date: str)
                           'stacked_bar', or 'simple_bar'.
         start_date (str): The start date for the analysis in 'YYYY-MM-DD' format.
         end_date (str): The end date for the analysis in 'YYYY-MM-DD' format.
+        restaurant (str, optional): Only chart the reviews of the restaurant with this name.
+        country (str, optional): Only chart the reviews of restaurants in this country.
         
     Returns:
         str: The path to the saved image file.
     """
-    database = get_database()
+    if chart_type not in CHART_TYPES:
+        return "Invalid chart type specified. Please choose from 'pie', 'line', 'stacked_bar', or 'simple_bar'."
+    database = get_outlet_database(restaurant, country)
+    if (restaurant or country) and not len(database):
+        return f"No reviews found for {restaurant or country}."
     start_ts = pd.to_datetime(start_date)
     end_ts = pd.to_datetime(end_date)
-    reviews_df = database.get_reviews(start_ts, end_ts)
-
-    if chart_type == 'pie':
-        return plot_pie_chart(reviews_df)
-    elif chart_type == 'line':
-        return plot_line_chart(reviews_df)
-    elif chart_type == 'stacked_bar':
-        return plot_stacked_bar_chart(reviews_df)
-    elif chart_type == 'simple_bar':
-        return plot_simple_bar_chart(reviews_df)
-    else:
-        return "Invalid chart type specified. Please choose from 'pie', 'line', 'stacked_bar', or 'simple_bar'."
+    charts = get_sentiment_charts(database, [chart_type], start_ts, end_ts)
+    return save_png(charts[chart_type], prefix=CHART_PREFIXES[chart_type])
+
+
+feedback_response_prompt = ChatPromptTemplate.from_messages([
+    ("system", "You are a customer service representative for SteamNoodles. Your task is to generate a short, polite, and context-aware response to a customer review. The review has a sentiment of: {sentiment}."),
+    ("user", "Review: {review_text}\nResponse:")
+])
+_response_model = None
+
+
+def get_response_model():
+    """
+    Chat model that writes customer replies, created on first use and shared afterwards.
+    """
+    global _response_model
+    if _response_model is None:
+        from langchain_groq import ChatGroq
+        _response_model = ChatGroq(model="llama-3.1-8b-instant", cache=response_cache, callbacks=tracing_callbacks)
+    return _response_model
 
 
 @tool
@@ -88,12 +192,14 @@ def generate_feedback_response(review_text: str) -> str:
         A polite, context-aware customer service response
     """
     sentiment = analyze_sentiment(review_text)
-    response_prompt = ChatPromptTemplate.from_messages([
-        ("system", "You are a customer service representative for SteamNoodles. Your task is to generate a short, polite, and context-aware response to a customer review. The review has a sentiment of: {sentiment}."),
-        ("user", "Review: {review_text}\nResponse:")
-    ])
+    return write_feedback_response(review_text, sentiment)
 
-    response_chain = response_prompt | ChatGroq(model="llama-3.1-8b-instant")
+
+def write_feedback_response(review_text: str, sentiment: str) -> str:
+    """
+    Writes the reply to a review whose sentiment is already known.
+    """
+    response_chain = feedback_response_prompt | get_response_model()
     result = response_chain.invoke({
         "sentiment": sentiment,
         "review_text": review_text
@@ -111,15 +217,17 @@ def save_report_to_pdf(report: str, file_name: str) -> str:
     Returns:
         str: Confirmation message with the saved file path
     """
-    return save_report_as_pdf(report, file_name)
+    job = get_pdf_exporter().submit(report, prefix=os.path.splitext(os.path.basename(file_name))[0] or "report")
+    return f"Report is being saved to {job.path}"
 
 #The Memory
 class AgentState(TypedDict):
     input: str
     agent_outcome: str
+    dispatch: str
+    node_latency: Annotated[dict, operator.or_]
 
 #The Agent and their reasoning loops
-llm = ChatGroq(model="llama-3.1-8b-instant", api_key=GROQ_API_KEY,temperature=0)
 
 #Strategic Recommendation Agent
 tools_rec = [get_recommendations_report]
@@ -133,8 +241,6 @@ prompt_rec = ChatPromptTemplate.from_messages([
     ("user", "{input}"),
     ("placeholder", "{agent_scratchpad}")
 ])
-agent_rec = create_tool_calling_agent(llm,tools_rec, prompt_rec)
-agent_executor_rec = AgentExecutor(agent=agent_rec, tools=tools_rec, verbose=True)
 
 #Sentiment Visualization Agent
 tools_plot = [get_sentiment_visualization]
@@ -152,8 +258,6 @@ prompt_plot = ChatPromptTemplate.from_messages([
     ("user", "{input}"),
     ("placeholder", "{agent_scratchpad}"),
 ])
-agent_plot = create_tool_calling_agent(llm,tools_plot, prompt_plot)
-agent_executor_plot = AgentExecutor(agent=agent_plot, tools=tools_plot, verbose=True)
 
 #Feedback Response Agent
 tools_feedback = [generate_feedback_response]
@@ -162,23 +266,136 @@ prompt_feedback = ChatPromptTemplate.from_messages([
     ("user", "{input}"),
     ("placeholder", "{agent_scratchpad}"),
 ])
-agent_feedback = create_tool_calling_agent(llm,tools_feedback, prompt_feedback)
-agent_executor_feedback = AgentExecutor(agent=agent_feedback, tools=tools_feedback, verbose=True)
+
+AGENTS = {
+    "strategic_recommendations": (tools_rec, prompt_rec),
+    "sentiment_plotting": (tools_plot, prompt_plot),
+    "feedback_response": (tools_feedback, prompt_feedback),
+}
+_agent_llm = None
+_agent_executors = {}
+_agent_lock = threading.Lock()
+
+
+def get_agent_llm():
+    """
+    Chat model the agents reason with, created on first use and shared afterwards.
+    """
+    global _agent_llm
+    if _agent_llm is None:
+        from langchain_groq import ChatGroq
+        _agent_llm = ChatGroq(model="llama-3.1-8b-instant", api_key=GROQ_API_KEY, temperature=0, callbacks=tracing_callbacks)
+    return _agent_llm
+
+
+def get_agent_executor(route: str):
+    """
+    Agent and reasoning loop of a route, built the first time a request of that route needs
+    one. Requests that direct dispatch sends straight to a tool never build them.
+    """
+    executor = _agent_executors.get(route)
+    if executor is None:
+        with _agent_lock:
+            executor = _agent_executors.get(route)
+            if executor is None:
+                from langchain.agents import AgentExecutor, create_tool_calling_agent
+                agent_tools, prompt = AGENTS[route]
+                agent = create_tool_calling_agent(get_agent_llm(), agent_tools, prompt)
+                executor = _agent_executors[route] = AgentExecutor(agent=agent, tools=agent_tools, verbose=True)
+    return executor
 
 #Nodes functions to execute each agent
+@traced("node.strategic_recommendations")
 def strategic_recommendation_node(state):
-    result = agent_executor_rec.invoke({"input": state["input"]})
-    agent_output = result.get("output") or result.get("return_values", {}).get("output") or str(result)
-    return {"agent_outcome": agent_output}
+    start = time.perf_counter()
+    date_range = parse_date_range(state["input"]) if DIRECT_DISPATCH else None
+    if date_range is not None:
+        start_date, end_date = date_range
+        agent_output = get_recommendations_report.invoke({
+            "start_date": start_date.strftime('%Y-%m-%d'),
+            "end_date": end_date.strftime('%Y-%m-%d'),
+            **parse_outlet(state["input"], get_database().get_outlets()),
+        })
+        dispatch = "direct"
+    else:
+        result = get_agent_executor("strategic_recommendations").invoke({"input": state["input"]})
+        agent_output = result.get("output") or result.get("return_values", {}).get("output") or str(result)
+        dispatch = "agent"
+    return {
+        "agent_outcome": agent_output,
+        "dispatch": dispatch,
+        "node_latency": {"strategic_recommendations": time.perf_counter() - start},
+    }
 
 
+@traced("node.sentiment_plotting")
 def sentiment_plotting_node(state):
-    result = agent_executor_plot.invoke({"input": state["input"]})
-    return {"agent_outcome":result["output"]}
+    start = time.perf_counter()
+    date_range = parse_date_range(state["input"]) if DIRECT_DISPATCH else None
+    if date_range is not None:
+        start_date, end_date = date_range
+        agent_output = get_sentiment_visualization.invoke({
+            "chart_type": parse_chart_type(state["input"]),
+            "start_date": start_date.strftime('%Y-%m-%d'),
+            "end_date": end_date.strftime('%Y-%m-%d'),
+            **parse_outlet(state["input"], get_database().get_outlets()),
+        })
+        dispatch = "direct"
+    else:
+        result = get_agent_executor("sentiment_plotting").invoke({"input": state["input"]})
+        agent_output = result["output"]
+        dispatch = "agent"
+    return {
+        "agent_outcome": agent_output,
+        "dispatch": dispatch,
+        "node_latency": {"sentiment_plotting": time.perf_counter() - start},
+    }
 
+@traced("node.feedback_response")
 def feedback_response_node(state):
-    result = agent_executor_feedback.invoke({"input": state["input"]})
-    return {"agent_outcome":result["output"]}
+    start = time.perf_counter()
+    review_text = parse_review_text(state["input"]) if DIRECT_DISPATCH else None
+    if review_text is not None:
+        agent_output = generate_feedback_response.invoke({"review_text": review_text})
+        dispatch = "direct"
+    else:
+        result = get_agent_executor("feedback_response").invoke({"input": state["input"]})
+        agent_output = result["output"]
+        dispatch = "agent"
+    return {
+        "agent_outcome": agent_output,
+        "dispatch": dispatch,
+        "node_latency": {"feedback_response": time.perf_counter() - start},
+    }
+
+
+@traced("node.feedback_response")
+async def afeedback_response_node(state):
+    """
+    Async version of feedback_response_node used by ainvoke and astream. On the direct path the
+    sentiment is classified in a worker thread while the reply chain is prepared, and the reply is
+    generated with astream so its tokens reach app.astream(stream_mode="messages") as they arrive.
+    """
+    start = time.perf_counter()
+    review_text = parse_review_text(state["input"]) if DIRECT_DISPATCH else None
+    if review_text is not None:
+        sentiment_task = asyncio.create_task(asyncio.to_thread(analyze_sentiment, review_text))
+        response_chain = (feedback_response_prompt | get_response_model()).with_config(tags=[FEEDBACK_STREAM_TAG])
+        sentiment = await sentiment_task
+        chunks = []
+        async for chunk in response_chain.astream({"sentiment": sentiment, "review_text": review_text}):
+            chunks.append(chunk.content)
+        agent_output = "".join(chunks)
+        dispatch = "direct"
+    else:
+        result = await get_agent_executor("feedback_response").ainvoke({"input": state["input"]})
+        agent_output = result["output"]
+        dispatch = "agent"
+    return {
+        "agent_outcome": agent_output,
+        "dispatch": dispatch,
+        "node_latency": {"feedback_response": time.perf_counter() - start},
+    }
 
 
 #Orchestration
@@ -194,11 +411,16 @@ def route_request(state):
         return "sentiment_plotting" 
     
 
+@traced("node.router")
+def router_node(state):
+    return {"input": state["input"]}
+
+
 workflow = StateGraph(AgentState)
-workflow.add_node("router",lambda state: {"input": state["input"]})
+workflow.add_node("router",router_node)
 workflow.add_node("strategic_recommendations",strategic_recommendation_node)
 workflow.add_node("sentiment_plotting",sentiment_plotting_node)
-workflow.add_node("feedback_response",feedback_response_node)
+workflow.add_node("feedback_response",RunnableLambda(feedback_response_node, afunc=afeedback_response_node))
 
 workflow.set_entry_point("router")
 workflow.add_conditional_edges(
@@ -218,3 +440,19 @@ workflow.add_edge("feedback_response",END)
 app = workflow.compile()
 
 
+async def astream_response(prompt: str):
+    """
+    Runs one request through the workflow and yields the answer text as it is produced.
+    Direct feedback replies arrive token by token; other answers arrive whole once their node finishes.
+    """
+    streamed = False
+    async for mode, payload in app.astream({"input": prompt}, stream_mode=["messages", "updates"]):
+        if mode == "messages":
+            chunk, metadata = payload
+            if FEEDBACK_STREAM_TAG in metadata.get("tags", []) and chunk.content:
+                streamed = True
+                yield chunk.content
+        elif not streamed:
+            for update in payload.values():
+                if update and update.get("agent_outcome"):
+                    yield update["agent_outcome"]
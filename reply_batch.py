@@ -0,0 +1,187 @@
+import argparse
+import json
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import pandas as pd
+
+from classify import classify_review_texts
+from token_budget import get_dedupe_key
+from tools import SENTIMENT_LABELS
+
+REPLY_MAX_CONCURRENCY = int(os.getenv("REPLY_MAX_CONCURRENCY", "8"))
+REPLY_CHUNK_SIZE = int(os.getenv("REPLY_CHUNK_SIZE", "500"))
+
+
+def _normalize_sentiment(value):
+    if isinstance(value, str):
+        for label in SENTIMENT_LABELS:
+            if value.strip().lower() == label.lower():
+                return label
+    return None
+
+
+def read_review_file(path: str):
+    """
+    Yields {"id", "review", "sentiment"} records from a CSV with a 'Review' column (and optionally
+    'Sentiment' and 'id') or from a JSONL file of objects with a "review" field. Rows without an
+    id are numbered by their position in the file.
+    """
+    if path.endswith(".jsonl"):
+        with open(path, encoding="utf-8") as file:
+            for number, line in enumerate(file):
+                if not line.strip():
+                    continue
+                row = json.loads(line)
+                yield {
+                    "id": str(row.get("id", number)),
+                    "review": str(row.get("review", row.get("Review", ""))),
+                    "sentiment": _normalize_sentiment(row.get("sentiment", row.get("Sentiment"))),
+                }
+        return
+
+    for chunk in pd.read_csv(path, chunksize=REPLY_CHUNK_SIZE):
+        for number, row in chunk.iterrows():
+            yield {
+                "id": str(row["id"]) if "id" in chunk.columns else str(number),
+                "review": str(row["Review"]),
+                "sentiment": _normalize_sentiment(row.get("Sentiment")),
+            }
+
+
+def read_database_range(database: object, start_date, end_date):
+    """
+    Yields the records of the reviews in a ReviewDatabase date range, identified by their row label.
+    """
+    reviews = database.get_reviews(pd.to_datetime(start_date), pd.to_datetime(end_date))
+    for label, review, sentiment in zip(reviews.index, reviews['Review'], reviews['Sentiment']):
+        yield {"id": str(label), "review": str(review), "sentiment": _normalize_sentiment(sentiment)}
+
+
+def load_checkpoint(output_path: str) -> dict:
+    """
+    Reads the replies already written to output_path, keyed by record id. A line cut off by a
+    crash is removed so the job can append after the last complete reply.
+    """
+    done = {}
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, "rb+") as file:
+        valid_size = 0
+        for line in file:
+            if not line.endswith(b"\n"):
+                break
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                break
+            done[record["id"]] = record
+            valid_size += len(line)
+        file.truncate(valid_size)
+    return done
+
+
+def _chunks(records, size: int):
+    chunk = []
+    for record in records:
+        chunk.append(record)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def run_reply_job(records, output_path: str, max_workers: int = None, chunk_size: int = None) -> dict:
+    """
+    Writes a reply for every record to output_path, one JSON object per line, as replies complete.
+    Known sentiments are reused and missing ones classified in bulk; near-identical reviews share
+    one generated reply; at most max_workers replies are generated at a time. Records whose id is
+    already in output_path are skipped, so rerunning a crashed job resumes it. Replies that fail
+    are left out and retried on the next run.
+    """
+    from main import write_feedback_response
+
+    max_workers = max_workers or REPLY_MAX_CONCURRENCY
+    chunk_size = chunk_size or REPLY_CHUNK_SIZE
+    done = load_checkpoint(output_path)
+    replies = {get_dedupe_key(record["review"]): record["response"] for record in done.values()}
+    stats = {"written": 0, "generated": 0, "duplicates": 0, "skipped": 0, "failed": 0}
+    start = time.perf_counter()
+
+    with open(output_path, "a", encoding="utf-8") as output, ThreadPoolExecutor(max_workers=max_workers) as executor:
+        def write(record, response):
+            output.write(json.dumps({**record, "response": response}) + "\n")
+            stats["written"] += 1
+
+        for chunk in _chunks(records, chunk_size):
+            pending = [record for record in chunk if record["id"] not in done]
+            stats["skipped"] += len(chunk) - len(pending)
+
+            unknown = [record for record in pending if record["sentiment"] is None]
+            for record, label in zip(unknown, classify_review_texts([record["review"] for record in unknown])):
+                record["sentiment"] = label
+
+            groups = {}
+            for record in pending:
+                done[record["id"]] = record
+                key = get_dedupe_key(record["review"])
+                if key in replies:
+                    write(record, replies[key])
+                    stats["duplicates"] += 1
+                else:
+                    groups.setdefault(key, []).append(record)
+
+            futures = {}
+            for key, group in groups.items():
+                if len(futures) >= 2 * max_workers:
+                    finished, _ = wait(futures, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        _write_group(future, futures.pop(future), replies, write, stats, done)
+                first = group[0]
+                futures[executor.submit(write_feedback_response, first["review"], first["sentiment"])] = (key, group)
+            for future in list(futures):
+                _write_group(future, futures.pop(future), replies, write, stats, done)
+            output.flush()
+
+    elapsed = time.perf_counter() - start
+    print(f"Wrote {stats['written']} replies in {elapsed:.2f}s ({stats['generated']} generated, "
+          f"{stats['duplicates']} duplicates, {stats['skipped']} already done, {stats['failed']} failed)")
+    return stats
+
+
+def _write_group(future, key_and_group, replies, write, stats, done):
+    key, group = key_and_group
+    try:
+        response = future.result()
+    except Exception as e:
+        print(f"Error generating a reply for review {group[0]['id']}: {e}")
+        stats["failed"] += len(group)
+        for record in group:
+            del done[record["id"]]
+        return
+    replies[key] = response
+    stats["generated"] += 1
+    stats["duplicates"] += len(group) - 1
+    for record in group:
+        write(record, response)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write customer replies for many reviews at once.")
+    parser.add_argument("input", nargs="?", help="CSV or JSONL file of reviews (default: the review database)")
+    parser.add_argument("--start", help="First review date when reading from the review database")
+    parser.add_argument("--end", help="Last review date when reading from the review database")
+    parser.add_argument("--output", default="replies.jsonl")
+    parser.add_argument("--workers", type=int, default=REPLY_MAX_CONCURRENCY)
+    args = parser.parse_args()
+
+    if args.input:
+        records = read_review_file(args.input)
+    elif args.start and args.end:
+        from data import get_database
+        records = read_database_range(get_database(), args.start, args.end)
+    else:
+        parser.error("give an input file, or --start and --end to read from the review database")
+    run_reply_job(records, args.output, max_workers=args.workers)
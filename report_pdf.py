@@ -0,0 +1,239 @@
+import hashlib
+import io
+import os
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from artifacts import get_artifact_manager, write_atomically
+from tracing import bind_context, traced
+
+PDF_MAX_WORKERS = int(os.getenv("PDF_MAX_WORKERS", "2"))
+PDF_USE_PROCESSES = os.getenv("PDF_USE_PROCESSES", "0") == "1"
+# Finished jobs remembered for deduplication
+PDF_MAX_JOBS = int(os.getenv("PDF_MAX_JOBS", "256"))
+BOLD_PATTERN = re.compile(r'\*\*(.*?)\*\*')
+NUMBERED_ITEM_PATTERN = re.compile(r'^\d+\.\s')
+
+
+class LazyStory:
+    """
+    List-like view of a flowable generator for SimpleDocTemplate.build. ReportLab only looks at
+    and edits the front of the story, so flowables are created as the layout reaches them and
+    dropped once drawn instead of the whole story being held in memory.
+    """
+    _END = object()
+
+    def __init__(self, flowables):
+        self._flowables = iter(flowables)
+        self._buffer = []
+        self._next = next(self._flowables, self._END)
+
+    def _fill(self, size: int):
+        while len(self._buffer) < size and self._next is not self._END:
+            self._buffer.append(self._next)
+            self._next = next(self._flowables, self._END)
+
+    def __len__(self):
+        return len(self._buffer) + (self._next is not self._END)
+
+    def _fill_for(self, index):
+        if isinstance(index, slice):
+            stop = index.stop
+            self._fill(float('inf') if stop is None or stop < 0 else stop)
+        else:
+            self._fill(float('inf') if index < 0 else index + 1)
+
+    def __getitem__(self, index):
+        self._fill_for(index)
+        return self._buffer[index]
+
+    def __setitem__(self, index, value):
+        self._fill_for(index)
+        self._buffer[index] = value
+
+    def __delitem__(self, index):
+        self._fill_for(index)
+        del self._buffer[index]
+
+    def insert(self, index: int, value):
+        self._buffer.insert(index, value)
+
+
+def iter_lines(text: str):
+    """
+    Yields the lines of text without first splitting all of it.
+    """
+    start = 0
+    while start <= len(text):
+        end = text.find('\n', start)
+        if end == -1:
+            end = len(text)
+        yield text[start:end]
+        start = end + 1
+
+
+def iter_report_flowables(report_lines, styles, charts: list[bytes] = None):
+    """
+    Turns report lines into paragraphs one at a time, followed by any chart PNGs.
+    """
+    from reportlab.platypus import Image, Paragraph, Spacer
+
+    yield Paragraph("Strategic Recommendations Report", styles['Heading1'])
+    yield Spacer(1, 12)
+
+    for line in report_lines:
+        line = line.strip()
+        if not line:
+            continue
+
+        line = BOLD_PATTERN.sub(r'<b>\1</b>', line)
+
+        if line.endswith(':'):
+            yield Paragraph(f"<b>{line}</b>", styles['Normal'])
+        elif NUMBERED_ITEM_PATTERN.match(line):
+            yield Paragraph(f"{line}", styles['Normal'])
+        elif line.startswith('- ') or line.startswith('* '):
+            yield Paragraph(f"• {line[2:]}", styles['Normal'])
+        else:
+            yield Paragraph(line, styles['Normal'])
+
+    for png in charts or []:
+        image = Image(io.BytesIO(png))
+        scale = min(1.0, 450 / image.drawWidth)
+        image.drawWidth *= scale
+        image.drawHeight *= scale
+        yield Spacer(1, 12)
+        yield image
+
+
+@traced()
+def render_report_pdf(report, charts: list[bytes] = None) -> bytes:
+    """
+    Lays out a report, given as text or as an iterable of lines (e.g. an open file), as a
+    well-formatted PDF and returns its bytes. Chart PNGs are appended after the text.
+    reportlab is imported on the first render rather than with this module.
+    """
+    from reportlab.lib.enums import TA_CENTER
+    from reportlab.lib.pagesizes import letter
+    from reportlab.lib.styles import getSampleStyleSheet
+    from reportlab.platypus import SimpleDocTemplate
+
+    buffer = io.BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=letter)
+    styles = getSampleStyleSheet()
+
+    styles['Heading1'].alignment = TA_CENTER
+    styles['Heading1'].spaceAfter = 12
+    styles['Normal'].spaceAfter = 6
+    styles['BodyText'].fontName = 'Helvetica'
+
+    report_lines = iter_lines(report) if isinstance(report, str) else report
+    doc.build(LazyStory(iter_report_flowables(report_lines, styles, charts)))
+    return buffer.getvalue()
+
+
+def save_report_as_pdf(report_text: str, filename: str = None, prefix: str = "report", charts: list[bytes] = None):
+    """
+    Saves the given report text to a well-formatted PDF file, or to a new artifact path named
+    after prefix when no filename is given. Returns the path, or None on failure.
+    """
+    try:
+        pdf = render_report_pdf(report_text, charts)
+        if filename is None:
+            filename = get_artifact_manager().write(prefix, ".pdf", pdf)
+        else:
+            write_atomically(filename, pdf)
+        print(f"Report successfully saved to {filename}")
+        return filename
+    except Exception as e:
+        print(f"Error saving report to PDF file: {e}")
+        return None
+
+
+def export_pdf(report_text: str, charts: list[bytes], path: str) -> str:
+    write_atomically(path, render_report_pdf(report_text, charts))
+    print(f"Report successfully saved to {path}")
+    return path
+
+
+class PdfJob:
+    """
+    Handle for a PDF export running in the background. path is known immediately;
+    the file appears there once the job is done.
+    """
+    def __init__(self, key: str, path: str, future):
+        self.key = key
+        self.path = path
+        self._future = future
+
+    def done(self) -> bool:
+        return self._future.done()
+
+    def succeeded(self) -> bool:
+        return self.done() and self._future.exception() is None
+
+    def result(self, timeout: float = None):
+        """
+        Waits for the export and returns the PDF path, or None if it failed.
+        """
+        try:
+            return self._future.result(timeout)
+        except TimeoutError:
+            raise
+        except Exception as e:
+            print(f"Error saving report to PDF file: {e}")
+            return None
+
+
+class PdfExporter:
+    """
+    Background queue that renders report PDFs on a thread pool, or on a process pool with
+    use_processes. Submitting the same report text and charts again returns the existing job.
+    """
+    def __init__(self, max_workers: int = PDF_MAX_WORKERS, use_processes: bool = PDF_USE_PROCESSES,
+                 max_jobs: int = PDF_MAX_JOBS):
+        self.use_processes = use_processes
+        executor_class = ProcessPoolExecutor if use_processes else ThreadPoolExecutor
+        self._executor = executor_class(max_workers=max_workers)
+        self.max_jobs = max_jobs
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, report_text: str, charts: list[bytes] = None, prefix: str = "report") -> PdfJob:
+        digest = hashlib.sha256(report_text.encode("utf-8"))
+        for png in charts or []:
+            digest.update(hashlib.sha256(png).digest())
+        key = digest.hexdigest()
+
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is not None and (not job.done() or (job.succeeded() and os.path.exists(job.path))):
+                self._jobs.move_to_end(key)
+                return job
+
+            path = get_artifact_manager().new_path(prefix, ".pdf")
+            # Rendering in a thread is traced as part of the request that asked for it
+            export = export_pdf if self.use_processes else bind_context(export_pdf)
+            job = PdfJob(key, path, self._executor.submit(export, report_text, charts, path))
+            self._jobs[key] = job
+            while len(self._jobs) > self.max_jobs:
+                self._jobs.popitem(last=False)
+        return job
+
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait)
+
+
+_exporter = None
+_exporter_lock = threading.Lock()
+
+
+def get_pdf_exporter() -> PdfExporter:
+    global _exporter
+    if _exporter is None:
+        with _exporter_lock:
+            if _exporter is None:
+                _exporter = PdfExporter()
+    return _exporter
@@ -0,0 +1,123 @@
+import glob
+import io
+import os
+import threading
+
+import pandas as pd
+
+from data import get_source_signature
+
+REVIEWS_WATCH_INTERVAL = float(os.getenv("REVIEWS_WATCH_INTERVAL", "5"))
+
+
+def find_complete_rows(data: bytes) -> int:
+    """
+    Returns the length of the leading part of data that ends with a complete CSV row: the last
+    newline outside a quoted field, since reviews may contain line breaks. 0 when there is none.
+    """
+    end = data.rfind(b"\n")
+    while end != -1 and data.count(b'"', 0, end) % 2:
+        end = data.rfind(b"\n", 0, end)
+    return end + 1
+
+
+class ReviewWatcher:
+    """
+    Polls a reviews CSV, or a directory of them, and appends the rows added since the previous
+    poll to a ReviewDatabase. Each file is read from where the last poll stopped up to its last
+    complete row, so rows still being written are picked up on a later poll. The database's own
+    source file is read from where it ended when loaded; other files from the start. A file that
+    shrinks has been rewritten rather than appended to and is left alone.
+    """
+    def __init__(self, database: object, path: str, interval: float = REVIEWS_WATCH_INTERVAL):
+        self.database = database
+        self.path = path
+        self.interval = interval
+        self.offsets = {}
+        self.headers = {}
+        self.source_path = os.path.abspath(database.file_path) if database.file_path else None
+        if self.source_path:
+            self.offsets[self.source_path] = database.source_size
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _files(self) -> list[str]:
+        if os.path.isdir(self.path):
+            return sorted(os.path.abspath(path) for path in glob.glob(os.path.join(self.path, "*.csv")))
+        return [os.path.abspath(self.path)] if os.path.exists(self.path) else []
+
+    def read_new_rows(self, path: str):
+        """
+        Returns the complete rows added to path since the last read as a raw DataFrame, or None.
+        """
+        size = os.path.getsize(path)
+        offset = self.offsets.get(path, 0)
+        if size < offset:
+            print(f"{path} shrank since it was last read; not appending from it")
+            return None
+        if size == offset:
+            return None
+
+        with open(path, "rb") as file:
+            if path not in self.headers:
+                header = file.readline()
+                if not header.endswith(b"\n"):
+                    return None
+                self.headers[path] = header
+                offset = max(offset, len(header))
+            file.seek(offset)
+            data = file.read(size - offset)
+        end = find_complete_rows(data)
+        if end == 0:
+            return None
+        self.offsets[path] = offset + end
+        return pd.read_csv(io.BytesIO(self.headers[path] + data[:end]))
+
+    def poll(self) -> int:
+        """
+        Appends the new rows of every watched file and returns how many reviews were added.
+        """
+        added = 0
+        for path in self._files():
+            try:
+                rows = self.read_new_rows(path)
+                if rows is not None and len(rows):
+                    added += self.database.append_reviews(rows)
+                # The file now matches the database, so get_database need not reload it
+                if path == self.source_path and self.offsets[path] == os.path.getsize(path):
+                    self.database.source_signature = get_source_signature(path)
+            except Exception as e:
+                print(f"Error appending new reviews from {path}: {e}")
+        if added:
+            print(f"Appended {added} new reviews")
+        return added
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.poll()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="review-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+
+_watcher = None
+_watcher_lock = threading.Lock()
+
+
+def start_watcher(database: object, path: str) -> ReviewWatcher:
+    """
+    Starts watching path for the given database, replacing the watcher of a previous database.
+    """
+    global _watcher
+    with _watcher_lock:
+        if _watcher is not None:
+            _watcher.stop()
+        _watcher = ReviewWatcher(database, path)
+        _watcher.start()
+        return _watcher
@@ -0,0 +1,189 @@
+import argparse
+import asyncio
+import json
+import os
+import time
+from contextlib import asynccontextmanager
+
+from tracing import span
+
+SERVE_HOST = os.getenv("SERVE_HOST", "127.0.0.1")
+SERVE_PORT = int(os.getenv("SERVE_PORT", "8765"))
+SERVE_TIMEOUT_SECONDS = float(os.getenv("SERVE_TIMEOUT_SECONDS", "300"))
+SERVE_MAX_QUEUE = int(os.getenv("SERVE_MAX_QUEUE", "100"))
+DEFAULT_ROUTE_LIMITS = {
+    "strategic_recommendations": 4,
+    "sentiment_plotting": 4,
+    "feedback_response": 16,
+}
+
+
+class ServiceOverloaded(Exception):
+    """
+    Raised when a route's queue is full and the request is rejected instead of waiting.
+    """
+
+
+class WorkflowService:
+    """
+    Runs many workflow invocations concurrently through app.ainvoke. Each route allows at most
+    route_limits[route] requests in flight; further requests wait in that route's queue, and once
+    max_queue requests are waiting new ones are rejected with ServiceOverloaded. Requests that
+    exceed timeout are cancelled.
+    """
+    def __init__(self, app=None, route_limits: dict = None, max_queue: int = SERVE_MAX_QUEUE,
+                 timeout: float = SERVE_TIMEOUT_SECONDS):
+        if app is None:
+            from main import app
+        from main import astream_response, route_request
+
+        self.app = app
+        self.route_request = route_request
+        self.astream_response = astream_response
+        self.route_limits = {**DEFAULT_ROUTE_LIMITS, **(route_limits or {})}
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self._semaphores = {route: asyncio.Semaphore(limit) for route, limit in self.route_limits.items()}
+        self._waiting = {route: 0 for route in self.route_limits}
+        self.stats = {"completed": 0, "rejected": 0, "timed_out": 0, "failed": 0}
+
+    @asynccontextmanager
+    async def _route_slot(self, route: str):
+        """
+        Waits for a free slot on the route, or raises ServiceOverloaded when its queue is full.
+        Yields the time spent waiting.
+        """
+        if self._waiting[route] >= self.max_queue:
+            self.stats["rejected"] += 1
+            raise ServiceOverloaded(f"Too many queued requests for {route}")
+
+        start = time.perf_counter()
+        self._waiting[route] += 1
+        try:
+            await self._semaphores[route].acquire()
+        finally:
+            self._waiting[route] -= 1
+        try:
+            yield time.perf_counter() - start
+        except asyncio.TimeoutError:
+            self.stats["timed_out"] += 1
+            raise
+        except Exception:
+            self.stats["failed"] += 1
+            raise
+        finally:
+            self._semaphores[route].release()
+        self.stats["completed"] += 1
+
+    async def invoke(self, prompt: str, timeout: float = None) -> dict:
+        """
+        Runs one request through the workflow and returns the final graph state plus
+        its route, queue wait and total latency in seconds.
+        """
+        start = time.perf_counter()
+        route = self.route_request({"input": prompt})
+        with span("request", route=route) as request_span:
+            async with self._route_slot(route) as queued:
+                request_span.set("queued_ms", queued * 1000)
+                result = await asyncio.wait_for(self.app.ainvoke({"input": prompt}), timeout or self.timeout)
+        return {**result, "route": route, "queued": queued, "latency": time.perf_counter() - start}
+
+    async def stream(self, prompt: str, timeout: float = None):
+        """
+        Like invoke, but yields the answer text piece by piece as the workflow produces it.
+        """
+        route = self.route_request({"input": prompt})
+        with span("request", route=route, stream=True):
+            async with self._route_slot(route):
+                async with asyncio.timeout(timeout or self.timeout):
+                    async for text in self.astream_response(prompt):
+                        yield text
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """
+        JSON-lines protocol: each line {"id": ..., "input": ...} gets a reply line with the same id.
+        With "stream": true the reply is preceded by {"id": ..., "delta": ...} lines carrying the
+        answer as it is generated. Requests on one connection run concurrently. Closing the sending
+        side only ends the requests, so their replies are still written; a reset connection or a
+        failed write cancels the pending requests.
+        """
+        write_lock = asyncio.Lock()
+        tasks = set()
+
+        async def send(message: dict):
+            async with write_lock:
+                try:
+                    writer.write((json.dumps(message) + "\n").encode("utf-8"))
+                    await writer.drain()
+                except ConnectionError:
+                    # Nobody will read the other answers either; cancel them to free their route slots
+                    for task in list(tasks):
+                        if task is not asyncio.current_task():
+                            task.cancel()
+                    raise
+
+        async def answer(request: dict):
+            reply = {"id": request.get("id")}
+            try:
+                if request.get("stream"):
+                    start = time.perf_counter()
+                    pieces = []
+                    async for text in self.stream(request["input"], request.get("timeout")):
+                        pieces.append(text)
+                        await send({"id": request.get("id"), "delta": text})
+                    reply.update({"output": "".join(pieces), "latency": time.perf_counter() - start})
+                else:
+                    result = await self.invoke(request["input"], request.get("timeout"))
+                    reply.update({
+                        "output": result["agent_outcome"],
+                        "route": result["route"],
+                        "dispatch": result.get("dispatch"),
+                        "latency": result["latency"],
+                    })
+            except ServiceOverloaded as e:
+                reply["error"] = f"overloaded: {e}"
+            except asyncio.TimeoutError:
+                reply["error"] = "timeout"
+            except Exception as e:
+                reply["error"] = f"{type(e).__name__}: {e}"
+            await send(reply)
+
+        try:
+            while line := await reader.readline():
+                try:
+                    request = json.loads(line)
+                except json.JSONDecodeError:
+                    request = None
+                if not isinstance(request, dict) or not isinstance(request.get("input"), str):
+                    error = {"error": 'expected a JSON object with an "input" string'}
+                    await send({"id": request.get("id"), **error} if isinstance(request, dict) else error)
+                    continue
+                task = asyncio.create_task(answer(request))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            # End of input only means no more requests; the client may still be reading the replies
+            await asyncio.gather(*tasks, return_exceptions=True)
+        except ConnectionError:
+            pass
+        finally:
+            # Requests are left only after a reset, a failed write or the server shutting down, when
+            # nobody will read their answers; cancel them to free their route slots
+            pending = list(tasks)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+            writer.close()
+
+    async def serve(self, host: str = SERVE_HOST, port: int = SERVE_PORT):
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        print(f"Serving the workflow on {host}:{port}")
+        async with server:
+            await server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve the review agents over a JSON-lines TCP socket.")
+    parser.add_argument("--host", default=SERVE_HOST)
+    parser.add_argument("--port", type=int, default=SERVE_PORT)
+    args = parser.parse_args()
+    asyncio.run(WorkflowService().serve(args.host, args.port))
@@ -1,5 +1,36 @@
+import asyncio
+import io
+import json
+import os
+import socket
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
 import pandas as pd
+import llm_cache
+import tools
 from data import ReviewDatabase
+from concurrent.futures import ThreadPoolExecutor
+import artifacts
+from artifacts import ArtifactManager
+import charts
+import report_pdf
+import classify
+import data
+import reply_batch
+import tracing
+import main
+from fake_llm import (
+    FakeChatGroq, FakeGroqClient, FakeStreamingChatModel, default_responder, fake_agent_model, fake_groq,
+    fake_groq_backend,
+    fake_response_model, sentiment_responder,
+)
+import local_classifier
+from local_classifier import LocalSentimentClassifier
+from theme_store import ThemeStore
 from tools import (
     plot_stacked_bar_chart,
     plot_line_chart,
@@ -8,7 +39,7 @@ from tools import (
     analyze_sentiment,
     generate_recommendations_report
 )
-from main import app
+from main import app, astream_response
 
 def run_plotting_tests():
     print("Initializing ReviewDatabase...")
@@ -35,8 +66,118 @@ def run_plotting_tests():
     plot_pie_chart(reviews_in_range)
     plot_simple_bar_chart(reviews_in_range)
     
-    print("All plots generated successfully. Check your project directory for the image files.")
+    print("All plots generated successfully. Check the artifacts directory for the image files.")
+
+
+def run_chart_cache_tests():
+    print("Rendering two charts for one range, then fetching them again from the chart cache...")
+    database = ReviewDatabase()
+    start_date, end_date = pd.to_datetime('2019-01-01'), pd.to_datetime('2019-06-30')
+    original_cache = charts._cache
+    with tempfile.TemporaryDirectory() as directory:
+        charts._cache = charts.ChartCache(directory)
+        try:
+            rendered = charts.get_sentiment_charts(database, ["pie", "line"], start_date, end_date)
+            cached = charts.get_sentiment_charts(database, ["pie", "line"], start_date, end_date)
+            cached_files = len(os.listdir(directory))
+        finally:
+            charts._cache = original_cache
+    assert all(png.startswith(b"\x89PNG") for png in rendered.values()), "Charts are not PNG images"
+    assert rendered == cached and cached_files == 2, "Charts were not served from the cache"
+
+    with tempfile.TemporaryDirectory() as directory:
+        cache = charts.ChartCache(directory, max_bytes=3 * len(rendered["pie"]), gc_interval=1)
+        for version in range(10):
+            cache.set("pie", start_date, end_date, f"v{version}", rendered["pie"])
+        kept = len(os.listdir(directory))
+        latest = cache.get("pie", start_date, end_date, "v9")
+    assert kept <= 3 and latest == rendered["pie"], f"Charts of old data versions were not evicted: {kept} left"
+    print("Both charts were cached and reused; charts of old data versions were evicted.")
+
+def run_artifact_stress_tests(threads: int = 8, rounds: int = 5):
+    print(f"Rendering charts and PDFs from {threads} threads at once into one artifact directory...")
+    database = ReviewDatabase()
+    ranges = [(pd.Timestamp(2018, month, 1), pd.Timestamp(2018, month, 1) + pd.offsets.MonthEnd(0)) for month in range(1, 13)]
+    expected = {
+        date_range: charts.render_charts(database.get_sentiment_counts_by_date(*date_range), charts.CHART_TYPES)
+        for date_range in ranges
+    }
+
+    with tempfile.TemporaryDirectory() as directory:
+        manager = ArtifactManager(directory, gc_interval=0)
+
+        def worker(thread):
+            corrupted = []
+            for round_number in range(rounds):
+                date_range = ranges[(thread + round_number) % len(ranges)]
+                pngs = charts.render_charts(database.get_sentiment_counts_by_date(*date_range), charts.CHART_TYPES)
+                for chart_type, png in pngs.items():
+                    path = manager.write(chart_type, ".png", png)
+                    with open(path, "rb") as file:
+                        if file.read() != expected[date_range][chart_type]:
+                            corrupted.append(path)
+                report = f"Report {thread}-{round_number}:\n" + "\n".join(f"- Theme {i}" for i in range(thread * 20))
+                path = manager.write("report", ".pdf", report_pdf.render_report_pdf(report))
+                with open(path, "rb") as file:
+                    pdf = file.read()
+                if not (pdf.startswith(b"%PDF") and pdf.rstrip().endswith(b"%%EOF")):
+                    corrupted.append(path)
+            return corrupted
+
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            corrupted = sum(executor.map(worker, range(threads)), [])
+        artifact_count = len(os.listdir(directory))
+
+    assert not corrupted, f"Corrupted artifacts: {corrupted[:3]}"
+    assert artifact_count == threads * rounds * (len(charts.CHART_TYPES) + 1), "Artifacts overwrote each other"
+    print(f"{artifact_count} artifacts written, none corrupted or overwritten.")
+
+def run_artifact_gc_tests():
+    print("Garbage-collecting artifacts by age and by size quota...")
+    with tempfile.TemporaryDirectory() as directory:
+        manager = ArtifactManager(directory, max_age=3600, max_bytes=2500, gc_interval=0)
+        now = time.time()
+        paths = [manager.write("chart", ".png", b"x" * 1000) for _ in range(4)]
+        for age, path in zip([7200, 300, 200, 100], paths):
+            os.utime(path, (now - age, now - age))
+        removed = manager.collect_garbage(now)
+        remaining = sorted(os.listdir(directory))
+    assert removed == 2 and remaining == sorted(os.path.basename(path) for path in paths[2:]), "Wrong artifacts removed"
+    print("Expired and over-quota artifacts removed, newest kept.")
+
+def run_pdf_export_tests():
+    print("Exporting a long report in the background, twice, and comparing it with an eagerly built story...")
+    from reportlab import rl_config
+    from reportlab.lib.pagesizes import letter
+    from reportlab.lib.styles import getSampleStyleSheet
+    from reportlab.platypus import SimpleDocTemplate
 
+    report = "\n".join(["Executive Summary:"] + [f"{i}. **Finding** number {i} " + "detail " * 30 for i in range(1, 400)])
+    original_manager, original_invariant = artifacts._manager, rl_config.invariant
+    with tempfile.TemporaryDirectory() as directory:
+        artifacts._manager = ArtifactManager(directory, gc_interval=0)
+        rl_config.invariant = 1
+        exporter = report_pdf.PdfExporter(max_workers=2)
+        try:
+            first = exporter.submit(report)
+            second = exporter.submit(report)
+            path = first.result(timeout=120)
+            with open(path, "rb") as file:
+                exported = file.read()
+
+            eager = io.BytesIO()
+            styles = getSampleStyleSheet()
+            styles['Heading1'].alignment = 1
+            styles['Heading1'].spaceAfter = 12
+            styles['Normal'].spaceAfter = 6
+            SimpleDocTemplate(eager, pagesize=letter).build(list(report_pdf.iter_report_flowables(report.split("\n"), styles)))
+        finally:
+            exporter.shutdown()
+            artifacts._manager, rl_config.invariant = original_manager, original_invariant
+
+    assert first is second, "Identical reports were exported twice"
+    assert exported == eager.getvalue(), "Streamed story produced a different PDF"
+    print(f"Exported a {exported.count(b'/Type /Page') - 1}-page report once for two requests.")
 
 def run_sentiment_analysis_tests():
     feedback = analyze_sentiment("The food was amazing and the service was excellent!")
@@ -51,13 +192,568 @@ def run_recommendations_report():
     print(report)
 
 
+def run_concurrent_themes_tests():
+    print("Summarizing themes with a fake Groq client, sequentially and concurrently...")
+    reviews = {
+        'Positive': [f"Review {i}: the food was delicious and the staff friendly. " * 20 for i in range(40)],
+        'Negative': [f"Review {i}: the soup was cold and the waiter rude. " * 20 for i in range(15)],
+    }
+    with fake_groq(FakeGroqClient(latency=0.01)):
+        sequential = tools.get_top_themes_by_sentiment(reviews, max_workers=1)
+    with fake_groq(FakeGroqClient(latency=0.01, rate_limited_calls=3)):
+        concurrent = tools.get_top_themes_by_sentiment(reviews, max_workers=8)
+
+    assert sequential == concurrent, "Concurrent summaries differ from the sequential ones"
+    assert all(len(themes.splitlines()) == 1 for themes in concurrent.values()), "Batch themes were not reduced to one list"
+    print("Concurrent theme summaries match the sequential order and were reduced to one list per sentiment.")
+
+
+def run_token_batching_tests():
+    print("Packing reviews into token-limited batches, splitting long ones and sampling a large partition...")
+    from token_budget import count_tokens, select_reviews, split_text
+
+    reviews = pd.read_csv('European Restaurant reviews.csv')['Review'].dropna().tolist()
+    long_review = " ".join(reviews[:40])
+    batches = tools.batch_reviews(reviews[:200] + [long_review], token_limit=1500)
+    assert all(count_tokens(batch) <= 1500 for batch in batches), "A batch is over the token limit"
+    assert " ".join(" ".join(batches).split()) == " ".join(" ".join(reviews[:200] + [long_review]).split()), "Review text was lost in batching"
+
+    sentences = split_text("The soup was cold. The waiter was rude. " * 40, 30)
+    assert all(piece.endswith(".") for piece in sentences), "A piece was split mid-sentence"
+    huge_review = " ".join(reviews) * 3
+    start = time.perf_counter()
+    pieces = split_text(huge_review, 1500)
+    elapsed = time.perf_counter() - start
+    assert all(count_tokens(piece) <= 1500 for piece in pieces), "A piece is over the token limit"
+    assert elapsed < 5, f"Splitting a {len(huge_review.split())}-word review took {elapsed:.1f}s"
+
+    repeated = reviews[:50] + [review.upper() + "!" for review in reviews[:50]]
+    assert select_reviews(repeated, max_tokens=0) == reviews[:50], "Near-duplicate reviews were kept"
+    sample = select_reviews(reviews, max_tokens=5000)
+    assert sample == select_reviews(reviews, max_tokens=5000), "Sampling is not deterministic"
+    assert sum(count_tokens(review) for review in sample) <= 5000 < sum(count_tokens(review) for review in reviews), "Sample is over its budget"
+    print(f"{len(batches)} batches within the limit; a {len(reviews)}-review partition sampled down to {len(sample)}.")
+
+
+def run_llm_cache_tests():
+    print("Classifying the same review three times through the LLM cache...")
+    with tempfile.TemporaryDirectory() as cache_dir:
+        cache = llm_cache.LLMCache(os.path.join(cache_dir, "llm_cache.sqlite3"))
+        try:
+            with fake_groq(FakeGroqClient(latency=0, responder=lambda messages: "Positive"), cache) as fake_client:
+                sentiments = [tools.analyze_sentiment("The pasta was superb!") for _ in range(3)]
+                stats = llm_cache.get_cache_stats()
+        finally:
+            cache.close()
+
+    assert sentiments == ["Positive"] * 3 and fake_client.calls == 1, "Repeated call was not served from the cache"
+    print(f"LLM cache stats: {stats}")
+
+
+def run_incremental_themes_tests():
+    print("Summarizing Jan-Jun 2019 and then Jan-Jul 2019 themes with a fake Groq client...")
+    database = ReviewDatabase('European Restaurant reviews.csv')
+    system_prompts = []
+
+    def responder(messages):
+        system_prompts.append(messages[0]["content"])
+        return default_responder(messages)
+
+    def count_summaries():
+        return sum("Summarize the top" in prompt for prompt in system_prompts)
+
+    with tempfile.TemporaryDirectory() as store_dir:
+        store = ThemeStore(os.path.join(store_dir, "theme_store.sqlite3"))
+        try:
+            with fake_groq(FakeGroqClient(latency=0, responder=responder), theme_store=store):
+                tools.get_themes_for_range(database, ['Positive', 'Negative'], pd.to_datetime('2019-01-01'), pd.to_datetime('2019-06-30'))
+                first_run = count_summaries()
+                tools.get_themes_for_range(database, ['Positive', 'Negative'], pd.to_datetime('2019-01-01'), pd.to_datetime('2019-07-31'))
+                second_run = count_summaries() - first_run
+        finally:
+            store.close()
+
+    july_batches = sum(
+        len(tools.get_theme_batches(database.get_reviews_by_sentiment(sentiment, pd.to_datetime('2019-07-01'), pd.to_datetime('2019-07-31'))['Review'].tolist()))
+        for sentiment in ['Positive', 'Negative']
+    )
+    assert second_run == july_batches, f"Expected {july_batches} new summaries for July, got {second_run}"
+    print(f"First range needed {first_run} batch summaries, extending it by one month needed {second_run}.")
+
+def run_outlet_themes_tests():
+    print("Summarizing one month for the whole database, then one restaurant, then the whole database again...")
+    database = ReviewDatabase('European Restaurant reviews.csv')
+    start_date, end_date = pd.to_datetime('2019-07-01'), pd.to_datetime('2019-07-31')
+    restaurant = database.get_reviews(start_date, end_date)['Restaurant Name'].iloc[0]
+    calls = []
+    with tempfile.TemporaryDirectory() as store_dir:
+        store = ThemeStore(os.path.join(store_dir, "theme_store.sqlite3"))
+        try:
+            with fake_groq(FakeGroqClient(latency=0), theme_store=store) as client:
+                for target in [database, database.get_partition(restaurant=restaurant), database]:
+                    before = client.calls
+                    tools.get_themes_for_range(target, ['Positive', 'Negative'], start_date, end_date)
+                    calls.append(client.calls - before)
+        finally:
+            store.close()
+    assert calls[0] and calls[1], f"Expected new summaries for the database and the restaurant, got {calls}"
+    assert calls[2] == 0, f"The outlet's summaries replaced the database's: the second database run made {calls[2]} LLM calls"
+    print(f"Database, {restaurant} and database again made {calls} LLM calls.")
+
+
+def run_bulk_classification_tests():
+    print("Bulk classifying reviews with a fake Groq client that drops labels past the 20th review...")
+    dataset = pd.DataFrame({
+        'Sentiment': [np.nan] * 50,
+        'Review Date': pd.to_datetime(['2019-01-01'] * 25 + ['2019-02-01'] * 25),
+        'Review': [f"Review {i}: the soup was cold" if i % 3 == 0 else f"Review {i}: lovely dinner" for i in range(50)],
+    })
+    database = ReviewDatabase.from_dataframe(dataset)
+    assert database.get_total_sentiment_counts('2019-01-01', '2019-02-28').empty, "Unlabelled reviews were counted"
+
+    def truncating_responder(messages):
+        return "\n".join(sentiment_responder(messages).splitlines()[:20])
+
+    with fake_groq(FakeGroqClient(latency=0, responder=truncating_responder)) as fake_client:
+        labels = classify.classify_reviews(dataset.drop(columns=['Sentiment']), database=database, batch_size=25)
+
+    expected = ['Negative' if i % 3 == 0 else 'Positive' for i in range(50)]
+    assert labels.tolist() == expected, "Bulk labels do not match the reviews"
+    assert fake_client.calls == 3, f"Expected 2 batches plus 1 retry batch, got {fake_client.calls} calls"
+    assert database.get_total_sentiment_counts('2019-01-01', '2019-02-28').to_dict() == {'Positive': 33, 'Negative': 17}
+
+    # New reviews whose default index reuses the labels of rows already in the database
+    before = database.get_data()['Sentiment'].copy()
+    with fake_groq(FakeGroqClient(latency=0, responder=sentiment_responder)):
+        other = classify.classify_reviews(pd.DataFrame({'Review': ["lovely dinner", "the soup was cold"]}), database=database)
+    assert other.tolist() == ['Positive', 'Negative'], "Reviews outside the database were not classified"
+    assert database.get_data()['Sentiment'].equals(before), "Labels of other reviews overwrote rows of the database"
+
+    raw = pd.read_csv(data.DEFAULT_FILE_PATH)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "head.csv")
+        raw.iloc[:1000].to_csv(path, index=False)
+        growing = ReviewDatabase(path, use_snapshot=False)
+        added = growing.append_reviews(raw.iloc[1000:1040].assign(Sentiment=np.nan))
+    unlabelled = growing.get_data()['Sentiment'].isna()
+    assert added == unlabelled.sum() > 0, "Reviews without a sentiment were not appended"
+    with fake_groq(FakeGroqClient(latency=0, responder=sentiment_responder)):
+        classify.classify_reviews(growing.get_data(), database=growing)
+    assert growing.get_data()['Sentiment'].notna().all(), "Appended reviews were not labelled"
+    print("Bulk labels were repaired by retrying only the failed reviews and written back to the database; "
+          "only the database's own reviews were relabelled.")
+
+
+def run_local_classifier_tests():
+    print("Training the local sentiment classifier on the labelled reviews...")
+    dataset = ReviewDatabase('European Restaurant reviews.csv').get_data()
+    classifier = LocalSentimentClassifier().fit(dataset['Review'].tolist(), dataset['Sentiment'].tolist())
+    assert classifier.predict("asdf qwerty")[0] is None, "A review without any known word was answered from the class prior"
+
+    with fake_groq(FakeGroqClient(latency=0, responder=sentiment_responder), local_classifier=classifier) as fake_client:
+        obvious = analyze_sentiment("The food was amazing and the service was excellent!")
+        calls_after_obvious = fake_client.calls
+        ambiguous = analyze_sentiment("The food was cold and the waiter was very rude.")
+
+    assert obvious == "Positive" and calls_after_obvious == 0, "Obvious review was not answered locally"
+    assert ambiguous == "Negative" and fake_client.calls == 1, "Ambiguous review was not escalated to the LLM"
+
+    raw = pd.read_csv(data.DEFAULT_FILE_PATH)
+    original_path, original_database = os.environ.get("REVIEWS_CSV_PATH"), data._database
+    original_enabled = local_classifier.LOCAL_CLASSIFIER_ENABLED
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "head.csv")
+        raw.iloc[:1000].to_csv(path, index=False)
+        os.environ["REVIEWS_CSV_PATH"], data._database = path, None
+        local_classifier.LOCAL_CLASSIFIER_ENABLED, local_classifier._classifier = True, None
+        try:
+            start = time.perf_counter()
+            first = local_classifier.get_local_classifier()
+            waited = time.perf_counter() - start
+            local_classifier._training_thread.join()
+            trained = local_classifier.get_local_classifier()
+            data.get_database().append_reviews(raw.iloc[1000:1020])
+            after_few = local_classifier.get_local_classifier()
+            data.get_database().append_reviews(raw.iloc[1020:])
+            local_classifier.get_local_classifier()
+            local_classifier._training_thread.join()
+            after_many = local_classifier.get_local_classifier()
+        finally:
+            data._database = original_database
+            local_classifier.LOCAL_CLASSIFIER_ENABLED, local_classifier._classifier = original_enabled, None
+            if original_path is None:
+                os.environ.pop("REVIEWS_CSV_PATH")
+            else:
+                os.environ["REVIEWS_CSV_PATH"] = original_path
+    assert first is None and waited < 0.1, f"The first request waited {waited:.2f}s for the model to be trained"
+    assert trained is not None, "The local classifier was not trained in the background"
+    assert after_few is trained, "A few appended reviews retrained the local classifier"
+    assert after_many is not trained, "Many appended reviews did not retrain the local classifier"
+    print("Obvious review answered locally; ambiguous and unknown cases escalated to the LLM; trained off the request path.")
+
+
+def run_streaming_feedback_tests():
+    print("Streaming a feedback reply from a fake chat model...")
+    model = FakeStreamingChatModel(first_token_latency=0.01, token_latency=0)
+
+    async def collect(prompt):
+        return [text async for text in astream_response(prompt)]
+
+    with fake_groq(FakeGroqClient(latency=0, responder=sentiment_responder)), fake_response_model(model):
+        pieces = asyncio.run(collect("Respond to this review: The soup was cold."))
+        result = app.invoke({"input": "Respond to this review: The soup was cold."})
+    assert len(pieces) > 1 and "".join(pieces) == model.reply, "Reply was not streamed token by token"
+    assert result["agent_outcome"] == model.reply and result["dispatch"] == "direct", "Blocking reply differs"
+    print(f"Received the reply in {len(pieces)} pieces.")
+
+def run_reply_batch_tests():
+    print("Answering a CSV of reviews in a batch job, crashing after the first rows and resuming...")
+    reviews = pd.DataFrame({
+        'Review': ["The soup was cold.", "the soup was COLD!", "Lovely dinner", "Great staff", "Rude waiter"],
+        'Sentiment': ["Negative", "Negative", None, "Positive", "Negative"],
+    })
+    model = FakeStreamingChatModel(first_token_latency=0, token_latency=0)
+    with tempfile.TemporaryDirectory() as directory:
+        input_path = os.path.join(directory, "reviews.csv")
+        output_path = os.path.join(directory, "replies.jsonl")
+        reviews.to_csv(input_path, index=False)
+        with fake_groq(FakeGroqClient(latency=0, responder=sentiment_responder)) as fake_client, fake_response_model(model):
+            first = reply_batch.run_reply_job(list(reply_batch.read_review_file(input_path))[:3], output_path)
+            with open(output_path, "a", encoding="utf-8") as output:
+                output.write('{"id": "3", "review": "Great')
+            second = reply_batch.run_reply_job(reply_batch.read_review_file(input_path), output_path)
+        with open(output_path, encoding="utf-8") as output:
+            replies = [json.loads(line) for line in output]
+
+    assert first["generated"] == 2 and first["duplicates"] == 1, "Near-identical reviews were not deduplicated"
+    assert second["skipped"] == 3 and second["generated"] == 2, "Resumed job did not skip finished reviews"
+    assert sorted(reply["id"] for reply in replies) == ["0", "1", "2", "3", "4"], "Replies missing or repeated"
+    assert fake_client.calls == 1, "Known sentiments were classified again"
+    print(f"Wrote {len(replies)} replies with {first['generated'] + second['generated']} generations.")
+
+def run_chunked_ingestion_tests(chunksize: int = 5000):
+    print(f"Ingesting the reviews CSV in chunks of {chunksize} rows and comparing with a full load...")
+    expected = ReviewDatabase(use_snapshot=False).get_data()
+    with tempfile.TemporaryDirectory() as directory:
+        store_path = os.path.join(directory, "reviews.store")
+        rows = data.ingest_reviews_csv(data.DEFAULT_FILE_PATH, store_path, chunksize=chunksize)
+        database = ReviewDatabase.from_dataframe(data.load_review_store(store_path))
+        ingested = database.get_data()
+        assert rows == len(expected), f"Ingested {rows} rows, the full load has {len(expected)}"
+        assert ingested.index.equals(expected.index), "Rows are in a different order"
+        assert list(ingested['Review']) == list(expected['Review']), "Review texts differ"
+        assert list(ingested['Sentiment']) == list(expected['Sentiment']), "Sentiments differ"
+        assert (ingested['Review Date'].to_numpy() == expected['Review Date'].to_numpy()).all(), "Review dates differ"
+        for column in data.PARTITION_COLUMNS:
+            assert list(ingested[column]) == list(expected[column]), f"{column} values differ"
+        del database, ingested
+    print(f"All {rows} ingested reviews match the full load.")
+
+def run_append_reviews_tests(split: int = 1200):
+    print(f"Loading the first {split} CSV rows, appending the rest and comparing with a full load...")
+    raw = pd.read_csv(data.DEFAULT_FILE_PATH)
+    with tempfile.TemporaryDirectory() as directory:
+        head_path, full_path = os.path.join(directory, "head.csv"), os.path.join(directory, "full.csv")
+        raw.iloc[:split].to_csv(head_path, index=False)
+        raw.to_csv(full_path, index=False)
+        database = ReviewDatabase(head_path, use_snapshot=False)
+        expected = ReviewDatabase(full_path, use_snapshot=False)
+
+        untouched = (pd.Timestamp('2000-01-01'), pd.Timestamp('2000-12-31'))
+        tail_months = pd.to_datetime(raw.iloc[split:]['Review Date'].str.replace(' •', '').str.replace('Sept', 'Sep'), format='%b %Y')
+        touched = (tail_months.min(), tail_months.min() + pd.offsets.MonthEnd(0))
+        versions = {date_range: database.get_data_version(*date_range) for date_range in [untouched, touched]}
+
+        loaded = len(database.get_data())
+        added = database.append_reviews(raw.iloc[split:])
+        assert database.append_reviews(raw.iloc[split:]) == 0, "Appending the same rows twice added duplicates"
+
+    appended, reloaded = database.get_data(), expected.get_data()
+    assert added == len(reloaded) - loaded, "Wrong number of rows appended"
+    assert list(appended['Review']) == list(reloaded['Review']), "Appended rows are in a different order than a reload"
+    assert list(appended['Sentiment']) == list(reloaded['Sentiment']), "Sentiments differ from a reload"
+    assert appended.index.is_unique, "Appended rows reuse row labels"
+    start_date, end_date = pd.Timestamp('2010-01-01'), pd.Timestamp('2025-12-31')
+    assert database.get_sentiment_counts_by_date(start_date, end_date).equals(expected.get_sentiment_counts_by_date(start_date, end_date)), "Cube differs from a reload"
+    assert database.get_reviews_by_sentiment('negative', *touched).equals(
+        appended[(appended['Review Date'] >= touched[0]) & (appended['Review Date'] <= touched[1]) & (appended['Sentiment'] == 'Negative')]
+    ), "Sentiment codes differ from the rows"
+    assert database.get_data_version(*untouched) == versions[untouched], "A range without new reviews was invalidated"
+    assert database.get_data_version(*touched) != versions[touched], "A range with new reviews kept its version"
+    print(f"Appended {added} reviews; the database matches a full reload.")
+
+def run_concurrent_append_tests(readers: int = 4, batches: int = 40):
+    print(f"Reading from {readers} threads while the rest of the reviews are appended in {batches} batches...")
+    raw = pd.read_csv(data.DEFAULT_FILE_PATH)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "head.csv")
+        raw.iloc[:300].to_csv(path, index=False)
+        database = ReviewDatabase(path, use_snapshot=False)
+        # The first append hashes the loaded rows from the source file, which only exists in here
+        database.append_reviews(raw.iloc[300:310])
+    ranges = [(pd.Timestamp(f"{year}-01-01"), pd.Timestamp(f"{year}-06-30")) for year in range(2010, 2024)]
+    done = False
+    wrong = []
+
+    def read():
+        while not done:
+            for start_date, end_date in ranges:
+                for sentiment in ['Positive', 'Negative']:
+                    rows = database.get_reviews_by_sentiment(sentiment, start_date, end_date)
+                    dates = rows['Review Date']
+                    if not ((dates >= start_date) & (dates <= end_date)).all() or not (rows['Sentiment'] == sentiment).all():
+                        wrong.append((sentiment, start_date))
+
+    with ThreadPoolExecutor(max_workers=readers) as executor:
+        futures = [executor.submit(read) for _ in range(readers)]
+        try:
+            for batch in np.array_split(np.arange(310, len(raw)), batches):
+                database.append_reviews(raw.iloc[batch])
+        finally:
+            done = True
+        for future in futures:
+            future.result()
+    assert not wrong, f"{len(wrong)} queries returned rows outside their range or sentiment"
+    print(f"No reader saw a half-applied append; {len(database.get_data())} reviews loaded.")
+
+def run_serve_disconnect_tests():
+    print("Half-closing and then resetting connections to the server while report requests run...")
+    from serve import WorkflowService
+
+    class SlowApp:
+        delay = 0.2
+        started = cancelled = 0
+
+        async def ainvoke(self, state):
+            SlowApp.started += 1
+            try:
+                await asyncio.sleep(SlowApp.delay)
+            except asyncio.CancelledError:
+                SlowApp.cancelled += 1
+                raise
+            return {"agent_outcome": "done"}
+
+    service = WorkflowService(app=SlowApp(), route_limits={"strategic_recommendations": 1})
+    request = b'{"id": 1, "input": "Generate a strategic recommendations report for 2019"}\n'
+
+    async def disconnect():
+        server = await asyncio.start_server(service.handle_connection, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        async with server:
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write(request + b'{"id": 2}\n')
+            writer.write_eof()
+            replies = [json.loads(line) for line in (await reader.read()).splitlines()]
+            writer.close()
+
+            SlowApp.delay = 30
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write(request)
+            await writer.drain()
+            while SlowApp.started < 2:
+                await asyncio.sleep(0.01)
+            # Linger 0 makes close() reset the connection
+            writer.get_extra_info("socket").setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack("ii", 1, 0))
+            writer.transport.abort()
+            for _ in range(200):
+                if SlowApp.cancelled:
+                    break
+                await asyncio.sleep(0.01)
+            await asyncio.sleep(0.01)
+            return replies, SlowApp.cancelled, service._semaphores["strategic_recommendations"].locked()
+
+    replies, cancelled, slot_held = asyncio.run(asyncio.wait_for(disconnect(), 10))
+    by_id = {reply.get("id"): reply for reply in replies}
+    assert by_id.get(1, {}).get("output") == "done", f"The half-closed client got no reply: {replies}"
+    assert "error" in by_id.get(2, {}), f"The malformed request's error did not carry its id: {replies}"
+    assert cancelled == 1, "The request kept running after its client reset the connection"
+    assert not slot_held, "The disconnected request still holds its route slot"
+    print("The half-closed client got its replies; the reset client's request was cancelled and its route slot freed.")
+
+def run_review_watcher_tests():
+    print("Watching a growing reviews CSV and appending its new rows...")
+    from review_watcher import ReviewWatcher
+
+    raw = pd.read_csv(data.DEFAULT_FILE_PATH).dropna().drop_duplicates()
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "reviews.csv")
+        raw.iloc[:1000].to_csv(path, index=False)
+        database = ReviewDatabase(path, use_snapshot=False)
+        watcher = ReviewWatcher(database, path)
+
+        tail = raw.iloc[1000:1100].to_csv(index=False, header=False)
+        last_row = raw.iloc[1099:1100].to_csv(index=False, header=False)
+        with open(path, "a", encoding="utf-8") as file:
+            file.write(tail[:-len(last_row) // 2])
+        first = watcher.poll()
+        with open(path, "a", encoding="utf-8") as file:
+            file.write(tail[-len(last_row) // 2:])
+        second = watcher.poll()
+        current = data._is_current(database, path)
+
+    assert (first, second) == (99, 1), f"Expected 99 complete rows then the last one, got {first} and {second}"
+    assert len(database.get_data()) == 1100, "Rows were lost or appended twice"
+    assert current, "The appended file would be reloaded in full"
+    print("Complete rows were appended as they arrived, without a reload.")
+
+def run_tracing_tests():
+    print("Tracing a report request through the workflow with a fake Groq client...")
+    original_manager, original_file = artifacts._manager, tracing.TRACE_FILE
+    with tempfile.TemporaryDirectory() as directory:
+        artifacts._manager = ArtifactManager(directory, gc_interval=0)
+        tracing.TRACE_FILE = os.path.join(directory, "traces.jsonl")
+        tracing.enable_tracing()
+        try:
+            with fake_groq(FakeGroqClient(latency=0.01)):
+                with tracing.span("request"):
+                    result = app.invoke({"input": "Generate a strategic recommendations report for 2019-01-01 to 2019-03-31"})
+                report_pdf.get_pdf_exporter().submit("flush").result(timeout=60)
+                pdf_path = result["agent_outcome"].rsplit("\nPDF: ", 1)[-1]
+                for _ in range(600):
+                    if os.path.exists(pdf_path):
+                        break
+                    time.sleep(0.1)
+                pdf_written = os.path.dirname(pdf_path) == directory and os.path.exists(pdf_path)
+        finally:
+            tracing.enable_tracing(False)
+            artifacts._manager, tracing.TRACE_FILE = original_manager, original_file
+        with open(os.path.join(directory, "traces.jsonl"), encoding="utf-8") as file:
+            exports = [json.loads(line) for line in file]
+
+    assert pdf_written, f"The report does not end with the path of its PDF: {result['agent_outcome'][-200:]}"
+    spans = [span for export in exports for span in export["resourceSpans"][0]["scopeSpans"][0]["spans"]]
+    request = next(span for span in spans if span["name"] == "request")
+    in_request = [span for span in spans if span["traceId"] == request["traceId"]]
+    names = {span["name"] for span in in_request}
+    for name in ["node.router", "node.strategic_recommendations", "data.get_database",
+                 "tools.summarize_themes_with_llm", "llm.chat", "report_pdf.render_report_pdf"]:
+        assert name in names, f"No {name} span was recorded for the request"
+    llm_spans = [span for span in in_request if span["name"] == "llm.chat"]
+    assert all(any(attribute["key"] == "llm.prompt_tokens" for attribute in span["attributes"]) for span in llm_spans), "LLM spans lack token counts"
+    print(f"{len(spans)} spans exported, including {len(llm_spans)} LLM calls.")
+
+def run_fake_backend_tests():
+    print("Running the agents against the fake Groq backend, with slow tokens and failing calls...")
+    client = FakeGroqClient(latency=0, tokens_per_second=100, error_rate=0.25)
+    failures = 0
+    start = time.perf_counter()
+    for _ in range(8):
+        try:
+            client.chat.completions.create(messages=[{"role": "user", "content": "one two three"}])
+        except Exception:
+            failures += 1
+    elapsed = time.perf_counter() - start
+    assert failures == client.errors == 2, "error_rate did not fail a quarter of the calls"
+    assert elapsed >= 6 * 4 / 100, "Token throughput did not slow the answers down"
+
+    original_manager, original_dispatch = artifacts._manager, main.DIRECT_DISPATCH
+    with tempfile.TemporaryDirectory() as directory:
+        artifacts._manager = ArtifactManager(directory, gc_interval=0)
+        main.DIRECT_DISPATCH = False
+        try:
+            with fake_groq_backend(latency=0) as (client, model):
+                reply = app.invoke({"input": "Respond to this review: The soup was cold."})
+                chart = app.invoke({"input": "Show me the sentiment trend for the year 2019."})
+        finally:
+            artifacts._manager, main.DIRECT_DISPATCH = original_manager, original_dispatch
+    assert reply["dispatch"] == "agent" and reply["agent_outcome"] == model.reply, "Feedback agent did not use the fake model"
+    assert "sentiment_line_chart" in chart["agent_outcome"], "Plotting agent did not call the chart tool"
+    assert model.calls == 5 and client.calls == 1, f"Unexpected call counts: {model.calls} chat model, {client.calls} Groq"
+    print(f"Agents answered with {model.calls} fake chat model calls and {client.calls} fake Groq call.")
+
+def run_startup_tests():
+    print("Importing main in a fresh interpreter and building agents on first use...")
+    deferred = ["langchain_groq", "langchain.agents", "groq", "reportlab", "matplotlib"]
+    code = f"import sys, main; print([name for name in {deferred!r} if name in sys.modules])"
+    loaded = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout.strip().splitlines()[-1]
+    assert loaded == "[]", f"import main loaded {loaded}"
+
+    with fake_agent_model(FakeChatGroq(latency=0)):
+        assert not main._agent_executors, "Agents were built before any request needed one"
+        executor = main.get_agent_executor("feedback_response")
+        assert main.get_agent_executor("feedback_response") is executor, "Agent was built twice"
+        assert list(main._agent_executors) == ["feedback_response"], "Agents of other routes were built"
+    print(f"import main left {', '.join(deferred)} unloaded; agents are built per route and shared.")
+
+def run_date_parsing_tests():
+    print("Parsing dates from requests, including dates that do not exist...")
+    from date_parser import parse_date_range
+
+    assert parse_date_range("Report for 2019-01-01 to 2019-6-30") == (pd.Timestamp('2019-01-01'), pd.Timestamp('2019-06-30'))
+    for text in ["Report for 2019-02-30 to 2019-06-30", "Report for 2019-01-01 to 2019-13-01"]:
+        assert parse_date_range(text) is None, f"Parsed a range from {text!r}"
+
+    original_manager = artifacts._manager
+    with tempfile.TemporaryDirectory() as directory:
+        artifacts._manager = ArtifactManager(directory, gc_interval=0)
+        try:
+            with fake_groq_backend(latency=0):
+                response = app.invoke({"input": "Generate a strategic recommendations report for 2019-02-30 to 2019-06-30"})
+        finally:
+            artifacts._manager = original_manager
+    assert response["dispatch"] == "agent", "A request with an invalid date was not left to the agent"
+    print("Invalid dates fall back to the agent.")
+
+def run_partition_tests():
+    print("Querying restaurant and country partitions and generating reports per outlet...")
+    from date_parser import parse_outlet
+
+    database = ReviewDatabase(use_snapshot=False)
+    dataset = database.get_data()
+    start_date, end_date = pd.Timestamp('2015-01-01'), pd.Timestamp('2024-12-31')
+    in_range = (dataset['Review Date'] >= start_date) & (dataset['Review Date'] <= end_date)
+    for filters, mask in [({"restaurant": "mosaic"}, dataset['Restaurant Name'] == "Mosaic"),
+                          ({"country": "France"}, dataset['Country'] == "France")]:
+        partition = database.get_partition(**filters)
+        assert database.get_partition(**filters) is partition, "Partition was built twice"
+        assert partition.get_reviews(start_date, end_date).equals(dataset[mask & in_range]), f"Reviews for {filters} differ from a filter"
+        expected = dataset[mask & in_range & (dataset['Sentiment'] == 'Negative')]
+        assert partition.get_reviews_by_sentiment('negative', start_date, end_date).equals(expected), f"Negative reviews for {filters} differ"
+        totals = {sentiment: count for sentiment, count in partition.get_total_sentiment_counts(start_date, end_date).items() if count}
+        assert totals == dataset[mask & in_range]['Sentiment'].value_counts().to_dict(), f"Totals for {filters} differ"
+        assert partition.get_data_version(start_date, end_date) != database.get_data_version(start_date, end_date), "Partition shares the database's chart version"
+    assert database.get_partition(restaurant="Mosaic").label == "Mosaic", "Partition is not labelled with the dataset's spelling"
+    assert len(database.get_partition(restaurant="Nowhere")) == 0, "Unknown restaurant matched reviews"
+
+    outlets = database.get_outlets()
+    country, restaurant = outlets[0]
+    assert parse_outlet(f"Create a report for {restaurant.upper()} for 2019", outlets) == {"restaurant": restaurant}
+    assert parse_outlet(f"Sentiment trend in {country} for 2019", outlets) == {"country": country}
+    assert parse_outlet("Show me the sentiment trend for the year 2019.", outlets) == {}
+
+    raw = pd.read_csv(data.DEFAULT_FILE_PATH)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "head.csv")
+        raw.iloc[:1200].to_csv(path, index=False)
+        growing = ReviewDatabase(path, use_snapshot=False)
+        restaurant = raw.iloc[1200:]['Restaurant Name'].iloc[0]
+        before = len(growing.get_partition(restaurant=restaurant))
+        growing.append_reviews(raw.iloc[1200:])
+    after = len(growing.get_partition(restaurant=restaurant))
+    assert after == len(database.get_partition(restaurant=restaurant)) and after > before, "Appended reviews are missing from the partition"
+
+    original_manager = artifacts._manager
+    with tempfile.TemporaryDirectory() as directory:
+        artifacts._manager = ArtifactManager(directory, gc_interval=0)
+        try:
+            with fake_groq(FakeGroqClient(latency=0.02)) as client:
+                reports = tools.generate_outlet_reports(database, pd.Timestamp('2010-01-01'), pd.Timestamp('2024-12-31'), outlets[:4])
+        finally:
+            artifacts._manager = original_manager
+    assert list(reports) == outlets[:4], "Reports are not keyed by outlet"
+    assert client.max_in_flight <= tools.LLM_MAX_CONCURRENCY, f"{client.max_in_flight} Groq calls ran at once"
+    print(f"Partitions match filtering; {len(reports)} outlet reports generated in parallel.")
+
 def check_workflow(prompt: str):
     print("Checking workflow...")
-    response = app.invoke({"input": prompt})
+    with tracing.span("request"):
+        response = app.invoke({"input": prompt})
     print("\n" + "="*50)
     print("Agent Response:")
     print("="*50)
     print(response["agent_outcome"])
+    for node, seconds in response.get("node_latency", {}).items():
+        print(f"{node} ({response.get('dispatch')}): {seconds:.2f}s")
     print("Workflow check complete.")
 
 if __name__ == "__main__":
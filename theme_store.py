@@ -0,0 +1,84 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+THEME_STORE_PATH = os.getenv("THEME_STORE_PATH", ".theme_store.sqlite3")
+THEME_STORE_ENABLED = os.getenv("THEME_STORE_ENABLED", "1") != "0"
+
+
+def get_reviews_digest(reviews_list: list[str]) -> str:
+    """
+    Fingerprints the reviews of one partition so stored themes are reused only while they are unchanged.
+    """
+    digest = hashlib.sha256()
+    for review in reviews_list:
+        digest.update(review.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class ThemeStore:
+    """
+    On-disk (SQLite) store of theme summaries per (outlet, sentiment, month) partition, where the
+    outlet is a ReviewPartition key or empty for the whole database. Each partition keeps only its
+    latest summary together with the digest of the reviews it covers.
+    """
+    def __init__(self, path: str = THEME_STORE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            columns = [row[1] for row in self._connection.execute("PRAGMA table_info(monthly_themes)")]
+            if columns and "outlet" not in columns:
+                # Summaries stored before outlets were kept apart; they are only a cache
+                self._connection.execute("DROP TABLE monthly_themes")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS monthly_themes ("
+                "outlet TEXT NOT NULL, sentiment TEXT NOT NULL, month TEXT NOT NULL, digest TEXT NOT NULL, "
+                "themes TEXT NOT NULL, created_at REAL NOT NULL, PRIMARY KEY (outlet, sentiment, month))"
+            )
+
+    def get(self, sentiment_type: str, month, digest: str, outlet: str = ""):
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT themes FROM monthly_themes WHERE outlet = ? AND sentiment = ? AND month = ? AND digest = ?",
+                (outlet, sentiment_type.lower(), str(month)[:7], digest),
+            ).fetchone()
+        return row[0] if row is not None else None
+
+    def set(self, sentiment_type: str, month, digest: str, themes: str, outlet: str = ""):
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO monthly_themes (outlet, sentiment, month, digest, themes, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (outlet, sentiment_type.lower(), str(month)[:7], digest, themes, time.time()),
+            )
+
+    def count(self) -> int:
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM monthly_themes").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_theme_store():
+    """
+    Returns the process-wide theme store, or None when it is disabled.
+    """
+    global _store
+    if not THEME_STORE_ENABLED:
+        return None
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = ThemeStore()
+    return _store
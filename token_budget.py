@@ -0,0 +1,166 @@
+import hashlib
+import os
+import random
+import re
+import threading
+from functools import lru_cache
+
+# "approx" (default), "tiktoken:<encoding>" or "hf:<tokenizer name>"; the last two need tiktoken or tokenizers installed
+THEME_TOKENIZER = os.getenv("THEME_TOKENIZER", "approx")
+# Context window the theme batches are packed to; llama-3.1-8b-instant accepts up to 131072
+THEME_CONTEXT_TOKENS = int(os.getenv("THEME_CONTEXT_TOKENS", "8192"))
+# Share of the budget left unused in case the token count is an underestimate
+THEME_TOKEN_MARGIN = float(os.getenv("THEME_TOKEN_MARGIN", "0.1"))
+# Reviews kept per (sentiment, month) partition are sampled down to this many tokens; 0 keeps them all
+THEME_SAMPLE_MAX_TOKENS = int(os.getenv("THEME_SAMPLE_MAX_TOKENS", "0"))
+
+# Roughly the pre-tokenizer of Llama 3 style BPE vocabularies: words, numbers, punctuation runs
+PIECE_PATTERN = re.compile(r"[^\W\d_]+|\d{1,3}|[^\w\s]+|\s+")
+NORMALIZE_PATTERN = re.compile(r"[^\w]+")
+SENTENCE_END_PATTERN = re.compile(r"(?<=[.!?])\s+")
+
+
+@lru_cache(maxsize=65536)
+def approximate_token_count(text: str) -> int:
+    """
+    Fast estimate of the tokens in text, erring on the high side. ASCII words cost one token per
+    six characters; words with accented or other non-ASCII letters, which BPE vocabularies trained
+    mostly on English split more finely, one per three characters. Punctuation and numbers count
+    per run or per three digits. Reviews are counted again on every range, so results are cached.
+    """
+    tokens = 0
+    for piece in PIECE_PATTERN.findall(text):
+        if piece.isspace():
+            tokens += piece.count("\n")
+        elif not piece.isascii():
+            tokens += 1 + (len(piece) - 1) // 3
+        elif piece[0].isalpha():
+            tokens += 1 + (len(piece) - 1) // 6
+        elif piece[0].isdigit():
+            tokens += 1
+        else:
+            tokens += len(piece)
+    return tokens
+
+
+def get_dedupe_key(review_text: str) -> str:
+    """
+    Reviews that differ only in case, punctuation or spacing share a key. Used both to drop
+    repeated reviews before summarizing themes and to give repeated reviews the same reply.
+    """
+    return NORMALIZE_PATTERN.sub(" ", review_text.lower()).strip()
+
+
+def _load_tokenizer(spec: str):
+    kind, _, name = spec.partition(":")
+    if kind == "tiktoken":
+        import tiktoken
+        encoding = tiktoken.get_encoding(name or "cl100k_base")
+        return lambda text: len(encoding.encode(text, disallowed_special=()))
+    if kind == "hf":
+        from tokenizers import Tokenizer
+        tokenizer = Tokenizer.from_pretrained(name)
+        return lambda text: len(tokenizer.encode(text, add_special_tokens=False).ids)
+    return approximate_token_count
+
+
+_counter = None
+_counter_lock = threading.Lock()
+
+
+def get_token_counter():
+    """
+    Returns the text -> token count function chosen by THEME_TOKENIZER, falling back to the
+    approximation when the tokenizer cannot be loaded.
+    """
+    global _counter
+    if _counter is None:
+        with _counter_lock:
+            if _counter is None:
+                try:
+                    counter = _load_tokenizer(THEME_TOKENIZER)
+                except Exception as e:
+                    print(f"Error loading tokenizer {THEME_TOKENIZER}, using the approximation: {e}")
+                    counter = approximate_token_count
+                _counter = counter if counter is approximate_token_count else lru_cache(maxsize=65536)(counter)
+    return _counter
+
+
+def count_tokens(text: str) -> int:
+    return get_token_counter()(text)
+
+
+def get_batch_budget(prompt: str, max_output_tokens: int, context_tokens: int = None) -> int:
+    """
+    Tokens of input that fit next to prompt and a reply of max_output_tokens in the context
+    window, less the safety margin.
+    """
+    context_tokens = context_tokens or THEME_CONTEXT_TOKENS
+    available = context_tokens - count_tokens(prompt) - max_output_tokens
+    return max(1, int(available * (1 - THEME_TOKEN_MARGIN)))
+
+
+def split_text(text: str, token_limit: int) -> list[str]:
+    """
+    Splits text into pieces of at most token_limit tokens, between sentences where possible and
+    otherwise between words. Each sentence, or each word of a sentence over the limit on its own,
+    is counted once and the pieces are packed by running total.
+    """
+    if count_tokens(text) <= token_limit:
+        return [text]
+    counter = get_token_counter()
+    # Parts are counted uncached so they do not push the reviews out of the cache
+    counter = getattr(counter, "__wrapped__", counter)
+    pieces = []
+    current = []
+    current_tokens = 0
+    for sentence in SENTENCE_END_PATTERN.split(text.strip()):
+        sentence_tokens = counter(sentence)
+        if sentence_tokens <= token_limit:
+            parts = [(sentence, sentence_tokens)]
+        else:
+            parts = [(word, counter(word)) for word in sentence.split()]
+        for part, part_tokens in parts:
+            if current and current_tokens + part_tokens > token_limit:
+                pieces.append(" ".join(current))
+                current = []
+                current_tokens = 0
+            current.append(part)
+            current_tokens += part_tokens
+    if current:
+        pieces.append(" ".join(current))
+    return pieces
+
+
+def select_reviews(reviews_list: list[str], max_tokens: int = None) -> list[str]:
+    """
+    Drops reviews that repeat an earlier one apart from case, punctuation and spacing, then, when
+    the rest exceed max_tokens, keeps a random sample of them that fits. The sample is seeded by
+    the reviews themselves, so the same partition always yields the same selection and its
+    stored themes stay reusable. Applied per (sentiment, month) partition, the sample keeps
+    every sentiment and month represented.
+    """
+    max_tokens = THEME_SAMPLE_MAX_TOKENS if max_tokens is None else max_tokens
+    seen = set()
+    unique = []
+    for review in reviews_list:
+        key = get_dedupe_key(review)
+        if key not in seen:
+            seen.add(key)
+            unique.append(review)
+
+    if not max_tokens or sum(count_tokens(review) for review in unique) <= max_tokens:
+        return unique
+
+    digest = hashlib.sha256("\0".join(unique).encode("utf-8")).digest()
+    order = list(range(len(unique)))
+    random.Random(digest).shuffle(order)
+    chosen = []
+    total = 0
+    for position in order:
+        tokens = count_tokens(unique[position])
+        if total + tokens > max_tokens:
+            continue
+        chosen.append(position)
+        total += tokens
+    return [unique[position] for position in sorted(chosen)]
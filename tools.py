@@ -1,141 +1,181 @@
 import pandas as pd
-import matplotlib.pyplot as plt
-from groq import Groq
 from dotenv import load_dotenv
+from concurrent.futures import ThreadPoolExecutor
 import os
+import random
 import re
-from reportlab.lib.pagesizes import letter
-from reportlab.lib.styles import getSampleStyleSheet
-from reportlab.platypus import SimpleDocTemplate, Paragraph,Spacer
-from reportlab.lib.enums import TA_CENTER
+import threading
+import time
+from charts import CHART_PREFIXES, get_sentiment_charts, get_total_counts, render_chart, save_png
+from llm_cache import get_llm_cache, make_cache_key
+from theme_store import get_reviews_digest, get_theme_store
+from token_budget import count_tokens, get_batch_budget, select_reviews, split_text
+from tracing import bind_context, span, traced
+from local_classifier import classify_locally
+from report_pdf import get_pdf_exporter
 
 load_dotenv()
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
-client = Groq(api_key=GROQ_API_KEY)
 
+SENTIMENT_LABELS = ['Positive', 'Negative', 'Neutral']
+NUMBERED_LABEL_PATTERN = re.compile(r'^\W*(\d+)\s*[:.)\-]\W*(positive|negative|neutral)\b', re.IGNORECASE | re.MULTILINE)
 
-def save_report_as_pdf(report_text: str, filename: str):
+THEME_MAX_CONCURRENCY = int(os.getenv("THEME_MAX_CONCURRENCY", "4"))
+THEME_REDUCE_FAN_IN = int(os.getenv("THEME_REDUCE_FAN_IN", "4"))
+THEME_REDUCE_MAX_LEVELS = int(os.getenv("THEME_REDUCE_MAX_LEVELS", "5"))
+# Outlet reports generated at once by generate_outlet_reports
+OUTLET_REPORT_MAX_CONCURRENCY = int(os.getenv("OUTLET_REPORT_MAX_CONCURRENCY", "4"))
+# Groq requests in flight at once across all threads, however the work above them is split up
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", str(THEME_MAX_CONCURRENCY)))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "5"))
+LLM_BACKOFF_SECONDS = float(os.getenv("LLM_BACKOFF_SECONDS", "1.0"))
+THEME_SUMMARY_MAX_TOKENS = 500
+THEME_SUMMARY_PROMPT = (
+    "You are a sentiment analysis assistant. Summarize the top 3-5 recurring themes "
+    "or topics from the following list of {sentiment_type} restaurant reviews. "
+    "List the themes concisely in a bulleted list. Do not add any extra commentary."
+)
+# Chart types whose already-rendered images are appended to report PDFs, e.g. "line,pie"
+REPORT_PDF_CHARTS = [chart_type for chart_type in os.getenv("REPORT_PDF_CHARTS", "").split(",") if chart_type]
+
+_client = None
+_client_lock = threading.Lock()
+_llm_slots = threading.BoundedSemaphore(LLM_MAX_CONCURRENCY)
+
+
+def get_client():
+    """
+    Groq client, created on first use so that importing this module stays cheap and requests
+    answered without the LLM never load the groq package.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                from groq import Groq
+                _client = Groq(api_key=GROQ_API_KEY)
+    return _client
+
+
+def get_retry_delay(error: Exception, attempt: int) -> float:
     """
-    Saves the given report text to a well-formatted PDF file.
+    Uses the server's retry-after hint when present, otherwise exponential backoff with jitter.
     """
+    response = getattr(error, "response", None)
+    retry_after = response.headers.get("retry-after") if response is not None else None
     try:
-        doc = SimpleDocTemplate(filename, pagesize=letter)
-        styles = getSampleStyleSheet()
-        story = []
-
-        styles['Heading1'].alignment = TA_CENTER
-        styles['Heading1'].spaceAfter = 12
-        styles['Normal'].spaceAfter = 6
-        styles['BodyText'].fontName = 'Helvetica'
-        
-        story.append(Paragraph("Strategic Recommendations Report", styles['Heading1']))
-        story.append(Spacer(1, 12))
-
-        for line in report_text.split('\n'):
-            line = line.strip()
-            if not line:
-                continue
+        return float(retry_after)
+    except (TypeError, ValueError):
+        return LLM_BACKOFF_SECONDS * (2 ** attempt) + random.uniform(0, LLM_BACKOFF_SECONDS)
 
-            line = re.sub(r'\*\*(.*?)\*\*', r'<b>\1</b>', line) 
 
-            if line.endswith(':'):
-                story.append(Paragraph(f"<b>{line}</b>", styles['Normal']))
-            elif re.match(r'^\d+\.\s', line): 
-                story.append(Paragraph(f"{line}", styles['Normal']))
-            elif line.startswith('- ') or line.startswith('* '):
-                story.append(Paragraph(f"• {line[2:]}", styles['Normal']))
-            else:
-                story.append(Paragraph(line, styles['Normal']))
-                
-        doc.build(story)
-        print(f"Report successfully saved to {filename}")
-    except Exception as e:
-        print(f"Error saving report to PDF file: {e}")
+@traced()
+def create_chat_completion(**kwargs):
+    """
+    Calls the chat completions API, backing off and retrying when rate limited. At most
+    LLM_MAX_CONCURRENCY calls are sent at once, however many thread pools are asking; a call
+    gives up its slot while it waits to retry.
+    """
+    from groq import RateLimitError
+
+    client = get_client()
+    for attempt in range(LLM_MAX_RETRIES + 1):
+        try:
+            with _llm_slots:
+                return client.chat.completions.create(**kwargs)
+        except RateLimitError as e:
+            if attempt == LLM_MAX_RETRIES:
+                raise
+            delay = get_retry_delay(e, attempt)
+            print(f"Groq API rate limit hit, retrying in {delay:.1f}s")
+            time.sleep(delay)
+
 
+def get_chat_content(**kwargs) -> str:
+    """
+    Returns the text of a chat completion, served from the on-disk LLM cache when the same
+    model, messages and parameters were seen before.
+    """
+    with span("llm.chat", **{"llm.model": kwargs.get("model")}) as llm_span:
+        cache = get_llm_cache()
+        key = make_cache_key(**kwargs)
+        if cache is not None:
+            content = cache.get(key)
+            if content is not None:
+                llm_span.set("llm.cache_hits", 1)
+                return content
 
+        completion = create_chat_completion(**kwargs)
+        llm_span.set("llm.calls", 1)
+        usage = getattr(completion, "usage", None)
+        if usage is not None:
+            llm_span.set("llm.prompt_tokens", usage.prompt_tokens)
+            llm_span.set("llm.completion_tokens", usage.completion_tokens)
+        content = completion.choices[0].message.content.strip()
+        if cache is not None:
+            cache.set(key, content)
+        return content
 
 
+@traced()
 def get_sentiment_counts_by_date(reviews_df: pd.DataFrame):
     """
     Groups reviews by date and counts the number of positive, negative,
     and neutral sentiments for each day.
+    Tables already aggregated by ReviewDatabase.get_sentiment_counts_by_date are returned as is.
     """
-    sentiment_counts = reviews_df.groupby([reviews_df['Review Date'].dt.date, 'Sentiment']).size().unstack(fill_value=0)
+    if 'Review Date' not in reviews_df.columns:
+        return reviews_df
+    sentiment_counts = reviews_df.groupby([reviews_df['Review Date'].dt.date, 'Sentiment'], observed=True).size().unstack(fill_value=0)
     return sentiment_counts
 
+@traced()
 def get_total_sentiment_counts(reviews_df: pd.DataFrame):
     """
     Calculates the total count for each sentiment category across all reviews.
+    Also accepts a date x sentiment count table, which is summed in O(dates).
     """
+    if 'Review Date' not in reviews_df.columns:
+        return get_total_counts(reviews_df)
     return reviews_df['Sentiment'].value_counts()
 
-def plot_stacked_bar_chart(reviews_df: pd.DataFrame, file_name: str = "sentiment_stacked_bar.png"):
+@traced()
+def plot_stacked_bar_chart(reviews_df: pd.DataFrame, file_name: str = None):
     """
     Generates a stacked bar chart showing sentiment distribution over time.
     """
-    sentiment_counts = get_sentiment_counts_by_date(reviews_df)
-    sentiment_counts.plot(kind='bar', stacked=True, figsize=(12, 6))
-    plt.title('Sentiment Trends Over Time (Stacked Bar Chart)')
-    plt.xlabel('Date')
-    plt.ylabel('Number of Reviews')
-    plt.legend(title='Sentiment')
-    plt.xticks(rotation=45)
-    plt.tight_layout()
-    plt.savefig(file_name)
-    plt.close()
-    return f"Plot saved to {file_name}"
+    return save_png(render_chart(get_sentiment_counts_by_date(reviews_df), "stacked_bar"), file_name, CHART_PREFIXES["stacked_bar"])
 
-def plot_line_chart(reviews_df: pd.DataFrame, file_name: str = "sentiment_line_chart.png"):
+@traced()
+def plot_line_chart(reviews_df: pd.DataFrame, file_name: str = None):
     """
     Generates a line chart to show sentiment trends over time.
     """
-    sentiment_counts = get_sentiment_counts_by_date(reviews_df)
-    sentiment_counts.plot(kind='line', figsize=(12, 6), marker='o')
-    plt.title('Sentiment Trends Over Time (Line Chart)')
-    plt.xlabel('Date')
-    plt.ylabel('Number of Reviews')
-    plt.legend(title='Sentiment')
-    plt.xticks(rotation=45)
-    plt.grid(True)
-    plt.tight_layout()
-    plt.savefig(file_name)
-    plt.close()
-    return f"Plot saved to {file_name}"
-
-def plot_pie_chart(reviews_df: pd.DataFrame, file_name: str = "sentiment_pie_chart.png"):
+    return save_png(render_chart(get_sentiment_counts_by_date(reviews_df), "line"), file_name, CHART_PREFIXES["line"])
+
+@traced()
+def plot_pie_chart(reviews_df: pd.DataFrame, file_name: str = None):
     """
     Generates a pie chart showing the overall sentiment distribution.
     """
-    total_counts = get_total_sentiment_counts(reviews_df)
-    plt.figure(figsize=(8, 8))
-    plt.pie(total_counts, labels=total_counts.index, autopct='%1.1f%%', startangle=90, colors=['green', 'red', 'gray'])
-    plt.title('Overall Sentiment Distribution')
-    plt.axis('equal') 
-    plt.savefig(file_name)
-    plt.close()
-    return f"Plot saved to {file_name}"
+    return save_png(render_chart(get_sentiment_counts_by_date(reviews_df), "pie"), file_name, CHART_PREFIXES["pie"])
 
-def plot_simple_bar_chart(reviews_df: pd.DataFrame, file_name: str = "sentiment_simple_bar.png"):
+@traced()
+def plot_simple_bar_chart(reviews_df: pd.DataFrame, file_name: str = None):
     """
     Generates a simple bar chart comparing total sentiment counts.
     """
-    total_counts = get_total_sentiment_counts(reviews_df)
-    plt.figure(figsize=(10, 6))
-    total_counts.plot(kind='bar', color=['green', 'red', 'gray'])
-    plt.title('Total Sentiment Count')
-    plt.xlabel('Sentiment')
-    plt.ylabel('Number of Reviews')
-    plt.xticks(rotation=0)
-    plt.tight_layout()
-    plt.savefig(file_name)
-    plt.close()
-    return f"Plot saved to {file_name}"
+    return save_png(render_chart(get_sentiment_counts_by_date(reviews_df), "simple_bar"), file_name, CHART_PREFIXES["simple_bar"])
 
 
 
+@traced()
 def analyze_sentiment(review_text:str)->str:
+    sentiment = classify_locally(review_text)
+    if sentiment is not None:
+        return sentiment
     try:
-        chat_completion = client.chat.completions.create(
+        sentiment = get_chat_content(
             messages=[
                 {
                     "role": "system",
@@ -150,8 +190,7 @@ def analyze_sentiment(review_text:str)->str:
             temperature=0,
             max_tokens=10,
         )
-        sentiment = chat_completion.choices[0].message.content.strip()
-        if sentiment in ['Positive', 'Negative', 'Neutral']:
+        if sentiment in SENTIMENT_LABELS:
             return sentiment
         else:
             return "Neutral"
@@ -160,85 +199,294 @@ def analyze_sentiment(review_text:str)->str:
         return "Neutral"
     
 
+@traced()
+def parse_numbered_labels(content: str, count: int) -> list:
+    """
+    Reads '<number>: <label>' lines from an LLM answer. Labels are normalized to
+    'Positive'/'Negative'/'Neutral'; missing, duplicate or out-of-range numbers are left as None.
+    """
+    labels = [None] * count
+    for match in NUMBERED_LABEL_PATTERN.finditer(content):
+        number = int(match.group(1))
+        if 1 <= number <= count and labels[number - 1] is None:
+            labels[number - 1] = match.group(2).capitalize()
+    return labels
+
+@traced()
+def classify_reviews_with_llm(reviews_list: list[str]) -> list:
+    """
+    Classifies a batch of reviews in a single LLM call using a numbered prompt.
+    Returns one label per review, or None where no valid label came back.
+    """
+    numbered_reviews = "\n".join(f"{i}. {' '.join(review.split())}" for i, review in enumerate(reviews_list, 1))
+    try:
+        content = get_chat_content(
+            messages=[
+                {
+                    "role": "system",
+                    "content": (
+                        "You are a sentiment analysis expert. Classify the sentiment of each numbered restaurant review "
+                        "below as 'Positive', 'Negative', or 'Neutral'. Answer with exactly one line per review in the "
+                        "form '<number>: <label>', in the same order. Do not add any other text."
+                    ),
+                },
+                {"role": "user", "content": numbered_reviews},
+            ],
+            model="llama-3.1-8b-instant",
+            temperature=0,
+            max_tokens=8 * len(reviews_list) + 16,
+        )
+    except Exception as e:
+        print(f"Error calling Groq API for bulk sentiment analysis: {e}")
+        return [None] * len(reviews_list)
+    return parse_numbered_labels(content, len(reviews_list))
+
+@traced()
 def summarize_themes_with_llm(text: str, sentiment_type: str) -> str:
     """
     Internal helper function to call the LLM for theme summarization.
     """
     try:
-        prompt = (
-            f"You are a sentiment analysis assistant. Summarize the top 3-5 recurring themes "
-            f"or topics from the following list of {sentiment_type} restaurant reviews. "
-            "List the themes concisely in a bulleted list. Do not add any extra commentary."
-        )
-            
-        chat_completion = client.chat.completions.create(
+        return get_chat_content(
             messages=[
-                {"role": "system", "content": prompt},
+                {"role": "system", "content": THEME_SUMMARY_PROMPT.format(sentiment_type=sentiment_type)},
                 {"role": "user", "content": text},
             ],
             model="llama-3.1-8b-instant",
             temperature=0.3,
-            max_tokens=500,
+            max_tokens=THEME_SUMMARY_MAX_TOKENS,
         )
-        return chat_completion.choices[0].message.content.strip()
     except Exception as e:
         print(f"Error calling Groq API for theme summarization: {e}")
         return "An error occurred while summarizing themes."
 
-def get_top_themes(reviews_list: list[str], sentiment_type: str) -> str:
+def get_theme_batch_limit() -> int:
     """
-    Identifies and summarizes the most common themes from a list of reviews of a specific sentiment.
-    This function handles large numbers of reviews by processing them in batches.
+    Review tokens per theme summary call: what fits in the model context next to the summary
+    prompt and its reply.
     """
-    all_themes = []
+    return get_batch_budget(THEME_SUMMARY_PROMPT.format(sentiment_type="Negative"), THEME_SUMMARY_MAX_TOKENS)
+
+@traced()
+def batch_reviews(reviews_list: list[str], token_limit: int = None) -> list[str]:
+    """
+    Packs reviews into newline-joined batches of at most token_limit tokens each, by default
+    as many as fit in one theme summary call. A review longer than that is split across batches.
+    """
+    token_limit = token_limit or get_theme_batch_limit()
+    batches = []
     current_batch = []
     current_token_count = 0
-    BATCH_TOKEN_LIMIT = 1000
-    
+
     for review in reviews_list:
-        review_tokens = len(review.split())
-        
-        if current_token_count + review_tokens > BATCH_TOKEN_LIMIT:
-            batch_text = "\n".join(current_batch)
-            themes = summarize_themes_with_llm(batch_text, sentiment_type)
-            all_themes.append(themes)
-            
-            current_batch = [review]
-            current_token_count = review_tokens
-        else:
-            current_batch.append(review)
-            current_token_count += review_tokens
-            
+        for piece in split_text(review, token_limit - 1):
+            # +1 for the newline joining it to the batch
+            review_tokens = count_tokens(piece) + 1
+
+            if current_batch and current_token_count + review_tokens > token_limit:
+                batches.append("\n".join(current_batch))
+                current_batch = [piece]
+                current_token_count = review_tokens
+            else:
+                current_batch.append(piece)
+                current_token_count += review_tokens
+
     if current_batch:
-        batch_text = "\n".join(current_batch)
-        themes = summarize_themes_with_llm(batch_text, sentiment_type)
-        all_themes.append(themes)
-    
-    return "\n".join(all_themes)
+        batches.append("\n".join(current_batch))
+    return batches
 
+@traced()
+def get_theme_batches(reviews_list: list[str]) -> list[str]:
+    """
+    Batches for summarizing one partition of reviews: near-duplicate reviews are dropped and,
+    with THEME_SAMPLE_MAX_TOKENS set, large partitions are sampled before packing.
+    """
+    return batch_reviews(select_reviews(reviews_list))
+
+@traced()
+def map_concurrently(func, args_list: list[tuple], max_workers: int = None) -> list:
+    """
+    Calls func(*args) for every tuple in args_list, running up to max_workers calls at once.
+    Results are returned in the same order as args_list.
+    """
+    max_workers = max_workers or THEME_MAX_CONCURRENCY
+    if max_workers <= 1 or len(args_list) <= 1:
+        return [func(*args) for args in args_list]
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(args_list))) as executor:
+        return list(executor.map(bind_context(lambda args: func(*args)), args_list))
+
+@traced()
+def summarize_batches(batches: list[tuple[str, str]], max_workers: int = None) -> list[str]:
+    """
+    Summarizes (batch_text, sentiment_type) pairs, running up to max_workers LLM calls at once.
+    Results are returned in the same order as the batches.
+    """
+    return map_concurrently(summarize_themes_with_llm, batches, max_workers)
+
+@traced()
+def merge_themes_with_llm(theme_lists: list[str], sentiment_type: str) -> str:
+    """
+    Internal helper function to merge several theme lists into one with the LLM.
+    """
+    try:
+        prompt = (
+            f"You are a sentiment analysis assistant. Below are several bulleted lists of recurring themes, "
+            f"each summarizing a different batch of {sentiment_type} restaurant reviews. Merge them into a single "
+            "list of the top 3-5 themes overall, combining duplicates and keeping the most frequent ones. "
+            "List the themes concisely in a bulleted list. Do not add any extra commentary."
+        )
+
+        return get_chat_content(
+            messages=[
+                {"role": "system", "content": prompt},
+                {"role": "user", "content": "\n\n".join(theme_lists)},
+            ],
+            model="llama-3.1-8b-instant",
+            temperature=0.3,
+            max_tokens=500,
+        )
+    except Exception as e:
+        print(f"Error calling Groq API for theme merging: {e}")
+        return "\n".join(theme_lists)
+
+@traced()
+def reduce_themes(themes_by_key: dict, fan_in: int = None, max_levels: int = None,
+                  max_workers: int = None, sentiment_types: dict = None) -> dict:
+    """
+    Tree-reduces each key's per-batch theme lists into one compact list. Each level merges
+    groups of up to fan_in lists; the last allowed level merges whatever is left in a single call,
+    so the final prompt stays bounded by fan_in lists for up to fan_in ** max_levels batches.
+    Keys are sentiment types unless sentiment_types maps them to one.
+    """
+    fan_in = max(2, fan_in or THEME_REDUCE_FAN_IN)
+    max_levels = THEME_REDUCE_MAX_LEVELS if max_levels is None else max_levels
+    sentiment_types = sentiment_types or {key: key for key in themes_by_key}
+    themes_by_key = {key: list(themes) for key, themes in themes_by_key.items()}
+
+    for level in range(max_levels):
+        group_size = fan_in if level < max_levels - 1 else None
+        merges = []
+        for key, themes in themes_by_key.items():
+            if len(themes) <= 1:
+                continue
+            size = group_size or len(themes)
+            for i in range(0, len(themes), size):
+                merges.append((key, themes[i:i + size]))
+        if not merges:
+            break
+
+        merged = map_concurrently(
+            lambda key, group: group[0] if len(group) == 1 else merge_themes_with_llm(group, sentiment_types[key]),
+            merges,
+            max_workers,
+        )
+        for key, _ in merges:
+            themes_by_key[key] = []
+        for (key, _), themes in zip(merges, merged):
+            themes_by_key[key].append(themes)
+
+    return {key: "\n".join(themes) for key, themes in themes_by_key.items()}
+
+@traced()
+def summarize_partitions(partitions: dict, max_workers: int = None) -> dict:
+    """
+    Summarizes the themes of several review partitions at once. partitions maps any key to a
+    (sentiment_type, reviews_list) pair; every batch of every partition is fanned out together
+    so they share the same concurrency limit, then each partition is tree-reduced to one list.
+    """
+    batches = [
+        (key, batch_text, sentiment_type)
+        for key, (sentiment_type, reviews_list) in partitions.items()
+        for batch_text in get_theme_batches(reviews_list)
+    ]
+    summaries = summarize_batches([(batch_text, sentiment_type) for _, batch_text, sentiment_type in batches], max_workers)
+
+    themes = {key: [] for key in partitions}
+    for (key, _, _), summary in zip(batches, summaries):
+        themes[key].append(summary)
+    sentiment_types = {key: sentiment_type for key, (sentiment_type, _) in partitions.items()}
+    return reduce_themes(themes, max_workers=max_workers, sentiment_types=sentiment_types)
+
+@traced()
+def get_top_themes(reviews_list: list[str], sentiment_type: str, max_workers: int = None) -> str:
+    """
+    Identifies and summarizes the most common themes from a list of reviews of a specific sentiment.
+    This function handles large numbers of reviews by processing them in batches.
+    """
+    return get_top_themes_by_sentiment({sentiment_type: reviews_list}, max_workers)[sentiment_type]
+
+@traced()
+def get_top_themes_by_sentiment(reviews_by_sentiment: dict[str, list[str]], max_workers: int = None) -> dict[str, str]:
+    """
+    Summarizes the themes for several sentiments at once, one compact list per sentiment.
+    """
+    partitions = {sentiment_type: (sentiment_type, reviews_list) for sentiment_type, reviews_list in reviews_by_sentiment.items()}
+    return summarize_partitions(partitions, max_workers)
+
+@traced()
+def get_themes_for_range(database: object, sentiment_types: list[str], start_date: pd.Timestamp,
+                         end_date: pd.Timestamp, max_workers: int = None) -> dict[str, str]:
+    """
+    Summarizes each sentiment's themes over a date range from per-month partial summaries.
+    Month summaries are kept in the theme store, so only months whose reviews have not been
+    summarized before cost new LLM calls; the stored partials are then merged per sentiment.
+    A ReviewPartition's months are stored under its key, apart from those of the whole database.
+    """
+    store = get_theme_store()
+    outlet = getattr(database, "key", "")
+    month_starts = database.get_months(start_date, end_date)
+
+    partitions = {}
+    monthly_themes = {}
+    for sentiment_type in sentiment_types:
+        for month_start in month_starts:
+            month_end = month_start + pd.DateOffset(months=1) - pd.Timedelta(1)
+            reviews_list = database.get_reviews_by_sentiment(sentiment_type, max(month_start, start_date), min(month_end, end_date))['Review'].tolist()
+            if not reviews_list:
+                continue
+            key = (sentiment_type, month_start, get_reviews_digest(reviews_list))
+            themes = store.get(*key, outlet=outlet) if store is not None else None
+            if themes is None:
+                partitions[key] = (sentiment_type, reviews_list)
+            else:
+                monthly_themes[key] = themes
+
+    new_themes = summarize_partitions(partitions, max_workers)
+    for key, themes in new_themes.items():
+        if store is not None:
+            store.set(*key, themes, outlet=outlet)
+    monthly_themes.update(new_themes)
+
+    themes_by_sentiment = {sentiment_type: [] for sentiment_type in sentiment_types}
+    for (sentiment_type, _, _), themes in sorted(monthly_themes.items(), key=lambda item: item[0][1]):
+        themes_by_sentiment[sentiment_type].append(themes)
+    return reduce_themes(themes_by_sentiment, max_workers=max_workers)
+
+@traced()
 def generate_recommendations_report(database: object, start_date: pd.Timestamp, end_date: pd.Timestamp) -> str:
     """
     Generates a full strategic report for a given date range by performing all necessary steps.
+    database may be a ReviewPartition, for the report of a single restaurant or country.
     """
-    all_reviews = database.get_reviews(start_date, end_date)
+    sentiment_counts_df = database.get_sentiment_counts_by_date(start_date, end_date)
+    outlet = getattr(database, "label", None)
 
-    if all_reviews.empty:
+    if sentiment_counts_df.empty:
+        if outlet:
+            return f"No reviews found for {outlet} in the specified date range. Please try a different range or outlet."
         return "No reviews found for the specified date range. Please try a different range."
 
-    sentiment_counts_df = all_reviews.groupby(all_reviews['Review Date'].dt.date)['Sentiment'].value_counts().unstack(fill_value=0)
-
-    positive_reviews = all_reviews[all_reviews['Sentiment'].str.lower() == 'positive']['Review'].tolist()
-    negative_reviews = all_reviews[all_reviews['Sentiment'].str.lower() == 'negative']['Review'].tolist()
-
-    positive_themes = get_top_themes(positive_reviews, 'Positive')
+    themes = get_themes_for_range(database, ['Positive', 'Negative'], start_date, end_date)
+    positive_themes = themes['Positive']
     #print(f"Positive Themes:\n{positive_themes}\n")
-    negative_themes = get_top_themes(negative_reviews, 'Negative')
+    negative_themes = themes['Negative']
     #print(f"Negative Themes:\n{negative_themes}\n")
 
     data_summary = sentiment_counts_df.to_string()
     
     try:
-        chat_completion = client.chat.completions.create(
+        report = get_chat_content(
             messages=[
                 {
                     "role": "system",
@@ -253,6 +501,7 @@ def generate_recommendations_report(database: object, start_date: pd.Timestamp,
                 {
                     "role": "user",
                     "content": (
+                        (f"Outlet: {outlet}\n\n" if outlet else "") +
                         f"Here is the sentiment data:\n\n{data_summary}\n\n"
                         f"Key Positive Themes:\n{positive_themes}\n\n"
                         f"Key Negative Themes:\n{negative_themes}"
@@ -263,9 +512,26 @@ def generate_recommendations_report(database: object, start_date: pd.Timestamp,
             temperature=0.5,
             max_tokens=5000,
         )
-        report = chat_completion.choices[0].message.content.strip()
-        save_report_as_pdf(report, "report.pdf")
-        return report
+        charts = get_sentiment_charts(database, REPORT_PDF_CHARTS, start_date, end_date, cached_only=True)
+        job = get_pdf_exporter().submit(report, [charts[chart_type] for chart_type in REPORT_PDF_CHARTS if chart_type in charts])
+        # The PDF is rendered in the background, but its path is known already
+        return f"{report}\n\nPDF: {job.path}"
     except Exception as e:
         print(f"Error calling Groq API for recommendations: {e}")
-        return "An error occurred while generating recommendations."
\ No newline at end of file
+        return "An error occurred while generating recommendations."
+
+@traced()
+def generate_outlet_reports(database: object, start_date: pd.Timestamp, end_date: pd.Timestamp,
+                            outlets: list[tuple[str, str]] = None, max_workers: int = None) -> dict[tuple[str, str], str]:
+    """
+    Generates the report of each (country, restaurant) outlet, every outlet in the database by
+    default, running up to max_workers reports at once. Each report reads only its outlet's
+    partition. Returns the reports keyed by outlet.
+    """
+    outlets = database.get_outlets() if outlets is None else outlets
+    partitions = [(database.get_partition(country, restaurant),) for country, restaurant in outlets]
+    reports = map_concurrently(
+        lambda partition: generate_recommendations_report(partition, start_date, end_date),
+        partitions, max_workers or OUTLET_REPORT_MAX_CONCURRENCY,
+    )
+    return dict(zip(outlets, reports))
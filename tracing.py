@@ -0,0 +1,246 @@
+import contextvars
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+
+TRACE_ENABLED = os.getenv("TRACE_ENABLED", "0") == "1"
+# Finished traces are appended here as OTLP/JSON lines, one line per export; empty to skip the file
+TRACE_FILE = os.getenv("TRACE_FILE", "traces.jsonl")
+TRACE_PRINT = os.getenv("TRACE_PRINT", "1") != "0"
+TRACE_SERVICE_NAME = os.getenv("TRACE_SERVICE_NAME", "review-agents")
+
+_enabled = TRACE_ENABLED
+_current_span = contextvars.ContextVar("current_span", default=None)
+# Spans of traces whose root has not finished yet, by trace id
+_traces = {}
+_lock = threading.Lock()
+
+
+class Span:
+    """
+    One timed operation. Spans started while another is current become its children and share
+    its trace; a span without a parent is the root of a new trace, which is exported when it ends.
+    """
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "start_ns", "end_ns", "attributes", "error", "_previous")
+
+    def __init__(self, name: str, attributes: dict = None):
+        parent = _current_span.get()
+        self.name = name
+        self.span_id = os.urandom(8).hex()
+        self.trace_id = parent.trace_id if parent is not None else os.urandom(16).hex()
+        self.parent_id = parent.span_id if parent is not None else None
+        self.attributes = dict(attributes or {})
+        self.error = None
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self._previous = parent
+        if parent is None:
+            with _lock:
+                _traces[self.trace_id] = []
+
+    def set(self, key: str, value):
+        self.attributes[key] = value
+
+    def add(self, key: str, amount=1):
+        self.attributes[key] = self.attributes.get(key, 0) + amount
+
+    @property
+    def duration_ms(self) -> float:
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e6
+
+    def __enter__(self):
+        _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        # set() rather than reset(): async generators may close the span from another context
+        _current_span.set(self._previous)
+        if exc is not None:
+            self.error = f"{exc_type.__name__}: {exc}"
+        self.end()
+        return False
+
+    def end(self):
+        self.end_ns = time.time_ns()
+        with _lock:
+            spans = _traces.get(self.trace_id)
+            if spans is not None:
+                spans.append(self)
+            if self.parent_id is None:
+                spans = _traces.pop(self.trace_id, [self])
+        if spans is None:
+            # The request already finished (e.g. a background PDF export); export the span on its own
+            export_spans([self])
+        elif self.parent_id is None:
+            export_spans(spans)
+            if TRACE_PRINT:
+                print(format_breakdown(spans))
+
+
+class _NoSpan:
+    """
+    Stands in for Span while tracing is disabled, so instrumented code needs no checks of its own.
+    """
+    def set(self, key, value):
+        pass
+
+    def add(self, key, amount=1):
+        pass
+
+    def end(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        return False
+
+
+NO_SPAN = _NoSpan()
+
+
+def enable_tracing(enabled: bool = True):
+    global _enabled
+    _enabled = enabled
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+def span(name: str, **attributes):
+    """
+    Context manager timing a block as a child of the current span.
+    """
+    return Span(name, attributes) if _enabled else NO_SPAN
+
+
+def current_span():
+    """
+    The innermost open span, for adding attributes from deeper code; a no-op span when there is none.
+    """
+    return (_current_span.get() or NO_SPAN) if _enabled else NO_SPAN
+
+
+def traced(name: str = None):
+    """
+    Decorator timing every call of a function as a span named after its module and qualified name.
+    Disabled tracing costs one flag check per call.
+    """
+    def decorator(func):
+        span_name = name or f"{func.__module__}.{func.__qualname__}"
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                if not _enabled:
+                    return await func(*args, **kwargs)
+                with Span(span_name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            with Span(span_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def bind_context(func):
+    """
+    Wraps func so it runs in a copy of the caller's context, for handing work to thread pools
+    whose spans should stay children of the caller's span.
+    """
+    if not _enabled:
+        return func
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.copy().run(func, *args, **kwargs)
+
+
+def _otlp_value(value) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def to_otlp(spans: list) -> dict:
+    """
+    Formats spans as an OpenTelemetry OTLP/JSON ExportTraceServiceRequest.
+    """
+    return {"resourceSpans": [{
+        "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": TRACE_SERVICE_NAME}}]},
+        "scopeSpans": [{
+            "scope": {"name": "tracing"},
+            "spans": [{
+                "traceId": span.trace_id,
+                "spanId": span.span_id,
+                "parentSpanId": span.parent_id or "",
+                "name": span.name,
+                "kind": 1,
+                "startTimeUnixNano": str(span.start_ns),
+                "endTimeUnixNano": str(span.end_ns),
+                "attributes": [{"key": key, "value": _otlp_value(value)} for key, value in span.attributes.items()],
+                "status": {"code": 2, "message": span.error} if span.error else {"code": 1},
+            } for span in spans],
+        }],
+    }]}
+
+
+def export_spans(spans: list, path: str = None):
+    path = TRACE_FILE if path is None else path
+    if not path:
+        return
+    try:
+        line = json.dumps(to_otlp(spans)) + "\n"
+        with _lock, open(path, "a", encoding="utf-8") as file:
+            file.write(line)
+    except Exception as e:
+        print(f"Error exporting trace: {e}")
+
+
+def format_breakdown(spans: list) -> str:
+    """
+    Renders one trace as an indented tree of span durations. Sibling spans with the same name are
+    folded into one line with their count, total and slowest time; LLM token and cache counts are
+    summed at the end.
+    """
+    children = {}
+    for span in spans:
+        children.setdefault(span.parent_id, []).append(span)
+    lines = []
+
+    def render(group: list, depth: int):
+        by_name = {}
+        for span in sorted(group, key=lambda span: span.start_ns):
+            by_name.setdefault(span.name, []).append(span)
+        for name, same in by_name.items():
+            total = sum(span.duration_ms for span in same)
+            label = f"{name} {total:.1f} ms"
+            if len(same) > 1:
+                label = f"{name} x{len(same)} {total:.1f} ms (max {max(span.duration_ms for span in same):.1f} ms)"
+            if any(span.error for span in same):
+                label += " [error]"
+            lines.append("  " * depth + label)
+            render([child for span in same for child in children.get(span.span_id, [])], depth + 1)
+
+    render(children.get(None, []) or [min(spans, key=lambda span: span.start_ns)], 0)
+    totals = {}
+    for span in spans:
+        for key in ("llm.calls", "llm.cache_hits", "llm.prompt_tokens", "llm.completion_tokens"):
+            if key in span.attributes:
+                totals[key] = totals.get(key, 0) + span.attributes[key]
+    if totals:
+        lines.append("  " + ", ".join(f"{key.split('.', 1)[1]}: {value}" for key, value in totals.items()))
+    return "\n".join(lines)
+